@@ -1,8 +1,11 @@
 import csv
+import datetime
+import importlib
 import os
 
 from re_forecast.data.utils import create_csv_path, create_csv_path_units_names
 from re_forecast.data.manage_data_storage import fill_register
+from re_forecast.params import UPDATE_QUALITY_STATES_ON_STORE, INPUT_DATETIME_FORMAT, RESSOURCES_DATA_POINT_TIME_SPAN
 
 def write_csv(data: list, csv_path: str) -> None:
     """Write csv with the function csv.Dictwriter
@@ -67,12 +70,15 @@ def store_to_csv(data: list,
                  eic_code: str | None,
                  production_type: str | None,
                  production_subtype: str | None,
-                 store_units_names = False
+                 store_units_names = False,
+                 update_quality_states = UPDATE_QUALITY_STATES_ON_STORE
                  ) -> None:
     """Store the format data into a csv, using the create_csv_path
     function and the write_csv function.
     If you set 'store_units_names' to true, the function will create
-    a special path name to store the list of units names."""
+    a special path name to store the list of units names.
+    If you set 'update_quality_states' to true, the running quality states
+    of the units are updated with the newly stored data only."""
 
     # Error handling: assure that data is a list
     if isinstance(data, list):
@@ -112,9 +118,28 @@ def store_to_csv(data: list,
                           production_type,
                           production_subtype)
 
+            # Check if the data is new before writing it
+            new_data = not os.path.isfile(csv_path)
+
             # Again, write the csv if it doesn't exists already
             write_if_not_exists(data, csv_path)
 
+            # Update the quality states with the new data, if it was written
+            if update_quality_states and new_data and os.path.isfile(csv_path):
+                # Import the check_data_quality module with importlib, as the api_delay
+                # decorator does, to keep the preprocessing imports out of the data module
+                cdq = importlib.import_module("re_forecast.preprocessing.check_data_quality")
+
+                # The last date expected is the start of the last data point before the end date
+                if end_date:
+                    last_date = datetime.datetime.strptime(end_date, INPUT_DATETIME_FORMAT)\
+                        - RESSOURCES_DATA_POINT_TIME_SPAN[ressource_nb]
+
+                else:
+                    last_date = None
+
+                cdq.update_quality_states(data, ressource_nb, end_date = last_date)
+
     # Case this isn't a list: the function format_data probably return 'None'
     else:
         print("The function format_data malfuncitoned, due to a problem in the API call")
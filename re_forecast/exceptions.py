@@ -10,3 +10,8 @@ class NotFittedError(Exception):
 class NotTransformedError(Exception):
     """This exception is raised in a scaler object, when an
     inverse_transform method is called before the transform method"""
+
+
+class NotIncrementalError(Exception):
+    """This exception is raised in a scaler object, when a partial_fit
+    method is called on a scaler which can't be fitted incrementally"""
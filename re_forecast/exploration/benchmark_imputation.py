@@ -0,0 +1,209 @@
+# Imports
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from re_forecast.exploration.compute_statistics import GapIndex
+from re_forecast.preprocessing import fill_missing_values
+from re_forecast.preprocessing.clean_values import peel_time_serie_df
+from re_forecast.params import IMPUTATION_BENCHMARK_IMPUTERS, IMPUTATION_BENCHMARK_MIN_STRETCH_LENGTH
+
+
+def find_complete_stretches(missing_mask: np.ndarray | pd.Series,
+                            min_length: int = IMPUTATION_BENCHMARK_MIN_STRETCH_LENGTH
+                            ) -> tuple:
+    """Return the start rows and the lengths of the stretches without any missing value
+    of a time serie, at least min_length rows long.
+    Arguments:
+    - missing_mask: 1D boolean array or serie, True for the missing values
+    Parameters:
+    - min_length: the minimal length of the stretches returned"""
+
+    # Encode the mask into runs, and keep the long enough runs of non missing values
+    gap_index = GapIndex(missing_mask)
+    complete_stretches = ~gap_index.values & (gap_index.lengths >= min_length)
+
+    return gap_index.starts[complete_stretches], gap_index.lengths[complete_stretches]
+
+
+def punch_synthetic_gaps(size: int,
+                         gaps_histogram: pd.Series,
+                         missing_prop: float,
+                         random_generator: np.random.Generator,
+                         max_attempts: int = 1000
+                         ) -> np.ndarray:
+    """Create a mask of synthetic gaps for a complete stretch of a time serie. The gaps
+    lengths are drawn from a gaps lengths distribution until the proportion of missing
+    values is reached, with at least one gap for the stretches of sparsely gapped series
+    whose proportion of missing values rounds to no missing value. The gaps never overlap nor touch each other, and the first and last
+    rows of the stretch are never missing, so every gap is surrounded by known values.
+    Arguments:
+    - size: the number of rows of the stretch
+    - gaps_histogram: the number of gaps for each gap length, as a serie indexed by the
+    length (see the gap_histogram method of GapIndex)
+    - missing_prop: the proportion of missing values to reach
+    - random_generator: the numpy random generator
+    Parameters:
+    - max_attempts: the maximal number of rejected gaps before giving up on the proportion"""
+
+    # Empirical distribution of the gaps lengths, without the gaps too long for the stretch
+    gaps_histogram = gaps_histogram[gaps_histogram.index <= size - 2]
+    if gaps_histogram.empty:
+        raise ValueError("The stretch is too short for the gaps lengths distribution")
+
+    gaps_lengths = gaps_histogram.index.to_numpy()
+    gaps_probabilities = gaps_histogram.to_numpy() / gaps_histogram.sum()
+
+    # Punch gaps until the number of missing values is reached, at least one gap
+    missing_mask = np.zeros(size, dtype = bool)
+    nb_missing_target = max(int(round(missing_prop * size)), 1)
+    nb_attempts = 0
+
+    while missing_mask.sum() < nb_missing_target and nb_attempts < max_attempts:
+
+        # Draw a gap length and a start row keeping the first and last rows known
+        gap_length = random_generator.choice(gaps_lengths, p = gaps_probabilities)
+        gap_start = random_generator.integers(1, size - gap_length)
+
+        # Reject the gap if it overlaps or touches another gap
+        if missing_mask[gap_start - 1:gap_start + gap_length + 1].any():
+            nb_attempts += 1
+            continue
+
+        missing_mask[gap_start:gap_start + gap_length] = True
+
+    return missing_mask
+
+
+def benchmark_imputers(gen_df: pd.DataFrame,
+                       value_col: str,
+                       imputers: dict = IMPUTATION_BENCHMARK_IMPUTERS,
+                       missing_prop: float | None = None,
+                       gaps_histogram: pd.Series | None = None,
+                       min_stretch_length: int = IMPUTATION_BENCHMARK_MIN_STRETCH_LENGTH,
+                       n_repeats: int = 1,
+                       seed: int | None = None,
+                       return_details = False
+                       ) -> pd.DataFrame | tuple:
+    """Benchmark the imputers of the fill_missing_values module on a stored time serie.
+    The complete stretches of the serie are punched with synthetic gaps, matching the gaps
+    lengths distribution and the proportion of missing values of the serie itself (the
+    distribution of count_consecutive_time_periods), then each imputer fills them. The
+    imputed values are compared with the true values, and the wall time and the peak memory
+    allocated by each imputer are measured.
+    Return a summary df with one row per imputer, sorted by mean absolute error, with the
+    mean error metrics (mae, rmse, max_error), the mean wall time in seconds and the max peak
+    memory in MB over all the stretches and repeats.
+    Arguments:
+    - gen_df: a consistent time serie df, peeled or with a complete datetime column
+    - value_col: the name of the value column
+    Parameters:
+    - imputers: dict mapping each benchmark name with the name of an imputation function
+    of the fill_missing_values module and its parameters
+    - missing_prop: the proportion of missing values to punch in each stretch, by default
+    the proportion of missing values of the serie
+    - gaps_histogram: the number of gaps for each gap length, by default the gaps lengths
+    distribution of the serie
+    - min_stretch_length: the minimal length of the complete stretches benchmarked
+    - n_repeats: the number of random gaps masks punched in each stretch
+    - seed: the seed of the random generator
+    - return_details: if True, also return the df of the results of every imputer for
+    every stretch and repeat"""
+
+    # Detect if the df has a dt index. If it doesn't, transform into a peeled df
+    if gen_df.index.dtype == "int64":
+        gen_df = peel_time_serie_df(gen_df)
+
+    # Missing values mask of the serie
+    missing_mask = gen_df[value_col].isnull().to_numpy()
+
+    # Take the gaps lengths distribution and the proportion of missing values from the serie
+    if gaps_histogram is None:
+        gaps_histogram = GapIndex(missing_mask).gap_histogram()
+
+    if missing_prop is None:
+        missing_prop = missing_mask.mean()
+
+    if gaps_histogram.empty or missing_prop == 0:
+        raise ValueError("The time serie has no gap to reproduce, please give a gaps_histogram and a missing_prop")
+
+    # Find the complete stretches of the serie
+    stretches_starts, stretches_lengths = find_complete_stretches(missing_mask, min_length = min_stretch_length)
+
+    if len(stretches_starts) == 0:
+        raise ValueError(f"The time serie has no complete stretch of at least {min_stretch_length} rows")
+
+    # Get the imputation functions
+    imputers_functions = {name: getattr(fill_missing_values, imputer["function"]) for name, imputer in imputers.items()}
+
+    random_generator = np.random.default_rng(seed)
+
+    # Trace the memory allocations, unless they are already traced
+    tracing_started = not tracemalloc.is_tracing()
+    if tracing_started:
+        tracemalloc.start()
+
+    results = []
+
+    try:
+        for stretch_start, stretch_length in zip(stretches_starts, stretches_lengths):
+
+            # Complete stretch of the serie
+            stretch_df = gen_df.iloc[stretch_start:stretch_start + stretch_length][[value_col]]
+            true_values = stretch_df[value_col].to_numpy()
+
+            for repeat in range(n_repeats):
+
+                # Punch the synthetic gaps
+                synthetic_mask = punch_synthetic_gaps(stretch_length, gaps_histogram, missing_prop, random_generator)
+                masked_df = stretch_df.copy(deep = True)
+                masked_df.loc[synthetic_mask, value_col] = np.nan
+
+                for name, imputer in imputers.items():
+
+                    # Impute, measuring the wall time and the memory allocated above the current one
+                    tracemalloc.reset_peak()
+                    memory_start, _ = tracemalloc.get_traced_memory()
+                    start_time = time.perf_counter()
+
+                    imputed_df = imputers_functions[name](masked_df, value_col, **imputer["params"])
+
+                    wall_time = time.perf_counter() - start_time
+                    _, memory_peak = tracemalloc.get_traced_memory()
+
+                    # Compare the imputed values with the true values on the synthetic gaps only
+                    # (the imputers return a df with the imputed value column only)
+                    errors = imputed_df.iloc[:, 0].to_numpy()[synthetic_mask] - true_values[synthetic_mask]
+
+                    results.append({"imputer": name,
+                                    "stretch_start": stretch_df.index[0],
+                                    "repeat": repeat,
+                                    "nb_missing": int(synthetic_mask.sum()),
+                                    "nb_not_imputed": int(np.isnan(errors).sum()),
+                                    "mae": np.nanmean(np.abs(errors)),
+                                    "rmse": np.sqrt(np.nanmean(errors ** 2)),
+                                    "max_error": np.nanmax(np.abs(errors)),
+                                    "wall_time": wall_time,
+                                    "peak_memory_mb": (memory_peak - memory_start) / 1024 ** 2})
+
+    finally:
+        if tracing_started:
+            tracemalloc.stop()
+
+    # Summarize the results per imputer
+    details_df = pd.DataFrame(results)
+    summary_df = details_df.groupby("imputer").agg(nb_missing = ("nb_missing", "sum"),
+                                                   nb_not_imputed = ("nb_not_imputed", "sum"),
+                                                   mae = ("mae", "mean"),
+                                                   rmse = ("rmse", "mean"),
+                                                   max_error = ("max_error", "max"),
+                                                   wall_time = ("wall_time", "mean"),
+                                                   peak_memory_mb = ("peak_memory_mb", "max"))
+    summary_df = summary_df.sort_values("mae")
+
+    if return_details:
+        return summary_df, details_df
+
+    return summary_df
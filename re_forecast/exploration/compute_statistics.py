@@ -1,4 +1,8 @@
 # Imports
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 
@@ -6,73 +10,222 @@ import numpy as np
 from scipy.special import kl_div
 
 # Compute a kernel density estimator
+from scipy.signal import fftconvolve
 from sklearn.neighbors import KernelDensity
 from sklearn.preprocessing import MinMaxScaler
 
-from re_forecast.preprocessing.handle_datetime import construct_time_consistent_df
+from re_forecast.preprocessing.handle_datetime import PreparedTimeSerie, prepare_time_serie
+
+
+class GapIndex:
+    """Run-length encoding of a missing values mask. The mask is stored as runs of
+    consecutive missing or non missing values: the start row, the length and the value
+    (True for missing) of each run. It is computed in O(n) with numpy and answers the
+    questions about the gaps of a time serie (longest gap, gaps longer than k rows,
+    distribution of the gaps lengths) without any groupby."""
+
+    def __init__(self, missing_mask: np.ndarray | pd.Series) -> None:
+        """Encode the missing values mask into runs.
+        Arguments:
+        - missing_mask: 1D boolean array or serie, True for the missing values"""
+
+        # Work on a boolean numpy array
+        missing_mask = np.asarray(missing_mask, dtype = bool)
+
+        # Store the length of the encoded mask
+        self.size = len(missing_mask)
+
+        # A new run starts at the first row and at each row which differs from the previous one
+        changes = np.flatnonzero(missing_mask[1:] != missing_mask[:-1]) + 1
+        self.starts = np.concatenate(([0], changes)) if self.size else np.array([], dtype = int)
+
+        # The length of a run is the distance to the start of the next one
+        self.lengths = np.diff(np.append(self.starts, self.size))
+
+        # The value of a run is the value of its first row
+        self.values = missing_mask[self.starts]
+
+    @classmethod
+    def from_time_serie(cls,
+                        gen_df: pd.DataFrame | PreparedTimeSerie,
+                        date_col: str
+                        ) -> "GapIndex":
+        """Create the gap index of the missing dates of a time serie.
+        Arguments:
+        - gen_df: dataframe with a datetime column, or a prepared time serie
+        - date_col: the name of the datetime column"""
+
+        # Prepare the time serie if it is not already, to get the missing dates mask
+        gen_df_prepared = prepare_time_serie(gen_df, [date_col])
+
+        return cls(gen_df_prepared.missing_masks[date_col])
+
+    def gaps(self) -> tuple:
+        """Return the start rows and the lengths of the gaps of missing values"""
+
+        return self.starts[self.values], self.lengths[self.values]
+
+    def longest_gap(self) -> int:
+        """Return the length of the longest gap of missing values, 0 if there is none"""
+
+        # Collect the lengths of the gaps
+        _, gaps_lengths = self.gaps()
+
+        return int(gaps_lengths.max()) if len(gaps_lengths) else 0
 
+    def gaps_longer_than(self, k: int) -> tuple:
+        """Return the start rows and the lengths of the gaps of missing values
+        strictly longer than k rows.
+        Arguments:
+        - k: the minimal length (exclusive) of the gaps returned"""
 
-def check_dates_consistency(gen_df: pd.DataFrame,
+        # Collect the gaps and filter them on their length
+        gaps_starts, gaps_lengths = self.gaps()
+        long_gaps = gaps_lengths > k
+
+        return gaps_starts[long_gaps], gaps_lengths[long_gaps]
+
+    def gap_histogram(self, missing = True) -> pd.Series:
+        """Return the number of runs for each run length, as a serie indexed by the length.
+        Arguments:
+        - missing: True to count the gaps of missing values, False to count the runs of
+        non missing values"""
+
+        # Select the runs of missing or non missing values
+        runs_lengths = self.lengths[self.values == missing]
+
+        # Count the runs for each length in one pass
+        counts = np.bincount(runs_lengths)
+        lengths = np.flatnonzero(counts)
+
+        return pd.Series(counts[lengths], index = pd.Index(lengths, name = "length"), name = "count")
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the runs as a df with one row per run, its value (1 for missing,
+        0 for non missing) and its length, indexed by a consecutive group id starting at 1"""
+
+        return pd.DataFrame({"value": self.values.astype(int),
+                             "count": self.lengths},
+                            index = pd.RangeIndex(1, len(self.starts) + 1, name = "consecutive_group_id"))
+
+
+def check_dates_consistency(gen_df: pd.DataFrame | PreparedTimeSerie,
                             date_col: str,
                             missing_dates_keys = None # Example: {"missing": 1, "non-missing": 0}
                             ) -> pd.DataFrame:
     """Output a df with a complete datetime column, and missing_dates column that
     indicate if the date in the original df is present (False or 0) or missing (True or 1)
     Arguments:
-    - gen_df: the df we want to check time consistency (missing dates)
+    - gen_df: the df (or prepared time serie) we want to check time consistency (missing dates)
     - date_col: the name of the datetime column we take for reference in time consistency
     Params:
     - missing_dates_keys: dict that indicate in which format you want to indicate 'missing' or 'non-missing'.
     Example: {"missing": 1, "non-missing": 0}"""
 
-    # Construct a df with complete dates
-    gen_complete_df = construct_time_consistent_df(gen_df, [date_col])
+    # Prepare the time serie if it is not already, to get the df with complete dates
+    gen_df_prepared = prepare_time_serie(gen_df, [date_col])
+    gen_complete_df = gen_df_prepared.complete_df
 
     # Return a serie that map every missing date on the complete timeline
-    missing_dates = gen_complete_df[date_col].isnull()
+    missing_dates = gen_df_prepared.missing_masks[date_col]
 
     # Case user want the output missing dates indicator as being int 0 or 1
     if missing_dates_keys:
-        missing_dates = missing_dates.apply(lambda x: missing_dates_keys["missing"] if x else missing_dates_keys["non-missing"])
+        missing_dates = np.where(missing_dates, missing_dates_keys["missing"], missing_dates_keys["non-missing"])
 
     return pd.DataFrame({f"{date_col}_complete": gen_complete_df[f"{date_col}_complete"],
                          "missing_dates": missing_dates})
 
 
-def count_consecutive_time_periods(gen_df: pd.DataFrame,
+def count_consecutive_time_periods(gen_df: pd.DataFrame | PreparedTimeSerie,
                                    date_col: str
                                    ) -> pd.DataFrame:
     """Construct the distribution of consecutive time periods for missing and non
     missing dates of the given df, for its given datetime column.
     Arguments:
-    - gen_df: dataframe with a datetime column
+    - gen_df: dataframe with a datetime column, or a prepared time serie
     - date_col: the name of the datetime column"""
 
-    # Create the missing dates df
-    missing_dates_df = check_dates_consistency(gen_df,
-                                               date_col,
-                                               missing_dates_keys = {"missing": 1, "non-missing": 0}
-                                               )
+    # Encode the missing dates into runs of consecutive missing or non missing dates,
+    # and output one row per run with its value and its length
+    return GapIndex.from_time_serie(gen_df, date_col).to_frame()
 
-    # Add the column that give each "0" or "1" cluster an unique id
-    # The diff method check the diffence with the previous row
-    # The ne method output true when the difference is not 0
-    # The cumsum method is just a cumulative sum
-    missing_dates_df["consecutive_group_id"] = missing_dates_df["missing_dates"].diff().ne(0).cumsum()
 
-    # Create the consecutive time periods df
-    # This df show what is the consecutive value of each group/cluster
-    consecutive_time_periods_df = missing_dates_df\
-        .groupby("consecutive_group_id")["missing_dates"]\
-        .min().to_frame(name = "value")
+def select_kde_bandwidth(nb_points: int,
+                         bandwidth: str | float
+                         ) -> float:
+    """Return the bandwidth of a 1D kde, as sklearn KernelDensity does: the number given,
+    or the bandwidth estimated by the "scott" or the "silverman" method.
+    Arguments:
+    - nb_points: the number of points of the kde
+    - bandwidth: the bandwith number of the kde or the method to estimate the best bandwith"""
+
+    if bandwidth == "scott":
+        return nb_points ** (-1 / 5)
+
+    if bandwidth == "silverman":
+        return (nb_points * 3 / 4) ** (-1 / 5)
+
+    if isinstance(bandwidth, str):
+        raise ValueError(f"Unknown bandwidth method {bandwidth}, choose among 'scott' and 'silverman'")
+
+    return float(bandwidth)
+
+
+def compute_binned_gaussian_kde(values: np.ndarray,
+                                points_to_sample: np.ndarray,
+                                bandwidth: float | np.ndarray
+                                ) -> np.ndarray:
+    """Compute a gaussian kde of 1D values on a regular grid of sample points, in
+    O(n + m log m) instead of the O(n x m) of an exact kde: the values are linearly
+    binned on the grid, then the bin counts are convolved with the gaussian kernel
+    sampled on the grid with a FFT. Several series can be estimated at once on the
+    same grid, by giving them as the columns of a 2D array.
+    Arguments:
+    - values: 1D array of the values, or 2D array with one serie per column, inside the
+    range of the grid. The nans are left out of the kde
+    - points_to_sample: the regular grid of sample points, in increasing order
+    - bandwidth: the bandwidth of the gaussian kernel, or one bandwidth per serie"""
 
-    # We create a serie that compute the number of consecutive values in each group/cluster
-    value_count = missing_dates_df.groupby("consecutive_group_id")["missing_dates"].count().rename("count")
+    # Work on one serie per row, the 1D values are one serie
+    values_2d = np.atleast_2d(np.asarray(values, dtype = float).T)
+    nb_series = len(values_2d)
+    n_samples = len(points_to_sample)
 
-    # Join the serie and the consecutive time periods df
-    consecutive_time_periods_df = consecutive_time_periods_df.join(value_count)
+    bandwidths = np.broadcast_to(np.asarray(bandwidth, dtype = float), (nb_series,))
+    not_nan = ~np.isnan(values_2d)
+    normalization = not_nan.sum(axis = 1) * bandwidths * np.sqrt(2 * np.pi)
+    grid_step = (points_to_sample[-1] - points_to_sample[0]) / (n_samples - 1) if n_samples > 1 else 0
 
-    return consecutive_time_periods_df
+    # Case the grid is a single point: every value is on it, the density is the kernel centred on it
+    if grid_step == 0:
+        densities = np.exp(-0.5 * ((points_to_sample[None, :] - points_to_sample[0]) / bandwidths[:, None]) ** 2)
+        densities *= (not_nan.sum(axis = 1) / normalization)[:, None]
+        return densities[0] if np.ndim(values) == 1 else densities.T
+
+    # Linear binning: each value is shared between its two neighbour grid points.
+    # The bins of all the series are counted at once, the serie i using the bins i * n_samples...
+    series_rows, values_rows = np.nonzero(not_nan)
+    positions = (values_2d[series_rows, values_rows] - points_to_sample[0]) / grid_step
+    left_points = np.clip(np.floor(positions).astype(np.int64), 0, n_samples - 2)
+    right_weights = positions - left_points
+    left_bins = series_rows * n_samples + left_points
+
+    counts = np.bincount(left_bins, weights = 1 - right_weights, minlength = nb_series * n_samples)
+    counts += np.bincount(left_bins + 1, weights = right_weights, minlength = nb_series * n_samples)
+    counts = counts.reshape(nb_series, n_samples)
+
+    # Gaussian kernel of each serie on every grid offset, from -(n_samples - 1) to n_samples - 1 steps
+    offsets = np.arange(-(n_samples - 1), n_samples) * grid_step
+    kernels = np.exp(-0.5 * (offsets[None, :] / bandwidths[:, None]) ** 2)
+
+    # Convolve the counts with the kernels, and keep the densities on the grid points
+    densities = fftconvolve(counts, kernels, mode = "full", axes = 1)[:, n_samples - 1:2 * n_samples - 1]
+
+    # The FFT round-off can give tiny negative densities
+    densities = np.maximum(densities, 0) / normalization[:, None]
+
+    return densities[0] if np.ndim(values) == 1 else densities.T
 
 
 def compute_kde_time_serie(gen_df: pd.DataFrame,
@@ -80,7 +233,9 @@ def compute_kde_time_serie(gen_df: pd.DataFrame,
                            n_samples: int = 1000,
                            bandwidth: str | float = 5,
                            kernel: str = "gaussian",
-                           return_density_only = False
+                           return_density_only = False,
+                           method: str = "exact",
+                           compute_log_likelihood = True
                            ) -> np.array:
     """Compute a kernel density estimation (kde) of the value column of a time serie
     df, and return a sample of this kde for a given number of sample points. Also return
@@ -92,37 +247,61 @@ def compute_kde_time_serie(gen_df: pd.DataFrame,
     Parameters:
     - n_samples: the number of sample points
     - bandwitdth: the bandwith number of the kde or the method to estimate the best bandwith
-    - kernel: the density function to use as kernel for the kde"""
+    - kernel: the density function to use as kernel for the kde
+    - return_density_only: if True, return the sampled density only (the log-likelihood
+    is not computed)
+    - method: "exact" to fit a sklearn KernelDensity, or "fft" to compute a binned gaussian
+    kde with a FFT convolution (see compute_binned_gaussian_kde), gaussian kernel only
+    - compute_log_likelihood: if False, the log-likelihood is not computed and None is
+    returned instead. With the "fft" method, it is computed from the density interpolated
+    on the original points"""
 
     # Create X, without nan values
-    gen_df_without_nan = gen_df.loc[~gen_df[value_col].isnull(), :].copy(deep = True)
-    X = gen_df_without_nan[[value_col]]
-
-    # Instanciate a KDE object from sklearn
-    kde = KernelDensity(kernel = kernel, bandwidth = bandwidth).fit(X)
+    values = gen_df[value_col].to_numpy(dtype = float)
+    values = values[~np.isnan(values)]
 
     # Create the points from which to sample
-    min_value = np.min(X, axis = 0).value
-    max_value = np.max(X, axis = 0).value
-    points_to_sample = np.linspace(min_value, max_value, n_samples)
+    points_to_sample = np.linspace(values.min(), values.max(), n_samples)
+
+    # The log-likelihood is not needed for the density only
+    compute_log_likelihood = compute_log_likelihood and not return_density_only
+    log_likelihood = None
 
-    # Create a df with points_to_sample in order to have 2D data
-    # and to give the column the same name than the value column of the
-    # original df (avoiding annoying warning)
-    points_to_sample_2d = pd.DataFrame({f"{value_col}": points_to_sample})
+    # Binned kde computed with a FFT convolution
+    if method == "fft":
+        if kernel != "gaussian":
+            raise ValueError("The fft method only supports the gaussian kernel")
 
-    # Compute the log-density
-    log_density = kde.score_samples(points_to_sample_2d)
+        density = compute_binned_gaussian_kde(values,
+                                              points_to_sample,
+                                              select_kde_bandwidth(len(values), bandwidth))
 
-    # Compute the log-likelihood from the original points of the time serie df
-    log_likelihood = kde.score(X)
+        # Compute the log-likelihood from the density interpolated on the original points
+        if compute_log_likelihood:
+            log_likelihood = np.sum(np.log(np.interp(values, points_to_sample, density)))
+
+    elif method == "exact":
+        # Instanciate a KDE object from sklearn, on 2D data with the name of the value column
+        # of the original df (avoiding annoying warning)
+        X = pd.DataFrame({f"{value_col}": values})
+        kde = KernelDensity(kernel = kernel, bandwidth = bandwidth).fit(X)
+
+        # Compute the log-density
+        density = np.exp(kde.score_samples(pd.DataFrame({f"{value_col}": points_to_sample})))
+
+        # Compute the log-likelihood from the original points of the time serie df
+        if compute_log_likelihood:
+            log_likelihood = kde.score(X)
+
+    else:
+        raise ValueError(f"Unknown kde method {method}, choose among 'exact' and 'fft'")
 
     # Return only the density if requested
     if return_density_only:
-        return np.exp(log_density)
+        return density
 
     # Return the points to sample and the sampled density
-    return points_to_sample, np.exp(log_density), log_likelihood
+    return points_to_sample, density, log_likelihood
 
 
 def compute_kl_divergence_time_series(gen_df_reference: pd.DataFrame,
@@ -131,6 +310,7 @@ def compute_kl_divergence_time_series(gen_df_reference: pd.DataFrame,
                                       n_samples: int = 1000,
                                       bandwidth: str | float = 5,
                                       kernel: str = "gaussian",
+                                      method: str = "exact"
                                       ) -> float:
     """Compute the K-L divergence for two time series, one reference time serie
     and a time serie we want to evaluate For more informations about the K-L divergence,
@@ -145,6 +325,7 @@ def compute_kl_divergence_time_series(gen_df_reference: pd.DataFrame,
     - n_samples: the number of sample points
     - bandwitdth: the bandwith number of the kde or the method to estimate the best bandwith
     - kernel: the density function to use as kernel for the kde
+    - method: the method of the kde, "exact" or "fft" (see compute_kde_time_serie)
     """
 
     # Copy
@@ -162,14 +343,144 @@ def compute_kl_divergence_time_series(gen_df_reference: pd.DataFrame,
                                                n_samples = n_samples,
                                                bandwidth = bandwidth,
                                                kernel = kernel,
-                                               return_density_only = True)
+                                               return_density_only = True,
+                                               method = method)
 
     density_to_evaluate = compute_kde_time_serie(gen_df_to_evaluate,
                                                  value_col,
                                                  n_samples = n_samples,
                                                  bandwidth = bandwidth,
                                                  kernel = kernel,
-                                                 return_density_only = True)
+                                                 return_density_only = True,
+                                                 method = method)
 
     # Return the K-L divergence
     return np.sum(kl_div(density_to_evaluate, density_reference))
+
+
+def min_max_scale_columns(values: np.ndarray) -> np.ndarray:
+    """Min-max scale each column of a 2D array into [0, 1], ignoring the nans, as the
+    sklearn MinMaxScaler does (a constant column is scaled to 0)
+    Arguments:
+    - values: 2D array with one serie per column"""
+
+    min_values = np.nanmin(values, axis = 0)
+    value_ranges = np.nanmax(values, axis = 0) - min_values
+    value_ranges[value_ranges == 0] = 1
+
+    return (values - min_values) / value_ranges
+
+
+def stack_candidates(candidates: list | np.ndarray | pd.DataFrame,
+                     value_col: str
+                     ) -> np.ndarray:
+    """Stack candidate series into a 2D array with one candidate per column, padded
+    with nans when the candidates have different lengths.
+    Arguments:
+    - candidates: a list of time serie dfs (with the value column), of series or of 1D arrays,
+    or a 2D array or a wide df with one candidate per column
+    - value_col: the name of the value column of the candidate dfs"""
+
+    # Case the candidates are already stacked
+    if isinstance(candidates, (np.ndarray, pd.DataFrame)):
+        return np.asarray(candidates, dtype = float).reshape(len(candidates), -1)
+
+    # Otherwise, collect the values of each candidate
+    candidates_values = [np.asarray(candidate[value_col] if isinstance(candidate, pd.DataFrame) else candidate,
+                                    dtype = float)
+                         for candidate in candidates]
+
+    stacked = np.full((max(len(values) for values in candidates_values), len(candidates_values)), np.nan)
+    for i, values in enumerate(candidates_values):
+        stacked[:len(values), i] = values
+
+    return stacked
+
+
+def compute_kl_divergence_batch(gen_df_reference: pd.DataFrame,
+                                candidates: list | np.ndarray | pd.DataFrame,
+                                value_col: str,
+                                n_samples: int = 1000,
+                                bandwidth: str | float = 5,
+                                kernel: str = "gaussian",
+                                method: str = "exact",
+                                max_workers: int | None = None
+                                ) -> np.ndarray:
+    """Compute the K-L divergence of many candidate time series against one reference
+    time serie, as compute_kl_divergence_time_series does for each of them. The reference
+    is min-max scaled and its density estimated only once, then all the candidates are
+    scaled at once. With the "fft" method their densities are estimated in one batched
+    FFT convolution (see compute_binned_gaussian_kde), with the "exact" method they are
+    estimated in a pool of processes, one candidate per task.
+    Return the array of the K-L divergences, in the order of the candidates.
+    Arguments:
+    - gen_df_reference: A consistent time serie df with one or more complete datetime columns
+    and one value column
+    - candidates: the time series to evaluate, as a list of time serie dfs (with the value
+    column), of series or of 1D arrays, or as a 2D array or a wide df with one candidate per column
+    - value_col: the name of the value column
+    Parameters:
+    - n_samples: the number of sample points
+    - bandwitdth: the bandwith number of the kde or the method to estimate the best bandwith
+    - kernel: the density function to use as kernel for the kde
+    - method: the method of the kde, "exact" as compute_kl_divergence_time_series, or "fft"
+    (gaussian kernel only)
+    - max_workers: the number of worker processes of the "exact" method, all the cores by
+    default, 1 to estimate the densities in the current process"""
+
+    # Scale the reference and estimate its density once
+    reference_values = min_max_scale_columns(gen_df_reference[[value_col]].to_numpy(dtype = float))
+    density_reference = compute_kde_time_serie(pd.DataFrame({value_col: reference_values[:, 0]}),
+                                               value_col,
+                                               n_samples = n_samples,
+                                               bandwidth = bandwidth,
+                                               kernel = kernel,
+                                               return_density_only = True,
+                                               method = method)
+
+    # Scale all the candidates at once
+    candidates_values = min_max_scale_columns(stack_candidates(candidates, value_col))
+
+    # The scaled candidates span [0, 1], apart from the constant ones which are all at 0
+    is_constant = np.nanmax(candidates_values, axis = 0) == 0
+    densities = np.empty((n_samples, candidates_values.shape[1]))
+
+    # Estimate the densities of the candidates in one batch on the [0, 1] grid
+    if method == "fft" and kernel == "gaussian":
+        nb_points = (~np.isnan(candidates_values[:, ~is_constant])).sum(axis = 0)
+        bandwidths = np.array([select_kde_bandwidth(nb, bandwidth) for nb in nb_points])
+        densities[:, ~is_constant] = compute_binned_gaussian_kde(candidates_values[:, ~is_constant],
+                                                                 np.linspace(0, 1, n_samples),
+                                                                 bandwidths)
+        candidates_one_by_one = np.flatnonzero(is_constant)
+
+    else:
+        candidates_one_by_one = range(candidates_values.shape[1])
+
+    # Otherwise estimate the densities of the candidates one by one
+    compute_candidate_density = functools.partial(compute_kde_time_serie,
+                                                  value_col = value_col,
+                                                  n_samples = n_samples,
+                                                  bandwidth = bandwidth,
+                                                  kernel = kernel,
+                                                  return_density_only = True,
+                                                  method = method)
+    candidates_dfs = [pd.DataFrame({value_col: candidates_values[:, i]}) for i in candidates_one_by_one]
+
+    # Don't start more processes than candidates
+    max_workers = min(max_workers or os.cpu_count() or 1, len(candidates_dfs))
+
+    # Estimate the exact densities in a pool of processes, the few constant candidates
+    # of the fft method are estimated directly
+    if method == "exact" and max_workers > 1:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            candidates_densities = list(executor.map(compute_candidate_density, candidates_dfs))
+
+    else:
+        candidates_densities = [compute_candidate_density(candidate_df) for candidate_df in candidates_dfs]
+
+    for i, density in zip(candidates_one_by_one, candidates_densities):
+        densities[:, i] = density
+
+    # Return the K-L divergence of each candidate
+    return np.sum(kl_div(densities, density_reference[:, None]), axis = 0)
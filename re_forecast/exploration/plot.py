@@ -4,7 +4,7 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 
-from re_forecast.exploration.compute_statistics import check_dates_consistency, count_consecutive_time_periods
+from re_forecast.exploration.compute_statistics import check_dates_consistency, GapIndex
 
 
 def plot_missing_dates_repartition(gen_df: pd.DataFrame,
@@ -39,14 +39,12 @@ def plot_consecutive_time_periods(gen_df: pd.DataFrame,
     - gen_df: dataframe with a datetime column
     - date_col: the name of the datetime column"""
 
-    # Compute the consecutuve time periods df
-    consecutive_time_periods_df = count_consecutive_time_periods(gen_df, date_col)
+    # Encode the missing dates into runs of consecutive missing or non missing dates
+    gap_index = GapIndex.from_time_serie(gen_df, date_col)
 
     # Filter for missing and non missing dates
-    consecutive_missing_dates = consecutive_time_periods_df\
-        .loc[consecutive_time_periods_df["value"] == 1, "count"].to_list() # "1" correspond to missing dates
-    consecutive_non_missing_dates = consecutive_time_periods_df\
-        .loc[consecutive_time_periods_df["value"] == 0, "count"].to_list() # "0" correspond to non missing dates
+    consecutive_missing_dates = gap_index.lengths[gap_index.values].tolist()
+    consecutive_non_missing_dates = gap_index.lengths[~gap_index.values].tolist()
 
     # Plot the result
     plt.figure(figsize = (18, 10))
@@ -71,6 +71,16 @@ METADATA_ENERGY_PRODUCTION_FIELDS = {1: 'creation_date',
                                      7: 'production_subtype',
                                      8: 'file_name'}
 
+# Path to the json file storing the running quality states of the energy production time series
+DATA_ENERGY_PRODUCTION_QUALITY_STATES = f"{DATA_CSV_ENERGY_PRODUCTION_PATH}/energy_production_quality_states.json"
+
+# Update the quality states each time new energy production data is stored. False by default, set it to
+# True to opt in (the states are then written next to the CSVs)
+UPDATE_QUALITY_STATES_ON_STORE = False
+
+# Path to store the preprocessed energy production time series, one parquet file per unit
+DATA_PREPROCESSED_ENERGY_PRODUCTION_PATH = f"{DATA_CSV_ENERGY_PRODUCTION_PATH}/preprocessed"
+
 # Path to store meteo predcion CSVs
 DATA_CSV_METEO_PATH = os.environ.get("DATA_CSV_METEO_PATH")
 
@@ -168,6 +178,27 @@ DATA_QUALITY_THRESHOLDS = {"row_nb": (1000, "check_nb_row", "Unsufficient number
                            "prop_missing_values": (0.3, "check_missing_values_prop", "Too many missing values in proportion"),
                            "max_empty_gap_duration": (50, "check_max_empty_gap_duration", "Max empty values gap duration above 50 hours")}
 
+# Direction of the comparison between each quality metric and its threshold: "min" when
+# the metric must be strictly above the threshold, "max" when it must be strictly below
+DATA_QUALITY_THRESHOLDS_DIRECTIONS = {"row_nb": "min",
+                                      "prop_missing_values": "max",
+                                      "max_empty_gap_duration": "max"}
+
+
+########################################
+# Preprocessing Handle datetime module #
+########################################
+
+# French public holidays falling at a fixed date, as (month, day) tuples
+FRENCH_FIXED_HOLIDAYS = [(1, 1), (5, 1), (5, 8), (7, 14), (8, 15), (11, 1), (11, 11), (12, 25)]
+
+# French public holidays depending on Easter, as a number of days after Easter sunday
+# (Easter monday, Ascension day and Whit monday)
+FRENCH_EASTER_HOLIDAYS_OFFSETS = [1, 39, 50]
+
+# Maximal number of time grids whose calendar features are kept in cache
+CALENDAR_FEATURES_CACHE_SIZE = 32
+
 
 ##############################
 # Preprocessing Clean values #
@@ -187,5 +218,73 @@ VALUE_COL_NAME = "value"
 # Minimum and maximum bound values for the time serie df
 MIN_MAX_BOUND_VALUES = {"min_value": 0, "max_value": None}
 
-# Parameters of the KNN imputation of missing values
-KNN_IMPUTATION_MISSING_VALUES = {"min_value": 0, "max_value": None}
+# Parameters of the KNN imputation of missing values. The "global" search fits the scikit-learn KNNImputer,
+# set "search" to "window" to only look for the neighbours of the missing values, inside a window of
+# 720 time steps (30 days of hourly data)
+KNN_IMPUTATION_MISSING_VALUES = {"param": 5, "nb_supervised_features": 24, "search": "global", "window": 720}
+
+# Maximal length (number of time steps) of the gaps linearly interpolated before the KNN imputation.
+# Only the longer gaps are imputed by the KNN imputer, inside a window around each of them
+MAX_INTERPOLATION_GAP = 3
+
+
+#################################
+# Preprocessing Pipeline module #
+#################################
+
+# Default specification of the preprocessing pipeline: the list of the stages run in order, each one
+# with its parameters. The parameters missing from a given specification are taken from this one
+PREPROCESSING_PIPELINE_SPEC = {"stages": [{"stage": "check_quality",
+                                           "params": {"dt_columns": DATE_TIME_COLUMNS[:-1],
+                                                      "ressource_nb": None,
+                                                      "quality_thresholds": DATA_QUALITY_THRESHOLDS}},
+                                          {"stage": "clip_values",
+                                           "params": {"value_col": VALUE_COL_NAME,
+                                                      "min_value": MIN_MAX_BOUND_VALUES["min_value"],
+                                                      "max_value": MIN_MAX_BOUND_VALUES["max_value"]}},
+                                          {"stage": "impute_values",
+                                           "params": {"value_col": VALUE_COL_NAME,
+                                                      "max_interpolation_gap": MAX_INTERPOLATION_GAP,
+                                                      "long_gap_imputer": "knn_impute",
+                                                      "long_gap_params": KNN_IMPUTATION_MISSING_VALUES}}]}
+
+
+##################################################
+# Preprocessing Incremental preprocessing module #
+##################################################
+
+# Number of already preprocessed time steps kept before the new rows of an incremental preprocessing,
+# as context of the imputation of the new rows: the context of the long gaps imputation (720 time steps,
+# see hybrid_impute) plus the number of lags
+INCREMENTAL_PREPROCESSING_OVERLAP = 744
+
+
+########################################
+# Preprocessing Tune imputation module #
+########################################
+
+# Grid of imputers and parameters evaluated by the imputation parameters search. Each imputer
+# name is mapped with a dict giving the list of values to try for each of its parameters
+IMPUTATION_SEARCH_GRID = {"knn_impute": {"param": [3, 5, 10, 20], "search": ["window"]},
+                          "iterative_impute": {"param": [5, 10, 20]}}
+
+
+###########################################
+# Exploration Benchmark imputation module #
+###########################################
+
+# Imputers evaluated by the imputation benchmark. Each benchmark name is mapped with the name
+# of an imputation function of the fill_missing_values module and its parameters
+IMPUTATION_BENCHMARK_IMPUTERS = {"linear_interpolation": {"function": "interpolate_time_serie_df",
+                                                          "params": {"interpolation_method": "linear"}},
+                                 "knn_impute_window": {"function": "knn_impute",
+                                                       "params": {"param": 5, "search": "window"}},
+                                 "knn_impute": {"function": "knn_impute",
+                                                "params": {"param": 5}},
+                                 "iterative_impute": {"function": "iterative_impute",
+                                                      "params": {"param": 10}},
+                                 "seasonal_profile_impute": {"function": "seasonal_profile_impute",
+                                                             "params": {"context": 24}}}
+
+# Minimal length (number of time steps) of the complete stretches of the benchmark (30 days of hourly data)
+IMPUTATION_BENCHMARK_MIN_STRETCH_LENGTH = 720
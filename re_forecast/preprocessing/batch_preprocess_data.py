@@ -0,0 +1,209 @@
+# Imports
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from re_forecast.data.utils import create_csv_path
+from re_forecast.preprocessing.preprocess_data import preprocess_data
+from re_forecast.params import (DATA_CSV_ENERGY_PRODUCTION_PATH, DATA_PREPROCESSED_ENERGY_PRODUCTION_PATH,
+                               UNITS_NAMES_COLS)
+
+
+def partition_generation_file(generation_file_path: str,
+                              unit_col: str,
+                              partition_path: str,
+                              units: list | None = None,
+                              chunk_size: int = 100000
+                              ) -> dict:
+    """Split a generation file into one csv file per unit, reading it by chunks so that the
+    whole file is never held in memory. Return a dict mapping each unit name, in their order
+    of appearance in the file, with the path of its csv file.
+    Arguments:
+    - generation_file_path: the path of the generation file
+    - unit_col: the name of the unit name column
+    - partition_path: the folder where the csv files of the units are written
+    Parameters:
+    - units: the names of the units to keep, all the units of the file by default
+    - chunk_size: the number of rows read at once"""
+
+    units_paths = {}
+
+    for chunk in pd.read_csv(generation_file_path, chunksize = chunk_size):
+
+        # Keep only the asked units
+        if units is not None:
+            chunk = chunk[chunk[unit_col].isin(units)]
+
+        for unit, unit_chunk in chunk.groupby(unit_col, sort = False):
+
+            # Append the rows of the unit to its csv file, with the header at the first chunk only
+            is_new_unit = unit not in units_paths
+            if is_new_unit:
+                units_paths[unit] = f"{partition_path}/unit_{len(units_paths):05d}.csv"
+
+            unit_chunk.to_csv(units_paths[unit], mode = "w" if is_new_unit else "a", header = is_new_unit, index = False)
+
+    return units_paths
+
+
+def create_preprocessed_path(preprocessed_data_path: str,
+                             ressource_nb: int,
+                             start_date: str | None,
+                             end_date: str | None,
+                             unit: str
+                             ) -> str:
+    """Create the path of the parquet file storing the preprocessed time serie of a unit,
+    named after the generation file it comes from (ressource name and dates) and the unit"""
+
+    generation_file_path = create_csv_path(preprocessed_data_path, ressource_nb, start_date, end_date, None, None, None)
+
+    # Replace the spaces and slashes of the unit name, as in the CSVs names
+    unit = str(unit).replace(" ", "_").replace("/", "_")
+
+    return f"{generation_file_path.removesuffix('.csv')}__{unit}.parquet"
+
+
+def preprocess_unit(unit: str,
+                    unit_file_path: str | None,
+                    ressource_nb: int,
+                    start_date: str | None,
+                    end_date: str | None,
+                    output_path: str | None,
+                    preprocess_params: dict
+                    ) -> tuple:
+    """Preprocess the time serie of one unit read from its own csv file, and store it as
+    parquet if an output path is given. Return the preprocessed df (None when it is stored
+    or when the quality check fails) and the summary row of the unit"""
+
+    summary = {"unit": unit,
+               "quality_check": False,
+               "message": None,
+               "nb_rows": 0,
+               "nb_rows_preprocessed": 0,
+               "read_time": 0.0,
+               "preprocessing_time": 0.0,
+               "file_path": None}
+
+    # Case the unit is not present in the generation file
+    if unit_file_path is None:
+        summary["message"] = "The unit is not present in the generation data"
+        return None, summary
+
+    # Read the rows of the unit only
+    start_time = time.perf_counter()
+    gen_df = pd.read_csv(unit_file_path)
+    summary["read_time"] = time.perf_counter() - start_time
+
+    # Preprocess the unit, keeping the result of the quality check
+    start_time = time.perf_counter()
+
+    try:
+        gen_df_preprocessed, quality_check, message = preprocess_data(gen_df,
+                                                                      ressource_nb = ressource_nb,
+                                                                      return_quality_check = True,
+                                                                      **preprocess_params)
+
+    # A failing unit must not stop the preprocessing of the others
+    except Exception as error:
+        gen_df_preprocessed, quality_check, message = None, False, f"{type(error).__name__}: {error}"
+
+    summary.update(quality_check = quality_check,
+                   message = message,
+                   nb_rows = len(gen_df),
+                   preprocessing_time = time.perf_counter() - start_time)
+
+    if gen_df_preprocessed is None:
+        return None, summary
+
+    summary["nb_rows_preprocessed"] = len(gen_df_preprocessed)
+
+    # Store the preprocessed time serie instead of sending it back to the main process
+    if output_path is not None:
+        file_path = create_preprocessed_path(output_path, ressource_nb, start_date, end_date, unit)
+        gen_df_preprocessed.to_parquet(file_path)
+        summary["file_path"] = file_path
+
+        return None, summary
+
+    return gen_df_preprocessed, summary
+
+
+def batch_preprocess_data(ressource_nb: int,
+                          start_date: str | None,
+                          end_date: str | None,
+                          units: list | None = None,
+                          output_path: str | None = DATA_PREPROCESSED_ENERGY_PRODUCTION_PATH,
+                          max_workers: int | None = None,
+                          generation_data_path: str = DATA_CSV_ENERGY_PRODUCTION_PATH,
+                          units_cols = UNITS_NAMES_COLS,
+                          chunk_size: int = 100000,
+                          **preprocess_params
+                          ) -> tuple:
+    """Preprocess the time series of all the units of a stored generation file with the
+    preprocess_data function, in a pool of processes. The generation file is first split
+    by chunks into one temporary csv file per unit, then each worker reads only the rows
+    of the unit it preprocesses, so neither the whole file nor the dfs are held or pickled
+    by the workers. The preprocessed time series are stored as parquet files (one per
+    unit, named after the ressource, the dates and the unit) by the workers, or sent back
+    to the main process if no output path is given.
+    Return a tuple with the dict mapping each unit name with its preprocessed df (empty when
+    the time series are stored) and a summary df with one row per unit: the result and the
+    message of the quality check, the number of rows before and after the preprocessing,
+    the read time and the preprocessing time of the unit in seconds and the path of the
+    parquet file. The units failing the quality check come first.
+    Arguments:
+    - ressource_nb: the ressource number of the generation data
+    - start_date, end_date: the dates of the stored generation file
+    Parameters:
+    - units: the names of the units to preprocess, all the units of the file by default
+    - output_path: the folder where the preprocessed time series are stored, None to
+    return them instead
+    - max_workers: the number of worker processes, all the cores by default
+    - generation_data_path: the folder of the stored generation files
+    - units_cols: the name of the unit name column for each ressource
+    - chunk_size: the number of rows of the generation file read at once
+    - preprocess_params: the parameters passed to the preprocess_data function"""
+
+    # Path of the generation file, downloaded for all the units of the ressource
+    generation_file_path = create_csv_path(generation_data_path, ressource_nb, start_date, end_date, None, None, None)
+    unit_col = units_cols[ressource_nb]
+
+    if output_path is not None:
+        os.makedirs(output_path, exist_ok = True)
+
+    with tempfile.TemporaryDirectory() as partition_path:
+
+        # Split the generation file by unit, by default every unit of the file is preprocessed
+        units_paths = partition_generation_file(generation_file_path,
+                                                unit_col,
+                                                partition_path,
+                                                units = units,
+                                                chunk_size = chunk_size)
+
+        if units is None:
+            units = list(units_paths)
+
+        # Don't start more processes than units
+        max_workers = max(min(max_workers or os.cpu_count() or 1, len(units)), 1)
+
+        # Preprocess the units in a pool of processes, each task reads the file of its unit
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            futures = [executor.submit(preprocess_unit,
+                                       unit,
+                                       units_paths.get(unit),
+                                       ressource_nb,
+                                       start_date,
+                                       end_date,
+                                       output_path,
+                                       preprocess_params)
+                       for unit in units]
+            results = [future.result() for future in futures]
+
+    # Gather the preprocessed dfs and the summary of every unit
+    preprocessed_dfs = {summary["unit"]: gen_df for gen_df, summary in results if gen_df is not None}
+    summary_df = pd.DataFrame([summary for _, summary in results])
+
+    return preprocessed_dfs, summary_df.sort_values("quality_check", kind = "stable").reset_index(drop = True)
@@ -1,99 +1,501 @@
+import datetime
+import json
+import os
+import warnings
+
+import numpy as np
 import pandas as pd
 
-from re_forecast.preprocessing.handle_datetime import construct_time_consistent_df
-from re_forecast.exploration.compute_statistics import count_consecutive_time_periods, check_dates_consistency
-from re_forecast.params import DATA_QUALITY_THRESHOLDS
+from re_forecast.preprocessing.handle_datetime import PreparedTimeSerie, prepare_time_serie, handle_seasonal_time, select_time_grid_freq
+from re_forecast.exploration.compute_statistics import GapIndex
+from re_forecast.params import (DATA_QUALITY_THRESHOLDS, DATA_QUALITY_THRESHOLDS_DIRECTIONS, DATE_TIME_COLUMNS,
+                                UNITS_NAMES_COLS, DATA_ENERGY_PRODUCTION_QUALITY_STATES)
 
 
-def check_nb_row(gen_df: pd.DataFrame,
+def check_nb_row(gen_df: pd.DataFrame | PreparedTimeSerie,
                  eval_col: str,
                  threshold: int | float,
                  ) -> bool:
     """Check if the gen_df respect the threshold for the
     minimal number of values
     Arguments:
-    - gen_df: the time serie df we want to check the quality of the data
+    - gen_df: the time serie df (or prepared time serie) we want to check the quality of the data
     - eval_col: the column name used to evaluate the quality
     - threshold: the value threshold to respect in order to pass the quality check"""
 
-    # Construct a time complete (time consistent) df
-    gen_df_complete = construct_time_consistent_df(gen_df, [eval_col])
+    # Prepare the time serie if it is not already, to get the complete (time consistent) df
+    gen_df_prepared = prepare_time_serie(gen_df, [eval_col])
 
-    return len(gen_df_complete[eval_col]) > threshold
+    return len(gen_df_prepared.complete_df[eval_col]) > threshold
 
 
-def check_missing_values_prop(gen_df: pd.DataFrame,
+def check_missing_values_prop(gen_df: pd.DataFrame | PreparedTimeSerie,
                               eval_col: str,
                               threshold: int | float
                               ) -> bool:
     """Check if the gen_df respect the threshold for the proportion
     of missing values
     Arguments:
-    - gen_df: the time serie df we want to check the quality of the data
+    - gen_df: the time serie df (or prepared time serie) we want to check the quality of the data
     - eval_col: the column name used to evaluate the quality
     - threshold: the value threshold to respect in order to pass the quality check"""
 
-    # Compute the df of missing and non missing values
-    missing_values_df = check_dates_consistency(gen_df,
-                                                eval_col,
-                                                missing_dates_keys = {"missing": "missing", "non-missing": "non-missing"}
-                                                )
+    # Prepare the time serie if it is not already, to get the missing dates mask
+    gen_df_prepared = prepare_time_serie(gen_df, [eval_col])
 
     # Compute the proportion of missing values
-    prop_missing_values = missing_values_df.value_counts("missing_dates", normalize = True)["missing"]
+    prop_missing_values = gen_df_prepared.missing_masks[eval_col].mean()
 
     return prop_missing_values < threshold
 
 
-def check_max_empty_gap_duration(gen_df: pd.DataFrame,
+def check_max_empty_gap_duration(gen_df: pd.DataFrame | PreparedTimeSerie,
                                  eval_col: str,
                                  threshold: int | float
                                  ) -> bool:
     """Check if the gen_df respect the threshold for the max
     missing value gap duration
     Arguments:
-    - gen_df: the time serie df we want to check the quality of the data
+    - gen_df: the time serie df (or prepared time serie) we want to check the quality of the data
     - eval_col: the column name used to evaluate the quality
     - threshold: the value threshold to respect in order to pass the quality check"""
 
-    # Compute the df listing all the time periods with nan values
-    consecutive_time_periods_df = count_consecutive_time_periods(gen_df, eval_col)
-
     # Compute the maximum duration of time periods containing nans
-    max_empty_gap_duration = consecutive_time_periods_df\
-        .loc[consecutive_time_periods_df["value"] == 1, "count"].max()
+    max_empty_gap_duration = GapIndex.from_time_serie(gen_df, eval_col).longest_gap()
 
     return max_empty_gap_duration < threshold
 
 
-def check_data_quality(gen_df: pd.DataFrame,
+def compute_quality_metrics(missing_mask: np.ndarray) -> dict:
+    """Compute in one numpy pass over the missing values mask the quality metrics of
+    one or several time series: the number of rows, the proportion of missing values
+    and the longest gap of missing values. For each serie, only the rows between its
+    first and its last non missing value are evaluated.
+    Return a dict mapping each metric name with an array holding one value per serie.
+    Arguments:
+    - missing_mask: boolean array, True for the missing values. Either 1D for one time
+    serie, or 2D with one column per time serie (a panel)"""
+
+    # Work on a 2D mask, one column per time serie
+    missing_mask = np.asarray(missing_mask, dtype = bool)
+    if missing_mask.ndim == 1:
+        missing_mask = missing_mask[:, None]
+
+    nb_rows, nb_series = missing_mask.shape
+    present = ~missing_mask
+
+    # 1/ Span of each serie, from its first to its last non missing value
+    has_values = present.any(axis = 0)
+    first_rows = np.argmax(present, axis = 0)
+    last_rows = nb_rows - 1 - np.argmax(present[::-1], axis = 0)
+    row_nb = np.where(has_values, last_rows - first_rows + 1, 0)
+
+    # 2/ Proportion of missing values inside the span
+    nb_missing = row_nb - present.sum(axis = 0)
+    prop_missing_values = np.divide(nb_missing, row_nb,
+                                    out = np.ones(nb_series),
+                                    where = row_nb > 0)
+
+    # 3/ Longest gap of missing values inside the span
+
+    # The gaps start where the padded mask goes from 0 to 1 and end where it goes from 1 to 0.
+    # The mask is transposed so that the starts and the ends come sorted serie by serie
+    padded_mask = np.zeros((nb_series, nb_rows + 2), dtype = np.int8)
+    padded_mask[:, 1:-1] = missing_mask.T
+    steps = np.diff(padded_mask, axis = 1)
+    gap_series, gap_starts = np.nonzero(steps == 1)
+    gap_ends = np.nonzero(steps == -1)[1]
+
+    # Leading and trailing gaps are outside the span of the serie and are not counted
+    inner_gaps = (gap_starts > first_rows[gap_series]) & (gap_ends <= last_rows[gap_series])
+
+    max_empty_gap_duration = np.zeros(nb_series, dtype = int)
+    np.maximum.at(max_empty_gap_duration,
+                  gap_series[inner_gaps],
+                  gap_ends[inner_gaps] - gap_starts[inner_gaps])
+
+    return {"row_nb": row_nb,
+            "prop_missing_values": prop_missing_values,
+            "max_empty_gap_duration": max_empty_gap_duration}
+
+
+def evaluate_quality_metrics(metrics: dict,
+                             series_names: list,
+                             quality_thresholds = DATA_QUALITY_THRESHOLDS,
+                             thresholds_directions = DATA_QUALITY_THRESHOLDS_DIRECTIONS
+                             ) -> pd.DataFrame:
+    """Compare quality metrics with their thresholds and return the quality report, as
+    a df with one row per serie. The report hold every quality metric, whether each metric
+    respects its threshold ('<metric>_check' columns), the global quality check and the
+    message of the first check not passed.
+    Arguments:
+    - metrics: dict mapping each quality metric name with an array of one value per serie,
+    as returned by the compute_quality_metrics function
+    - series_names: the names of the time series, used as index of the report
+    Parameters:
+    - quality_thresholds: dict mapping each quality check name with a tuple
+    containing the quality threshold, the name of the quality check function
+    and a message explaining the reason of the non quality check
+    - thresholds_directions: dict mapping each quality check name with "min" if the metric
+    must be above the threshold, "max" if it must be below"""
+
+    # Verify every quality check has a metric and a direction
+    unknown_checks = [metric for metric in quality_thresholds
+                      if metric not in metrics or metric not in thresholds_directions]
+
+    if unknown_checks:
+        raise ValueError(f"Unknown quality checks {unknown_checks}, the quality thresholds must be "
+                         f"among the metrics {[metric for metric in metrics if metric in thresholds_directions]}")
+
+    # Create the report with the metrics
+    report = pd.DataFrame(metrics, index = pd.Index(series_names))
+
+    # Set the global check and the message as if all the checks were passed
+    report["quality_check"] = True
+    report["message"] = "Quality check passed"
+
+    # Compare each metric with its threshold, for all the series at once
+    for metric, (threshold, _, message) in quality_thresholds.items():
+        if thresholds_directions[metric] == "min":
+            check = report[metric] > threshold
+
+        else:
+            check = report[metric] < threshold
+
+        report[f"{metric}_check"] = check
+
+        # Keep the message of the first check not passed
+        first_failure = ~check & report["quality_check"]
+        report.loc[first_failure, "message"] = message
+        report["quality_check"] &= check
+
+    # Order the columns: the metrics, their checks, then the global check and its message
+    checks_columns = [f"{metric}_check" for metric in quality_thresholds.keys()]
+
+    return report[list(metrics.keys()) + checks_columns + ["quality_check", "message"]]
+
+
+def compute_quality_report(missing_mask: np.ndarray,
+                           series_names: list,
+                           quality_thresholds = DATA_QUALITY_THRESHOLDS
+                           ) -> pd.DataFrame:
+    """Return the quality report of one or several time series, as a df with one row per
+    serie. See the evaluate_quality_metrics function for the content of the report.
+    Arguments:
+    - missing_mask: boolean array, True for the missing values. Either 1D for one time
+    serie, or 2D with one column per time serie (a panel)
+    - series_names: the names of the time series, used as index of the report
+    Parameters:
+    - quality_thresholds: dict mapping each quality check name with a tuple
+    containing the quality threshold, the name of the quality check function
+    and a message explaining the reason of the non quality check"""
+
+    # Compute every metric in one pass, then compare them with their thresholds
+    return evaluate_quality_metrics(compute_quality_metrics(missing_mask),
+                                    series_names,
+                                    quality_thresholds = quality_thresholds)
+
+
+def check_data_quality(gen_df: pd.DataFrame | PreparedTimeSerie,
                        eval_col: str,
-                       quality_thresholds = DATA_QUALITY_THRESHOLDS
-                       ) -> tuple:
+                       quality_thresholds = DATA_QUALITY_THRESHOLDS,
+                       return_report = False
+                       ) -> tuple | pd.DataFrame:
     """Check weather or not the input time serie dataset respects quality
     standards defined inside the quality_thresholds parameter.
+    Return the result of the check and the message explaining the reason of the
+    first check not passed, or the complete quality report if asked.
     Arguments:
-    - gen_df: the time serie df we want to check the quality of the datas
-    given the quality_thresholds dict
+    - gen_df: the time serie df (or prepared time serie) we want to check the
+    quality of the datas given the quality_thresholds dict
     - eval_col: the column name used by the check functions to evaluate the df
     Parameters:
     - quality_thresholds: dict mapping each quality check name with a tuple
     containing the quality threshold, the name of the quality check function
+    and a message explaining the reason of the non quality check
+    - return_report: if True, return the quality report df with every metric"""
+
+    # Prepare the time serie once to get its missing dates mask
+    gen_df_prepared = prepare_time_serie(gen_df, [eval_col])
+    missing_mask = gen_df_prepared.missing_masks[eval_col].to_numpy()
+
+    # Compute all the metrics and checks in one pass
+    report = compute_quality_report(missing_mask,
+                                    [eval_col],
+                                    quality_thresholds = quality_thresholds)
+
+    # Return the full report if requested
+    if return_report:
+        return report
+
+    return bool(report["quality_check"].iloc[0]), report["message"].iloc[0]
+
+
+def check_panel_data_quality(panel_df: pd.DataFrame,
+                             quality_thresholds = DATA_QUALITY_THRESHOLDS
+                             ) -> pd.DataFrame:
+    """Check at once the data quality of every time serie of a panel, and return
+    the quality report with one row per serie.
+    Arguments:
+    - panel_df: a wide df with a complete datetime index and one value column per
+    time serie, as constructed by the construct_time_consistent_panel function
+    Parameters:
+    - quality_thresholds: dict mapping each quality check name with a tuple
+    containing the quality threshold, the name of the quality check function
     and a message explaining the reason of the non quality check"""
 
-    # Set a check indicator to True and a quality check message
-    global_check = True
-    global_message = "Quality check passed"
+    return compute_quality_report(panel_df.isnull().to_numpy(),
+                                  panel_df.columns,
+                                  quality_thresholds = quality_thresholds)
+
+
+class QualityState:
+    """Running quality metrics of one time serie, updated each time new data is appended
+    instead of re-scanning the whole history. The state stores the running number of rows
+    on the time grid, the running number of missing values, the longest closed gap of missing
+    values and the length of the gap still open at the end of the serie. The metrics it
+    exposes are the same as the ones checked against DATA_QUALITY_THRESHOLDS.
+    Note: the appends must be chronological. The new rows dated before the end of the
+    state are considered as already evaluated, they are ignored with a warning."""
+
+    def __init__(self,
+                 freq: str | datetime.timedelta = "1H",
+                 ressource_nb: int | None = None
+                 ) -> None:
+        """Initialize an empty state.
+        Params:
+        - freq: time step between each datetime point of the time grid
+        - ressource_nb: the ressource number of the time serie. If given, the time step
+        is the time span of one data point of this ressource and 'freq' is ignored"""
+
+        # Time step of the time grid
+        self.freq = pd.Timedelta(select_time_grid_freq(freq, ressource_nb))
+
+        # First and last dates of the time grid already evaluated
+        self.first_date = None
+        self.last_date = None
+
+        # Running counts
+        self.row_nb = 0
+        self.nb_missing = 0
+
+        # Longest gap closed by a non missing value, and gap still open at the end
+        self.max_closed_gap = 0
+        self.open_gap = 0
+
+    def update(self,
+               gen_df: pd.DataFrame,
+               date_col: str = DATE_TIME_COLUMNS[0],
+               end_date: datetime.datetime | None = None
+               ) -> None:
+        """Update the state with newly appended rows, in O(new rows).
+        Arguments:
+        - gen_df: the new rows of the time serie, with a datetime column not yet formated
+        Params:
+        - date_col: the name of the datetime column
+        - end_date: last date expected on the time grid. The missing dates between the last
+        new row and this date are counted in the open gap. Ignored when neither the state
+        nor the new rows have a date yet, as the time grid has no start"""
+
+        # Format the dates of the new rows only, and keep the ones after the state end
+        new_dates = pd.DatetimeIndex(gen_df[date_col].apply(handle_seasonal_time)).unique().sort_values()
+
+        if self.last_date is not None:
+            # Warn about the rows already evaluated: late or corrected data is not taken into account
+            nb_late_dates = int((new_dates <= self.last_date).sum())
+            if nb_late_dates:
+                warnings.warn(f"{nb_late_dates} dates at or before the end of the quality state ({self.last_date}) "
+                              "are ignored, re-create the state from the whole serie to take them into account")
+
+            new_dates = new_dates[new_dates > self.last_date]
+
+        # Nothing new to evaluate, or no date yet to start the time grid of a new state
+        if not len(new_dates) and (end_date is None or self.last_date is None):
+            return
+
+        # The new segment of the time grid starts right after the state end
+        segment_start = new_dates[0] if self.last_date is None else self.last_date + self.freq
+        segment_end = new_dates[-1] if len(new_dates) else pd.Timestamp(end_date)
+
+        if end_date is not None:
+            segment_end = max(segment_end, pd.Timestamp(end_date))
+
+        # Case the segment is empty
+        if segment_end < segment_start:
+            return
+
+        # Build the missing values mask of the new segment only
+        segment_size = (segment_end - segment_start) // self.freq + 1
+        missing_mask = np.ones(segment_size, dtype = bool)
+
+        positions = (new_dates - segment_start) // self.freq
+        on_grid = (new_dates - segment_start) % self.freq == pd.Timedelta(0)
+        missing_mask[positions[on_grid]] = False
+
+        # Encode the segment into gaps
+        gaps_starts, gaps_lengths = GapIndex(missing_mask).gaps()
+
+        # Update the gaps: the first gap of the segment extends the open gap
+        if len(gaps_starts) and gaps_starts[0] == 0:
+            leading_gap = gaps_lengths[0]
+            gaps_starts, gaps_lengths = gaps_starts[1:], gaps_lengths[1:]
+
+        else:
+            leading_gap = 0
+
+        # Case the whole segment is missing, the open gap goes on
+        if leading_gap == segment_size:
+            self.open_gap += leading_gap
+
+        else:
+            # The open gap is closed by the first non missing value of the segment
+            self.max_closed_gap = max(self.max_closed_gap, self.open_gap + leading_gap)
+
+            # The last gap of the segment stays open if it reaches the segment end
+            if len(gaps_starts) and gaps_starts[-1] + gaps_lengths[-1] == segment_size:
+                self.open_gap = int(gaps_lengths[-1])
+                gaps_lengths = gaps_lengths[:-1]
+
+            else:
+                self.open_gap = 0
+
+            # The other gaps are closed
+            if len(gaps_lengths):
+                self.max_closed_gap = max(self.max_closed_gap, int(gaps_lengths.max()))
+
+        # Update the running counts and the dates of the state
+        self.row_nb += int(segment_size)
+        self.nb_missing += int(missing_mask.sum())
+        self.first_date = segment_start if self.first_date is None else self.first_date
+        self.last_date = segment_end
+
+    def metrics(self) -> dict:
+        """Return the quality metrics of the serie, as the compute_quality_metrics function
+        does on the full history: the open gap at the end of the serie is outside its span."""
+
+        # Remove the open gap from the span
+        row_nb = self.row_nb - self.open_gap
+        nb_missing = self.nb_missing - self.open_gap
+
+        return {"row_nb": np.array([row_nb]),
+                "prop_missing_values": np.array([nb_missing / row_nb if row_nb else 1.0]),
+                "max_empty_gap_duration": np.array([self.max_closed_gap])}
+
+    def check(self,
+              quality_thresholds = DATA_QUALITY_THRESHOLDS,
+              return_report = False
+              ) -> tuple | pd.DataFrame:
+        """Check the serie against the quality thresholds, without re-scanning its history.
+        Return the result of the check and its message, as the check_data_quality function.
+        Params:
+        - quality_thresholds: the quality thresholds, see the check_data_quality function
+        - return_report: if True, return the quality report df with every metric"""
+
+        # Compare the running metrics with the thresholds
+        report = evaluate_quality_metrics(self.metrics(),
+                                          ["state"],
+                                          quality_thresholds = quality_thresholds)
+
+        # Add the open gap to the report
+        report["open_gap"] = self.open_gap
+
+        if return_report:
+            return report
+
+        return bool(report["quality_check"].iloc[0]), report["message"].iloc[0]
+
+    def to_dict(self) -> dict:
+        """Return the state as a json serializable dict"""
+
+        return {"freq": self.freq.isoformat(),
+                "first_date": None if self.first_date is None else self.first_date.isoformat(),
+                "last_date": None if self.last_date is None else self.last_date.isoformat(),
+                "row_nb": self.row_nb,
+                "nb_missing": self.nb_missing,
+                "max_closed_gap": self.max_closed_gap,
+                "open_gap": self.open_gap}
+
+    @classmethod
+    def from_dict(cls, state_dict: dict) -> "QualityState":
+        """Re-create a state from the dict returned by the to_dict method.
+        Arguments:
+        - state_dict: the state as a dict"""
+
+        # Instanciate with the time step of the state
+        state = cls(freq = pd.Timedelta(state_dict["freq"]))
+
+        # Restore the dates and the running counts
+        state.first_date = None if state_dict["first_date"] is None else pd.Timestamp(state_dict["first_date"])
+        state.last_date = None if state_dict["last_date"] is None else pd.Timestamp(state_dict["last_date"])
+        state.row_nb = state_dict["row_nb"]
+        state.nb_missing = state_dict["nb_missing"]
+        state.max_closed_gap = state_dict["max_closed_gap"]
+        state.open_gap = state_dict["open_gap"]
+
+        return state
+
+
+def load_quality_states(states_path = DATA_ENERGY_PRODUCTION_QUALITY_STATES) -> dict:
+    """Load the quality states of all the stored time series, as a dict mapping
+    '<ressource_nb>_<unit name>' keys with quality states. Return an empty dict if
+    no state was stored yet.
+    Params:
+    - states_path: path of the json file storing the quality states"""
+
+    # Case no state was stored yet
+    if not os.path.isfile(states_path):
+        return dict()
+
+    with open(states_path, mode = "r") as f:
+        states_dicts = json.load(f)
+
+    return {key: QualityState.from_dict(state_dict) for key, state_dict in states_dicts.items()}
+
+
+def save_quality_states(states: dict,
+                        states_path = DATA_ENERGY_PRODUCTION_QUALITY_STATES
+                        ) -> None:
+    """Save the quality states of all the stored time series as json.
+    Arguments:
+    - states: dict mapping '<ressource_nb>_<unit name>' keys with quality states
+    Params:
+    - states_path: path of the json file storing the quality states"""
+
+    with open(states_path, mode = "w") as f:
+        json.dump({key: state.to_dict() for key, state in states.items()}, f)
+
+
+def update_quality_states(data: list | pd.DataFrame,
+                          ressource_nb: int,
+                          end_date: datetime.datetime | None = None,
+                          units_cols = UNITS_NAMES_COLS,
+                          states_path = DATA_ENERGY_PRODUCTION_QUALITY_STATES
+                          ) -> dict:
+    """Update the stored quality states of every unit present in newly stored data,
+    and return the updated states. Only the new rows are read.
+    Arguments:
+    - data: the new generation data, as the list of dicts stored by the store_to_csv
+    function or as a df
+    - ressource_nb: the ressource number of the data
+    Params:
+    - end_date: last date expected on the time grid for every unit
+    - units_cols: the name of the unit name column for each ressource
+    - states_path: path of the json file storing the quality states"""
+
+    # Load the stored states
+    states = load_quality_states(states_path)
+
+    # Iterate over the units of the new data
+    for unit_name, unit_df in pd.DataFrame(data).groupby(units_cols[ressource_nb]):
+        # Retreive the state of the unit, or create it
+        key = f"{ressource_nb}_{unit_name}"
+        state = states.get(key, QualityState(ressource_nb = ressource_nb))
 
-    # Check iteratively the df for all the check functions, unpacking
-    # the quality_thresholds dict and the eval function
-    for threshold, function, message in quality_thresholds.values():
-        code_to_eval = f'{function}(gen_df, eval_col, {threshold})'
-        check = eval(code_to_eval)
+        # Update the state with the new rows of the unit
+        state.update(unit_df, end_date = end_date)
+        states[key] = state
 
-        # If the check is not passed (check function return False),
-        # return False and the reason why the test is negative (the message)
-        if not check:
-            return check, message
+    # Save the updated states
+    save_quality_states(states, states_path)
 
-    return global_check, global_message
+    return states
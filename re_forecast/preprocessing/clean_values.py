@@ -1,6 +1,10 @@
+import copy
+import json
+
+import numpy as np
 import pandas as pd
 
-from re_forecast.exceptions import NotFittedError, NotTransformedError
+from re_forecast.exceptions import NotFittedError, NotTransformedError, NotIncrementalError
 from re_forecast.params import PEELED_DF_KEEPED_COLUMNS
 
 
@@ -32,39 +36,286 @@ def peel_time_serie_df(gen_df: pd.DataFrame,
 
 
 def set_min_max_limits_time_serie(gen_df: pd.DataFrame,
-                                  value_col: str,
-                                  min_value: float | None = None,
-                                  max_value: float | None = None
+                                  value_col: str | list,
+                                  min_value: float | dict | pd.Series | None = None,
+                                  max_value: float | dict | pd.Series | None = None,
+                                  inplace = False
                                   ) -> pd.DataFrame:
-    """Limits min and max values of a time serie df.
+    """Limits min and max values of a time serie df, or of the time series of a panel,
+    by clipping the value columns only.
     Arguments:
     - gen_df: A consistent time serie df with one or more complete datetime columns
-    and one value column
-    - value_col: the name of the value column
-    - min_value: minimum limit value
-    - max_value: maximum limit value
+    and one value column, or a panel df with one value column per unit
+    - value_col: the name of the value column, or the list of the value columns
+    - min_value: minimum limit value, or a dict (or serie) mapping the value columns with
+    their minimum limit value (a column without limit value is not limited)
+    - max_value: maximum limit value, or a dict (or serie) mapping the value columns with
+    their maximum limit value
+    Parameters:
+    - inplace: if True, clip the value columns of gen_df itself instead of a copy
     """
 
-    # Copy the gen_df to avoid the setting with copy warning
-    gen_df_copy = gen_df.copy(deep = True)
+    # Copy the gen_df to avoid the setting with copy warning, unless the clipping is inplace
+    if not inplace:
+        gen_df = gen_df.copy(deep = True)
+
+    # Clip the value columns one by one, with their own limit values
+    value_cols = [value_col] if isinstance(value_col, str) else list(value_col)
+
+    for col in value_cols:
+        lower = min_value.get(col) if isinstance(min_value, (dict, pd.Series)) else min_value
+        upper = max_value.get(col) if isinstance(max_value, (dict, pd.Series)) else max_value
+
+        # Case the column is not limited
+        if lower is None and upper is None:
+            continue
+
+        gen_df[col] = gen_df[col].clip(lower = lower, upper = upper)
+
+    return gen_df
+
+
+def compute_differences_weights(order: int) -> np.ndarray:
+    """Return the weights of the differenciation of a given order, applied on the window
+    of the order + 1 last values (the oldest first): the signed binomial coefficients,
+    for example [1, -2, 1] for the order 2.
+    Arguments:
+    - order: the order of differenciation"""
+
+    # Binomial coefficients of the order, computed iteratively to stay in integers
+    binomial_coefficients = [1]
+    for k in range(order):
+        binomial_coefficients.append(binomial_coefficients[-1] * (order - k) // (k + 1))
+
+    # The newest value has a positive weight
+    return np.array([(-1) ** (order - i) * coefficient for i, coefficient in enumerate(binomial_coefficients)],
+                    dtype = np.float64)
+
+
+def difference_array(values: np.ndarray,
+                     order: int,
+                     inplace = False,
+                     block_size: int = 4096
+                     ) -> np.ndarray:
+    """Differenciate an array by the order given along its rows, in one pass: each
+    difference of order k is the weighted sum of the k + 1 last values with the signed
+    binomial coefficients, accumulated into a single output array. The result is equal to
+    the pandas diff method applied order times, without the first order rows. A window
+    containing a nan gives a nan.
+    Return an array of len(values) - order rows.
+    Arguments:
+    - values: 1D array of a time serie, or 2D array with one time serie per column
+    - order: the order of differenciation
+    Parameters:
+    - inplace: if True, write the differences into the last rows of the values and return
+    this view. The rows are differenciated by blocks from the end, so that each block only
+    reads values not yet overwritten
+    - block_size: for the inplace differenciation, the number of rows of each block"""
+
+    weights = [values.dtype.type(weight) for weight in compute_differences_weights(order)]
+    nb_rows = len(values) - order
+
+    # Case order == 0, nothing to differenciate
+    if not order:
+        return values if inplace else values.copy()
+
+    # Not inplace: accumulate the weighted shifted values into one output array, starting from the newest values
+    if not inplace:
+        differences = values[order:] * weights[order]
+
+        for i in range(order):
+            differences += weights[i] * values[i:i + nb_rows]
+
+        return differences
+
+    # Inplace: differenciate the blocks of rows from the end, each through a temporary block
+    for block_end in range(len(values), order, -block_size):
+        block_start = max(block_end - block_size, order)
+
+        block_differences = values[block_start:block_end] * weights[order]
+
+        for i in range(order):
+            block_differences += weights[i] * values[block_start - order + i:block_end - order + i]
+
+        values[block_start:block_end] = block_differences
+
+    return values[order:]
+
+
+def find_first_complete_windows(values: np.ndarray, window_size: int) -> np.ndarray:
+    """Return the row ending the first window of window_size values without nan, for each
+    column of an array (window_size - 1 for a column without any complete window). Only
+    the head of the array is scanned, doubling its length until every column has a
+    complete window.
+    Arguments:
+    - values: 1D array of a time serie, or 2D array with one time serie per column
+    - window_size: the number of consecutive values of the windows"""
+
+    # Case the array is shorter than a window
+    if len(values) < window_size:
+        return np.full(values.shape[1:], window_size - 1, dtype = np.int64)
+
+    head_size = 1024
+
+    while True:
+        # The windows of the head whose values are all present
+        present = ~np.isnan(values[:head_size])
+        nb_windows = len(present) - window_size + 1
+        complete_windows = present[window_size - 1:].copy()
+
+        for i in range(window_size - 1):
+            complete_windows &= present[i:i + nb_windows]
+
+        # Stop when every column has a complete window, or when the whole array is scanned
+        if head_size >= len(values) or complete_windows.any(axis = 0).all():
+            return np.argmax(complete_windows, axis = 0) + window_size - 1
+
+        head_size *= 2
+
+
+def integrate_forecast(forecasts: np.ndarray,
+                       tail_values: np.ndarray,
+                       order: int
+                       ) -> np.ndarray:
+    """Integrate forecasts of differenciated values of a given order, from the last values
+    known before each forecast. The last difference of each order lower than the order is
+    computed from the tail values, and is used as the constant of integration of the
+    cumulated sums along the horizon, for all the forecasts at once.
+    Return a new float64 array (n_samples, horizon).
+    Arguments:
+    - forecasts: 2D array (n_samples, horizon) of the forecasted differenciated values
+    - tail_values: 2D array (n_samples, order) of the last order values known before each
+    forecast, the oldest first
+    - order: the order of differenciation"""
+
+    # Work in float64 on a copy of the forecasts
+    levels = np.array(forecasts, dtype = np.float64, ndmin = 2)
+    tail_values = np.asarray(tail_values, dtype = np.float64).reshape(len(levels), -1)
+
+    if tail_values.shape[1] < order:
+        raise ValueError(f"The forecasts need the {order} last known values to be integrated")
+
+    tail_values = tail_values[:, tail_values.shape[1] - order:]
+
+    # Integrate order times, from the highest order of differenciation to the lowest
+    for lower_order in range(order - 1, -1, -1):
+
+        # Last known difference of the lower order, the constant of integration
+        last_difference = tail_values[:, order - lower_order - 1:] @ compute_differences_weights(lower_order)
+
+        levels = last_difference[:, None] + np.cumsum(levels, axis = 1)
+
+    return levels
+
+
+def compute_rolling_statistics(values: np.ndarray,
+                               windows_sizes: list,
+                               block_size: int = 1024
+                               ) -> dict:
+    """Compute the rolling mean and the rolling std (unbiased) of an array along its rows,
+    for several windows sizes at once and in O(n) per window size: the rows are split into
+    blocks, and the statistics of the windows ending in a block are differences of the
+    cumulated sums of the values, of their squares and of the number of non missing values
+    over the block and the window before it. The values of each block are centered on their
+    mean, so that the cancellation in the cumulated squares stays bounded by the local spread
+    of the values, even for long trending series. As with the pandas rolling method, the rows
+    whose window is not complete or contains a nan are nan.
+    Return a dict mapping each window size with a tuple of two arrays (rolling mean,
+    rolling std), of the shape of the values.
+    Arguments:
+    - values: 1D array of a time serie, or 2D array with one time serie per column
+    - windows_sizes: the sizes of the rolling windows
+    Parameters:
+    - block_size: the number of rows of the blocks whose values are centered together. The
+    blocks are at least one window long, so each value is summed at most twice per window size"""
+
+    # Cumulated number of non missing values, with a leading row of zeros (exact in integers)
+    present = ~np.isnan(values)
+    zeros = np.zeros((1,) + values.shape[1:])
+    count_cumsum = np.concatenate([zeros, np.cumsum(present, axis = 0)])
+
+    rolling_statistics = {}
+
+    for window_size in windows_sizes:
+        mean = np.full(values.shape, np.nan)
+        std = np.full(values.shape, np.nan)
 
-    # Replace values bellow min_value by min_value
-    if isinstance(min_value, (int, float)):
-        min_values = gen_df_copy.loc[gen_df_copy[value_col] < min_value, value_col].values
-        gen_df_copy.replace({value: min_value for value in min_values}, inplace = True)
+        # Blocks at least one window long, the segments of values summed stay in O(n) for large windows
+        window_block_size = max(block_size, window_size)
 
-    # Replace values above max_value by max_value
-    if isinstance(max_value, (int, float)):
-        max_values = gen_df_copy.loc[gen_df_copy[value_col] > max_value, value_col].values
-        gen_df_copy.replace({value: max_value for value in max_values}, inplace = True)
+        # Windows ending in each block of rows, the segment of values they cover starts one window before the block
+        for block_start in range(window_size - 1, len(values), window_block_size):
+            block_end = min(block_start + window_block_size, len(values))
+            segment_present = present[block_start - window_size + 1:block_end]
+            segment = np.where(segment_present, values[block_start - window_size + 1:block_end], 0).astype(np.float64)
 
-    return gen_df_copy
+            # Center the segment on its mean, to limit the cancellation in the cumulated squares
+            center = segment.sum(axis = 0) / np.maximum(segment_present.sum(axis = 0), 1)
+            segment = np.where(segment_present, segment - center, 0)
+
+            # Cumulated sums of the segment, with a leading row of zeros
+            values_cumsum = np.concatenate([zeros, np.cumsum(segment, axis = 0)])
+            squares_cumsum = np.concatenate([zeros, np.cumsum(segment ** 2, axis = 0)])
+
+            # Sums over the window ending at each row of the block
+            window_sum = values_cumsum[window_size:] - values_cumsum[:-window_size]
+            window_squares = squares_cumsum[window_size:] - squares_cumsum[:-window_size]
+            complete = (count_cumsum[block_start + 1:block_end + 1]
+                        - count_cumsum[block_start + 1 - window_size:block_end + 1 - window_size]) == window_size
+
+            with np.errstate(all = "ignore"):
+                window_mean = window_sum / window_size
+                window_var = np.maximum(window_squares - window_sum * window_mean, 0) / (window_size - 1)
+
+            mean[block_start:block_end] = np.where(complete, window_mean + center, np.nan)
+            std[block_start:block_end] = np.where(complete, np.sqrt(window_var), np.nan)
+
+        rolling_statistics[window_size] = (mean, std)
+
+    return rolling_statistics
+
+
+def backfill_array(values: np.ndarray) -> np.ndarray:
+    """Fill the nans of an array along its rows with the next non missing value, as the
+    pandas bfill method. The trailing nans are kept. Return a new array.
+    Arguments:
+    - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+    nb_rows = len(values)
+    rows = np.arange(nb_rows).reshape((-1,) + (1,) * (values.ndim - 1))
+
+    # Row of the next non missing value of each row, found with a reversed cumulated minimum
+    next_rows = np.where(np.isnan(values), nb_rows, rows)
+    next_rows = np.minimum.accumulate(next_rows[::-1], axis = 0)[::-1]
+
+    # Fill the rows, the trailing nans point after the last row and stay nan
+    padded_values = np.concatenate([values, np.full((1,) + values.shape[1:], np.nan)])
+
+    return np.take_along_axis(padded_values, np.minimum(next_rows, nb_rows), axis = 0)
+
+
+def get_timestamps(gen_df: pd.DataFrame) -> pd.DatetimeIndex | None:
+    """Return the datetime index of a df, None if its index is not a datetime index"""
+
+    return gen_df.index if isinstance(gen_df.index, pd.DatetimeIndex) else None
 
 
 class BaseTsScaler:
     """The BaseTsScaler is only used to avoid implementing
     a fit_transform method each time for each Ts scalers
-    objects."""
+    objects. It also implements the save and load of the fitted
+    scalers, from the init parameters and the fitted state of each
+    scaler object."""
+
+    # Names of the init parameters and of the fitted state attributes of the scaler
+    params_attributes = ()
+    state_attributes = ()
+
+    # True for the scalers whose fit and transform need the timestamps of the values
+    uses_timestamps = False
+
+    # True for the scalers whose fitted state can be updated with new chunks of values
+    incremental = False
 
     def __init__(self) -> None:
 
@@ -87,9 +338,112 @@ class BaseTsScaler:
         # Transform
         return self.transform(*args)
 
+    def fit_array(self, values: np.ndarray) -> None:
+        return
+
+    def fit_transform_array(self, values: np.ndarray) -> np.ndarray:
+        """The fit_transform_array method to be inherited
+        by the child objects."""
+
+        # Fit
+        self.fit_array(values)
+
+        # Transform in place
+        return self.transform_array(values)
+
+    def gather_params(self,
+                      param: any,
+                      values: np.ndarray,
+                      series: np.ndarray | None = None
+                      ) -> np.ndarray:
+        """Return a fitted parameter (one value per fitted column) with the dtype of the values.
+        If series is given, return the parameter of the serie of each row of the values,
+        broadcastable along the rows.
+        Arguments:
+        - param: the fitted parameter
+        - values: the array to transform
+        Parameters:
+        - series: 1D array giving, for each row of the values, the position of its serie
+        among the fitted columns"""
+
+        param = np.asarray(param, dtype = values.dtype)
+
+        # Case the columns of the values are the fitted columns
+        if series is None:
+            return param
+
+        # Otherwise, one parameter per row
+        return param[series].reshape((-1,) + (1,) * (values.ndim - 1))
+
+    def check_no_series(self, series: np.ndarray | None) -> None:
+        """Raise an error if the values are given per serie rows to a scaler whose
+        fitted state is aligned on the fitted rows"""
+
+        if series is not None:
+            raise ValueError(f"The {type(self).__name__} can't transform the values per serie rows")
+
+    def partial_fit_array(self, values: np.ndarray) -> None:
+        """Update the fitted state with a new chunk of values. Only the scalers
+        whose state can be updated incrementally (incremental set to True) implement it."""
+
+        raise NotIncrementalError(f"The {type(self).__name__} can't be fitted incrementally")
+
+    def get_params(self) -> dict:
+        """Return the init parameters of the scaler"""
+
+        return {attribute: getattr(self, attribute) for attribute in self.params_attributes}
+
+    def get_state(self) -> dict:
+        """Return the fitted state of the scaler as a dict of arrays. The attributes
+        which are not fitted (still set to their int default value) are left out"""
+
+        return {attribute: np.asarray(getattr(self, attribute)) for attribute in self.state_attributes
+                if not isinstance(getattr(self, attribute), int)}
+
+    def set_state(self, state: dict) -> None:
+        """Set the fitted state of the scaler from a dict of arrays"""
+
+        for attribute, value in state.items():
+            setattr(self, attribute, value)
+
+    @classmethod
+    def from_params(cls, params: dict) -> "BaseTsScaler":
+        """Instanciate the scaler from its init parameters"""
+
+        return cls(**params)
+
+    def save(self, path: str) -> None:
+        """Save the scaler into a compressed npz file: the arrays of the fitted state,
+        and a json metadata entry with the name of the scaler and its init parameters.
+        Arguments:
+        - path: the path of the npz file"""
+
+        metadata = {"scaler": type(self).__name__, "params": self.get_params()}
+
+        np.savez_compressed(path, metadata = np.array(json.dumps(metadata)), **self.get_state())
+
+    @staticmethod
+    def load(path: str) -> "BaseTsScaler":
+        """Load a scaler saved with the save method, whatever its type.
+        Arguments:
+        - path: the path of the npz file"""
+
+        with np.load(path, allow_pickle = False) as saved_scaler:
+            metadata = json.loads(str(saved_scaler["metadata"]))
+            state = {key: saved_scaler[key] for key in saved_scaler.files if key != "metadata"}
+
+        # Re-create the scaler and set its fitted state
+        scaler = SCALERS_OBJECTS[metadata["scaler"]].from_params(metadata["params"])
+        scaler.set_state(state)
+
+        return scaler
+
 
 class NormalScalerTs(BaseTsScaler):
 
+    state_attributes = ("mean", "std", "count", "m2")
+    incremental = True
+
     def __init__(self) -> None:
         """Initialize self.mean, self.std and the
         error message used in case of error handling."""
@@ -100,6 +454,10 @@ class NormalScalerTs(BaseTsScaler):
         # Create null std and mean
         self.mean, self.std = (0, 0)
 
+        # Number of values and sum of the squared deviations from the mean, updated
+        # by the partial_fit methods (Welford algorithm)
+        self.count, self.m2 = (0, 0)
+
     def fit(self, gen_df: pd.DataFrame) -> None:
         """Extract the mean and the std of a time serie df
         Arguments:
@@ -108,6 +466,18 @@ class NormalScalerTs(BaseTsScaler):
         # Extract the mean and the std of the df
         self.mean, self.std = gen_df.mean(), gen_df.std()
 
+        # Keep the number of values and the sum of the squared deviations, to go on
+        # fitting incrementally
+        self.count = gen_df.count().to_numpy(dtype = np.float64)
+        self.m2 = gen_df.var().to_numpy(dtype = np.float64) * (self.count - 1)
+
+    def partial_fit(self, gen_df: pd.DataFrame) -> None:
+        """Update the mean and the std with a new chunk of a time serie df
+        Arguments:
+        - gen_df: df with one column value and a datetime index"""
+
+        self.partial_fit_array(gen_df.to_numpy(dtype = np.float64))
+
     def transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
         """Normalize the time serie.
         Arguments:
@@ -133,9 +503,84 @@ class NormalScalerTs(BaseTsScaler):
         # Inverse a normalize df
         return gen_df_normalized * self.std + self.mean
 
+    def fit_array(self, values: np.ndarray) -> None:
+        """Extract the mean and the std of each column of an array, ignoring the nans
+        like the pandas fit method.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+        # Reset the statistics, and fit them on the whole array
+        self.mean, self.std = (0, 0)
+        self.count, self.m2 = (0, 0)
+
+        self.partial_fit_array(values)
+
+    def partial_fit_array(self, values: np.ndarray) -> None:
+        """Update the mean and the std of each column with a new chunk of an array, ignoring
+        the nans. The statistics of the chunk are merged with the fitted ones with the parallel
+        Welford algorithm, so that fitting chunk by chunk gives the statistics of the whole array.
+        Arguments:
+        - values: 1D array of a chunk of a time serie, or 2D array with one time serie per column"""
+
+        # Statistics of the chunk, in float64 whatever the dtype of the values
+        present = ~np.isnan(values)
+        chunk_count = present.sum(axis = 0).astype(np.float64)
+
+        with np.errstate(all = "ignore"):
+            chunk_mean = np.where(present, values, 0).sum(axis = 0, dtype = np.float64) / chunk_count
+            chunk_m2 = (np.where(present, values - chunk_mean, 0).astype(np.float64) ** 2).sum(axis = 0)
+
+            # Merge the statistics of the chunk with the fitted ones
+            count = self.count + chunk_count
+            delta = chunk_mean - self.mean
+            mean = np.where(chunk_count > 0, self.mean + delta * chunk_count / count, self.mean)
+            m2 = np.where(chunk_count > 0, self.m2 + chunk_m2 + delta ** 2 * self.count * chunk_count / count, self.m2)
+
+            # Update the mean and the (unbiased) std
+            self.count, self.mean, self.m2 = count, mean, m2
+            self.std = np.sqrt(m2 / (count - 1))
+
+    def transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Normalize an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row
+        of the values (for example forecasts of several series stacked in rows)"""
+
+        # Raise the not fitted error if the transform method is called before fit
+        if isinstance(self.mean, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        values -= self.gather_params(self.mean, values, series)
+        values /= self.gather_params(self.std, values, series)
+
+        return values
+
+    def inverse_transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Inverse normalize an array in place, and return it.
+        Arguments:
+        - values: 1D array of a normalized time serie, or 2D array with one time
+        serie per column
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row
+        of the values (for example forecasts of several series stacked in rows)"""
+
+        # Raise the not fitted error if the inverse_transform method is called before fit
+        if isinstance(self.mean, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        values *= self.gather_params(self.std, values, series)
+        values += self.gather_params(self.mean, values, series)
+
+        return values
+
 
 class StationarizerTs(BaseTsScaler):
 
+    params_attributes = ("order",)
+    incremental = True
+
     def __init__(self, order: int = 0) -> None:
         """Set the initial_values list and the error message for
         the error handling in the inverse transform method"""
@@ -158,71 +603,149 @@ class StationarizerTs(BaseTsScaler):
 
         return
 
+    def partial_fit_array(self, values: np.ndarray) -> None:
+        """Define the partial_fit_array method in order to fit a pipeline
+        incrementally"""
+
+        return
+
+    def get_state(self) -> dict:
+        """Return the initial values as two arrays (order, ...): the rows of the
+        initial values and the initial values themselves"""
+
+        if not self.initial_values:
+            return {}
+
+        ids_initial_values, initial_values = zip(*self.initial_values)
+
+        return {"ids_initial_values": np.stack(ids_initial_values), "initial_values": np.stack(initial_values)}
+
+    def set_state(self, state: dict) -> None:
+        """Set the initial values list from the arrays of the get_state method"""
+
+        if state:
+            self.initial_values = list(zip(state["ids_initial_values"], state["initial_values"]))
+
     def transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
         """Stationarize the time serie by the order given.
         Arguments:
         - gen_df: df with one column value and a datetime index"""
 
-        # Copy the original df
-        gen_df_diff = gen_df.copy(deep = True)
+        # Differenciate a float copy of the values, and re-create a df
+        gen_df_diff = self.transform_array(gen_df.to_numpy(dtype = float, copy = True))
 
-        # Case order == 0, just return the copy
-        if not self.order:
-            return gen_df_diff
+        return pd.DataFrame(gen_df_diff, index = gen_df.index, columns = gen_df.columns)
 
-        # Iterate over the order of the derivative
-        for _ in range(self.order):
+    def inverse_transform(self, gen_df_diff: pd.DataFrame) -> pd.DataFrame:
+        """Un-stationarize the time serie whatever its order.
+        Note: The transform method must be called before the inverse_transform method.
+        Arguments:
+        - gen_df: df with one column value and a datetime index"""
 
-            # 1/ Extract the id of the initial value and the initial value and store them into initial values list #
+        # Integrate a float copy of the values, and re-create a df
+        gen_df_undiff = self.inverse_transform_array(gen_df_diff.to_numpy(dtype = float, copy = True))
 
-            # Row number of the first non null value (the initial value)
-            id_initial_value = gen_df_diff.notnull().idxmax()
+        return pd.DataFrame(gen_df_undiff, index = gen_df_diff.index, columns = gen_df_diff.columns)
 
-            # The initial value itself
-            initial_value = gen_df_diff.loc[id_initial_value].values[0][0]
+    def transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Stationarize an array by the order given, in place, and return it.
+        The first value of each order of differenciation becomes nan, as with
+        the pandas diff method.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
 
-            # We pack the id and its initial value into a tuple
-            initial_value_tuple = (id_initial_value, initial_value)
+        # The differenciation runs along the rows of a same serie
+        self.check_no_series(series)
 
-            # Add the first non null value of the time serie to the initial values list
-            self.initial_values.append(initial_value_tuple)
+        # Initialize the initial values of this transformation
+        self.initial_values = list()
 
-            # 2/ Differenciate sequentially the gen_df_diff #
-            gen_df_diff = gen_df_diff.diff()
+        # Case order == 0, the values are left as they are
+        if not self.order:
+            return values
 
-        return gen_df_diff
+        if len(values) <= self.order:
+            raise ValueError("The time serie is too short for the order of differenciation")
 
-    def inverse_transform(self, gen_df_diff: pd.DataFrame) -> pd.DataFrame:
-        """Un-stationarize the time serie whatever its order.
+        # Iterate over the order of the derivative
+        for order in range(self.order):
+
+            # 1/ Extract the row of the first non null value (the initial value) of the values differenciated
+            # "order" times, for each column: the first row whose window of the order + 1 last values is complete.
+            # Compute the initial value itself from this window, and store them into the initial values list #
+            id_initial_value = find_first_complete_windows(values, order + 1)
+
+            initial_value = sum(weight * np.take_along_axis(values, np.expand_dims(id_initial_value - order + i, 0), axis = 0)[0]
+                                for i, weight in enumerate(compute_differences_weights(order)))
+            self.initial_values.append((id_initial_value, initial_value))
+
+        # 2/ Differenciate the values by the order in one pass, in one float64 buffer whatever
+        # the dtype of the values, to avoid the cancellation of large close values #
+        values_diff = difference_array(values.astype(np.float64), self.order, inplace = True)
+
+        # Write back into the values
+        values[self.order:] = values_diff
+        values[:self.order] = np.nan
+
+        return values
+
+    def inverse_transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Un-stationarize an array whatever its order, in place, and return it.
         Note: The transform method must be called before the inverse_transform method.
         Arguments:
-        - gen_df: df with one column value and a datetime index"""
+        - values: 1D array of a stationarized time serie, or 2D array with one time
+        serie per column"""
+
+        # The differenciation runs along the rows of a same serie
+        self.check_no_series(series)
 
         # First check if the initial values list is empty and if it is, raise an exception
-        if not self.initial_values:
+        if not self.initial_values and self.order:
             raise NotTransformedError(f"{self.error_message}")
 
-        # Copy the original df
-        gen_df_undiff = gen_df_diff.copy(deep = True)
+        # Case order == 0, the values are left as they are
+        if not self.order:
+            return values
+
+        # Integrate in one float64 buffer, to avoid the accumulation of rounding errors
+        values_undiff = values.astype(np.float64)
 
         # Iterate over the inverted initial values list
-        for initial_value_tuple in self.initial_values[::-1]:
-            # Unpack the row number and its initial value
-            id_initial_value, initial_value = initial_value_tuple
+        for id_initial_value, initial_value in self.initial_values[::-1]:
 
-            # Add the initial value to the gen_df_undiff
+            # Add the initial value to the values, at its row in each column.
             # The initial value act as the "constant of integration"
-            gen_df_undiff.loc[id_initial_value] = initial_value
+            np.put_along_axis(values_undiff, np.expand_dims(id_initial_value, 0), initial_value, axis = 0)
+
+            # Cumsum the values in place. The cumsum act as an integral,
+            # and the nans are kept as with the pandas cumsum method
+            missing = np.isnan(values_undiff)
+            np.nancumsum(values_undiff, axis = 0, out = values_undiff)
+            values_undiff[missing] = np.nan
 
-            # Cumsum the gen_df_undiff.
-            # The cumsum act as an integral
-            gen_df_undiff = gen_df_undiff.cumsum()
+        # Write back into the values
+        values[...] = values_undiff
 
-        return gen_df_undiff
+        return values
+
+    def inverse_transform_forecast(self, forecasts: np.ndarray, tail_values: np.ndarray) -> np.ndarray:
+        """Un-stationarize forecasts of the differenciated values from the last values
+        known before them, without the history of the time serie (see integrate_forecast).
+        Return a new float64 array.
+        Arguments:
+        - forecasts: 2D array (n_samples, horizon) of the forecasted differenciated values,
+        one forecast per row
+        - tail_values: 2D array (n_samples, order) of the last order values known before each
+        forecast, the oldest first"""
+
+        return integrate_forecast(forecasts, tail_values, self.order)
 
 
 class VolatilityRemoverTs(BaseTsScaler):
 
+    params_attributes = ("window_size",)
+    state_attributes = ("volatility",)
+
     def __init__(self, window_size: int = 1) -> None:
         """Initialize self.volatility and the
         error message used in case of error handling."""
@@ -270,9 +793,55 @@ class VolatilityRemoverTs(BaseTsScaler):
         # Multiply by the volatility
         return gen_df * self.volatility
 
+    def fit_array(self, values: np.ndarray) -> None:
+        """Extract the seasonal volatility of each column of an array.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+        # Compute the volatility with the rolling statistics kernel
+        _, rolling_std = compute_rolling_statistics(values, [self.window_size])[self.window_size]
+        self.volatility = backfill_array(rolling_std)
+
+    def transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Remove the volatility of an array in place, and return it. The array must
+        be aligned with the fitted values.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+        # The fitted state is aligned on the fitted rows
+        self.check_no_series(series)
+
+        # Raise the not fitted error if the transform method is called before fit
+        if isinstance(self.volatility, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        values /= np.asarray(self.volatility, dtype = values.dtype).reshape(values.shape)
+
+        return values
+
+    def inverse_transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Re-add the volatility to an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie without volatility, or 2D array with one
+        time serie per column"""
+
+        # The fitted state is aligned on the fitted rows
+        self.check_no_series(series)
+
+        # Raise the not fitted error if the inverse_transform method is called before fit
+        if isinstance(self.volatility, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        values *= np.asarray(self.volatility, dtype = values.dtype).reshape(values.shape)
+
+        return values
+
 
 class AverageSeasonalityRemoverTs(BaseTsScaler):
 
+    params_attributes = ("window_size",)
+    state_attributes = ("avg_seasonality",)
+
     def __init__(self, window_size: int = 1) -> None:
         """Initialize self.avg_seasonality and the
         error message used in case of error handling."""
@@ -320,12 +889,308 @@ class AverageSeasonalityRemoverTs(BaseTsScaler):
         # Multiply by the avg_seasonality
         return gen_df + self.avg_seasonality
 
+    def fit_array(self, values: np.ndarray) -> None:
+        """Extract the seasonal avg_seasonality of each column of an array.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+        # Compute the avg_seasonality with the rolling statistics kernel
+        rolling_mean, _ = compute_rolling_statistics(values, [self.window_size])[self.window_size]
+        self.avg_seasonality = backfill_array(rolling_mean)
+
+    def transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Remove the avg_seasonality of an array in place, and return it. The array must
+        be aligned with the fitted values.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+        # The fitted state is aligned on the fitted rows
+        self.check_no_series(series)
+
+        # Raise the not fitted error if the transform method is called before fit
+        if isinstance(self.avg_seasonality, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        values -= np.asarray(self.avg_seasonality, dtype = values.dtype).reshape(values.shape)
+
+        return values
+
+    def inverse_transform_array(self, values: np.ndarray, series: np.ndarray | None = None) -> np.ndarray:
+        """Re-add the avg_seasonality to an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie without avg_seasonality, or 2D array with one
+        time serie per column"""
+
+        # The fitted state is aligned on the fitted rows
+        self.check_no_series(series)
+
+        # Raise the not fitted error if the inverse_transform method is called before fit
+        if isinstance(self.avg_seasonality, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        values += np.asarray(self.avg_seasonality, dtype = values.dtype).reshape(values.shape)
+
+        return values
+
+
+class BaseProfileRemoverTs(BaseTsScaler):
+    """Base of the seasonal removers fitted on a compact per period profile: the values
+    are grouped by their slot in the period (for example the 24 hours of a day, or the 96
+    quarter hours of a day), and the number of values, their sum and the sum of their squares
+    are kept for each slot and each column. The profile can be applied to any timestamps, and
+    can be fitted incrementally."""
+
+    params_attributes = ("period", "step")
+    state_attributes = ("count", "sum", "sum_squares")
+    uses_timestamps = True
+    incremental = True
+
+    def __init__(self, period: int = 24, step: str = "1H") -> None:
+        """Initialize the period, the time step and the statistics of the slots.
+        Parameters:
+        - period: the number of slots of the period
+        - step: the time step of the slots, for example 1H or 15min"""
+
+        # Bring back the arguments defined inside the inherited init method
+        super().__init__()
+
+        # Init the period and the time step of the slots
+        self.period = period
+        self.step = step
+
+        # Set the statistics of the slots to 0, for the error handling
+        self.count, self.sum, self.sum_squares = (0, 0, 0)
+
+    def compute_slots(self, timestamps: pd.DatetimeIndex | np.ndarray) -> np.ndarray:
+        """Return the slot in the period of timestamps, counted in time steps from a monday
+        at midnight (so that a period of a day or of a week starts at midnight). The slots of
+        timezone aware timestamps are computed on their local time.
+        Arguments:
+        - timestamps: the timestamps, of any shape"""
+
+        # Use the local time of the timezone aware timestamps
+        if isinstance(timestamps, pd.DatetimeIndex) and timestamps.tz is not None:
+            timestamps = timestamps.tz_localize(None)
+
+        timestamps = np.asarray(timestamps, dtype = "datetime64[ns]").view(np.int64)
+        origin = pd.Timestamp("1970-01-05").value
+        step = pd.Timedelta(self.step).value
+
+        return (timestamps - origin) // step % self.period
+
+    def fit(self, gen_df: pd.DataFrame) -> None:
+        """Fit the profile on a time serie df
+        Arguments:
+        - gen_df: df with one or more value columns and a datetime index"""
+
+        self.fit_array(gen_df.to_numpy(dtype = np.float64), timestamps = gen_df.index)
+
+    def partial_fit(self, gen_df: pd.DataFrame) -> None:
+        """Update the profile with a new chunk of a time serie df
+        Arguments:
+        - gen_df: df with one or more value columns and a datetime index"""
+
+        self.partial_fit_array(gen_df.to_numpy(dtype = np.float64), timestamps = gen_df.index)
+
+    def fit_array(self, values: np.ndarray, timestamps: pd.DatetimeIndex | np.ndarray = None) -> None:
+        """Fit the profile on an array.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        - timestamps: the timestamps of the rows of the values"""
+
+        # Reset the statistics of the slots, and fit them on the whole array
+        self.count, self.sum, self.sum_squares = (0, 0, 0)
+
+        self.partial_fit_array(values, timestamps = timestamps)
+
+    def partial_fit_array(self, values: np.ndarray, timestamps: pd.DatetimeIndex | np.ndarray = None) -> None:
+        """Update the statistics of the slots with a new chunk of an array, in one grouped
+        pass (one bincount per statistic), ignoring the nans.
+        Arguments:
+        - values: 1D array of a chunk of a time serie, or 2D array with one time serie per column
+        - timestamps: the timestamps of the rows of the values"""
+
+        if timestamps is None:
+            raise ValueError(f"The {type(self).__name__} needs the timestamps of the values")
+
+        slots = self.compute_slots(timestamps)
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0).astype(np.float64)
+
+        # One group per slot and column
+        nb_columns = values[0].size
+        groups = (slots.reshape(-1, 1) * nb_columns + np.arange(nb_columns)).ravel()
+        nb_groups = self.period * nb_columns
+
+        def grouped_sum(weights: np.ndarray) -> np.ndarray:
+            return np.bincount(groups, weights = weights.ravel(), minlength = nb_groups).reshape((self.period,) + values.shape[1:])
+
+        # Add the statistics of the chunk to the fitted ones, updated together once all are computed
+        count = self.count + grouped_sum(present)
+        values_sum = self.sum + grouped_sum(values)
+        sum_squares = self.sum_squares + grouped_sum(values ** 2)
+
+        self.count, self.sum, self.sum_squares = count, values_sum, sum_squares
+
+    def compute_profiles(self) -> tuple:
+        """Return the mean and the (unbiased) std of the values of each slot and each
+        column, as two (period, ...) arrays"""
+
+        # Raise the not fitted error if the profile is used before fit
+        if isinstance(self.count, int):
+            raise NotFittedError(f"{self.error_message}")
+
+        with np.errstate(all = "ignore"):
+            mean = self.sum / self.count
+            std = np.sqrt(np.maximum(self.sum_squares - self.sum * mean, 0) / (self.count - 1))
+
+        return mean, std
+
+    def gather_profile(self,
+                       profile: np.ndarray,
+                       values: np.ndarray,
+                       timestamps: pd.DatetimeIndex | np.ndarray,
+                       series: np.ndarray | None = None
+                       ) -> np.ndarray:
+        """Return the profile at the timestamps of the values, with the dtype of the values.
+        Arguments:
+        - profile: a (period, ...) profile
+        - values: the array to transform
+        - timestamps: the timestamps of the rows of the values, or when series is given,
+        the timestamps of the values (of their shape, or of the shape of one row)
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row
+        of the values"""
+
+        if timestamps is None:
+            raise ValueError(f"The {type(self).__name__} needs the timestamps of the values")
+
+        slots = self.compute_slots(timestamps)
+        profile = profile.astype(values.dtype, copy = False)
+
+        # Case the columns of the values are the fitted columns
+        if series is None:
+            return profile[slots]
+
+        # Otherwise, the profile of the serie of each row
+        return profile[slots, np.asarray(series).reshape(-1, 1)]
+
+    def transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
+        """Remove the profile of the time serie.
+        Arguments:
+        - gen_df: df with one or more value columns and a datetime index"""
+
+        values = self.transform_array(gen_df.to_numpy(dtype = float, copy = True), timestamps = gen_df.index)
+
+        return pd.DataFrame(values, index = gen_df.index, columns = gen_df.columns)
+
+    def inverse_transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
+        """Re-add the profile to the time serie.
+        Arguments:
+        - gen_df: df with one or more value columns and a datetime index"""
+
+        values = self.inverse_transform_array(gen_df.to_numpy(dtype = float, copy = True), timestamps = gen_df.index)
+
+        return pd.DataFrame(values, index = gen_df.index, columns = gen_df.columns)
+
+
+class AverageProfileRemoverTs(BaseProfileRemoverTs):
+    """Remove the mean of the slot of each value in the period (for example the mean of
+    each hour of the day), the per period counterpart of the AverageSeasonalityRemoverTs."""
+
+    def transform_array(self,
+                        values: np.ndarray,
+                        series: np.ndarray | None = None,
+                        timestamps: pd.DatetimeIndex | np.ndarray = None
+                        ) -> np.ndarray:
+        """Remove the average profile of an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        - timestamps: the timestamps of the values (see the gather_profile method)
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row"""
+
+        mean, _ = self.compute_profiles()
+        values -= self.gather_profile(mean, values, timestamps, series)
+
+        return values
+
+    def inverse_transform_array(self,
+                                values: np.ndarray,
+                                series: np.ndarray | None = None,
+                                timestamps: pd.DatetimeIndex | np.ndarray = None
+                                ) -> np.ndarray:
+        """Re-add the average profile to an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        - timestamps: the timestamps of the values (see the gather_profile method)
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row"""
+
+        mean, _ = self.compute_profiles()
+        values += self.gather_profile(mean, values, timestamps, series)
+
+        return values
+
+
+class VolatilityProfileRemoverTs(BaseProfileRemoverTs):
+    """Divide each value by the std of its slot in the period (for example the std of each
+    hour of the day), the per period counterpart of the VolatilityRemoverTs. The slots with
+    a null or undefined std (for example the night hours of a solar serie) are left as they are."""
+
+    def compute_volatility(self) -> np.ndarray:
+        """Return the std profile, with the null or undefined stds replaced by 1"""
+
+        _, std = self.compute_profiles()
+
+        return np.where(std > 0, std, 1)
+
+    def transform_array(self,
+                        values: np.ndarray,
+                        series: np.ndarray | None = None,
+                        timestamps: pd.DatetimeIndex | np.ndarray = None
+                        ) -> np.ndarray:
+        """Remove the volatility profile of an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        - timestamps: the timestamps of the values (see the gather_profile method)
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row"""
+
+        values /= self.gather_profile(self.compute_volatility(), values, timestamps, series)
+
+        return values
+
+    def inverse_transform_array(self,
+                                values: np.ndarray,
+                                series: np.ndarray | None = None,
+                                timestamps: pd.DatetimeIndex | np.ndarray = None
+                                ) -> np.ndarray:
+        """Re-add the volatility profile to an array in place, and return it.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        - timestamps: the timestamps of the values (see the gather_profile method)
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row"""
+
+        values *= self.gather_profile(self.compute_volatility(), values, timestamps, series)
+
+        return values
+
 
 class PipelineTs(BaseTsScaler):
 
-    def __init__(self, scalers: list[tuple]) -> None:
+    incremental = True
+
+    def __init__(self, scalers: list[tuple], dtype = np.float64) -> None:
         """Set the scalers list of tuples and the scalers_list
-        to store fitted scaler instances."""
+        to store fitted scaler instances.
+        Arguments:
+        - scalers: list of tuples (step name, scaler object, parameters dict)
+        Parameters:
+        - dtype: the dtype of the buffers created by the to_buffer method for the array
+        methods, np.float32 halves their memory at the cost of the precision. The df methods
+        always run on float64 buffers, so that their round trip keeps the values"""
 
         # Bring back the arguments defined inside the inherited init method
         super().__init__()
@@ -334,15 +1199,186 @@ class PipelineTs(BaseTsScaler):
         # object and the parameters of this object in form of a dict
         self.scalers = scalers
 
+        # Dtype of the buffers of the array methods
+        self.dtype = dtype
+
         # List where to store fitted scaler instances
         self.scalers_list = list()
 
+        # Names of the fitted columns, when fitted on a df
+        self.columns = None
+
     def fit(self, gen_df: pd.DataFrame) -> None:
         """Apply the fit methods from the scaler objects
         iteratively to the time serie df.
         Arguments:
         - gen_df: gen_df: df with one column value and a datetime index"""
 
+        # Fit the scalers on the float64 values of the df
+        self.fit_array(gen_df.to_numpy(dtype = np.float64), timestamps = get_timestamps(gen_df))
+
+        # Keep the names of the fitted columns, to transform any subset of them
+        self.columns = list(gen_df.columns)
+
+    def get_series_codes(self, series_names: list | pd.Index | pd.Series) -> np.ndarray:
+        """Return the positions among the fitted columns of series names, for example
+        the serie of each sample of a multi horizon dataset.
+        Arguments:
+        - series_names: the names of the series"""
+
+        return pd.Index(self.columns).get_indexer(series_names)
+
+    def transform_df_values(self, gen_df: pd.DataFrame, inverse = False) -> pd.DataFrame:
+        """Transform or inverse transform the values of a df in one float64 buffer. When
+        the df has only some of the fitted columns, or in another order, the buffer is
+        transposed to transform each column with the parameters of its fitted column."""
+
+        transform_array = self.inverse_transform_array if inverse else self.transform_array
+
+        # Case the columns of the df are the fitted columns (or the pipeline was fitted on an array)
+        if self.columns is None or list(gen_df.columns) == self.columns:
+            values = transform_array(gen_df.to_numpy(dtype = np.float64, copy = True), timestamps = get_timestamps(gen_df))
+
+        # Otherwise transform the columns as rows, each with the parameters of its serie
+        else:
+            series = self.get_series_codes(gen_df.columns)
+
+            if (series < 0).any():
+                raise ValueError("The df has columns on which the pipeline was not fitted")
+
+            values = transform_array(np.array(gen_df.to_numpy(dtype = np.float64).T),
+                                     series = series,
+                                     timestamps = get_timestamps(gen_df)).T
+
+        return pd.DataFrame(values, index = gen_df.index, columns = gen_df.columns)
+
+    def transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
+        """Apply the transform methods from the scaler objects
+        iteratively to the time serie df.
+        Arguments:
+        - gen_df: df with one column value and a datetime index"""
+
+        # Copy the values of the gen_df into one buffer, transformed in place
+        return self.transform_df_values(gen_df)
+
+    def inverse_transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
+        """Apply the inverse_transform methods from the scaler objects
+        iteratively to the time serie df.
+        Arguments:
+        - gen_df: df with one column value and a datetime index"""
+
+        # Copy the values of the gen_df into one buffer, inverse transformed in place
+        return self.transform_df_values(gen_df, inverse = True)
+
+    def partial_fit(self, gen_df: pd.DataFrame) -> None:
+        """Update the fitted scaler instances with a new chunk of the time serie df.
+        Arguments:
+        - gen_df: df with one column value and a datetime index"""
+
+        self.partial_fit_array(gen_df.to_numpy(dtype = np.float64), timestamps = get_timestamps(gen_df))
+
+        # Keep the names of the fitted columns
+        self.columns = list(gen_df.columns)
+
+    def partial_fit_array(self, values: np.ndarray, timestamps: pd.DatetimeIndex | np.ndarray = None) -> None:
+        """Update the fitted scaler instances with a new chunk of an array. The scaler
+        instances are created at the first call. All the scalers of the pipeline must
+        support the incremental fit. The update is all or nothing: if a scaler raises,
+        the pipeline is left as it was before the call.
+        Arguments:
+        - values: 1D array of a chunk of a time serie, or 2D array with one time serie per column
+        Parameters:
+        - timestamps: the timestamps of the rows of the values, for the scalers using them"""
+
+        # Verify every scaler can be fitted incrementally, before fitting any of them
+        not_incremental_steps = [step_name for step_name, scaler_object, _ in self.scalers if not scaler_object.incremental]
+        if not_incremental_steps:
+            raise NotIncrementalError(f"The steps {not_incremental_steps} of the pipeline can't be fitted incrementally")
+
+        # Update copies of the scaler instances, instanciated at the first chunk
+        if not len(self.scalers_list):
+            scalers_list = [scaler_object(**kwargs) for _, scaler_object, kwargs in self.scalers]
+        else:
+            scalers_list = copy.deepcopy(self.scalers_list)
+
+        for scaler_instance in scalers_list:
+            scaler_instance.partial_fit_array(values, **self.get_timestamps_kwargs(scaler_instance, timestamps))
+
+        # Keep the updated scaler instances only once every scaler is updated
+        self.scalers_list = scalers_list
+
+    def get_params(self) -> dict:
+        """Return the steps of the pipeline, with the names of the scaler objects,
+        and the dtype of the pipeline"""
+
+        return {"scalers": [[step_name, scaler_object.__name__, kwargs] for step_name, scaler_object, kwargs in self.scalers],
+                "dtype": np.dtype(self.dtype).name}
+
+    @classmethod
+    def from_params(cls, params: dict) -> "PipelineTs":
+        """Instanciate the pipeline from its steps, with the names of the scaler objects"""
+
+        scalers = [(step_name, SCALERS_OBJECTS[scaler_name], kwargs) for step_name, scaler_name, kwargs in params["scalers"]]
+
+        return cls(scalers, dtype = np.dtype(params["dtype"]))
+
+    def get_state(self) -> dict:
+        """Return the fitted states of the scaler instances, with their keys prefixed
+        by their position in the pipeline"""
+
+        state = {f"{position}__{key}": value
+                 for position, scaler_instance in enumerate(self.scalers_list)
+                 for key, value in scaler_instance.get_state().items()}
+
+        # Add the names of the fitted columns
+        if self.columns is not None:
+            state["columns"] = np.array(self.columns, dtype = str)
+
+        return state
+
+    def set_state(self, state: dict) -> None:
+        """Re-create the fitted scaler instances from their fitted states"""
+
+        # Case the pipeline was saved before being fitted
+        if not state:
+            return
+
+        self.scalers_list = list()
+
+        # Names of the fitted columns
+        if "columns" in state:
+            self.columns = state.pop("columns").tolist()
+
+        for position, (_, scaler_object, kwargs) in enumerate(self.scalers):
+            scaler_instance = scaler_object(**kwargs)
+            scaler_instance.set_state({key.split("__", 1)[1]: value for key, value in state.items()
+                                       if key.split("__", 1)[0] == str(position)})
+            self.scalers_list.append(scaler_instance)
+
+    def to_buffer(self, values: np.ndarray) -> np.ndarray:
+        """Copy values into a new buffer of the dtype of the pipeline, to be transformed
+        in place by the array methods.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column"""
+
+        return np.array(values, dtype = self.dtype)
+
+    def get_timestamps_kwargs(self, scaler_instance: BaseTsScaler, timestamps: pd.DatetimeIndex | np.ndarray) -> dict:
+        """Return the timestamps keyword argument for the scalers using them, nothing for the others"""
+
+        return {"timestamps": timestamps} if scaler_instance.uses_timestamps else {}
+
+    def fit_array(self, values: np.ndarray, timestamps: pd.DatetimeIndex | np.ndarray = None) -> None:
+        """Apply the fit methods from the scaler objects to an array.
+        Arguments:
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        Parameters:
+        - timestamps: the timestamps of the rows of the values, for the scalers using them"""
+
+        # Reset the fitted scaler instances and the names of the fitted columns
+        self.scalers_list = list()
+        self.columns = None
+
         # Iterate over the scaler tuples
         for scaler in self.scalers:
             # Unpack the step name, the scaler object and the params
@@ -353,48 +1389,72 @@ class PipelineTs(BaseTsScaler):
             scaler_instance = scaler_object(**kwargs)
 
             # Fit the scaler instance
-            scaler_instance.fit(gen_df)
+            scaler_instance.fit_array(values, **self.get_timestamps_kwargs(scaler_instance, timestamps))
 
             # Add the fitted scaler instance to the scalers_list
             self.scalers_list.append(scaler_instance)
 
-    def transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
+    def transform_array(self,
+                        values: np.ndarray,
+                        series: np.ndarray | None = None,
+                        timestamps: pd.DatetimeIndex | np.ndarray = None
+                        ) -> np.ndarray:
         """Apply the transform methods from the scaler objects
-        iteratively to the time serie df.
+        iteratively to an array, in place, and return it.
         Arguments:
-        - gen_df: df with one column value and a datetime index"""
+        - values: 1D array of a time serie, or 2D array with one time serie per column
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row
+        of the values, to transform series stacked in rows in one call
+        - timestamps: the timestamps of the values, for the scalers using them"""
 
         # Check if the pipeline was fitted
         if not len(self.scalers_list):
             raise NotFittedError(self.error_message)
 
-        # Copy the gen_df
-        gen_df_transformed = gen_df.copy(deep = True)
-
-        # Iterate over the scalers_list
+        # Iterate over the scalers_list, each scaler instance transforms the buffer in place
         for scaler_instance in self.scalers_list:
-            # For each scaler instance, call the transform method
-            gen_df_transformed = scaler_instance.transform(gen_df_transformed)
+            values = scaler_instance.transform_array(values,
+                                                     series = series,
+                                                     **self.get_timestamps_kwargs(scaler_instance, timestamps))
 
-        return gen_df_transformed
+        return values
 
-    def inverse_transform(self, gen_df: pd.DataFrame) -> pd.DataFrame:
+    def inverse_transform_array(self,
+                                values: np.ndarray,
+                                series: np.ndarray | None = None,
+                                timestamps: pd.DatetimeIndex | np.ndarray = None
+                                ) -> np.ndarray:
         """Apply the inverse_transform methods from the scaler objects
-        iteratively to the time serie df.
+        iteratively to an array, in place, and return it.
         Arguments:
-        - gen_df: df with one column value and a datetime index"""
+        - values: 1D array of a transformed time serie, or 2D array with one time
+        serie per column
+        Parameters:
+        - series: if given, the position among the fitted columns of the serie of each row
+        of the values, for example the forecasts of a whole panel stacked in rows
+        - timestamps: the timestamps of the values, for the scalers using them (for
+        stacked forecasts, an array of the shape of the values)"""
 
         # Check if the pipeline was fitted
         if not len(self.scalers_list):
             raise NotFittedError(self.error_message)
 
-        # Copy the gen_df
-        gen_df_inverse_transformed = gen_df.copy(deep = True)
-
         # Iterate over the inverted scalers_list to apply back the
         # inverse transformation corresponding to the right transformation
         for scaler_instance in self.scalers_list[::-1]:
-            # Call the inverse_transform method for each scaler instance
-            gen_df_inverse_transformed = scaler_instance.inverse_transform(gen_df_inverse_transformed)
+            values = scaler_instance.inverse_transform_array(values,
+                                                             series = series,
+                                                             **self.get_timestamps_kwargs(scaler_instance, timestamps))
+
+        return values
+
 
-        return gen_df_inverse_transformed
+# Scaler objects by name, used to load the saved scalers
+SCALERS_OBJECTS = {scaler_object.__name__: scaler_object for scaler_object in (NormalScalerTs,
+                                                                               StationarizerTs,
+                                                                               VolatilityRemoverTs,
+                                                                               AverageSeasonalityRemoverTs,
+                                                                               AverageProfileRemoverTs,
+                                                                               VolatilityProfileRemoverTs,
+                                                                               PipelineTs)}
@@ -1,12 +1,14 @@
 # Imports
+import numpy as np
 import pandas as pd
 
 # Handle missing values with scikit learn
 from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import KNNImputer, IterativeImputer
 
+from re_forecast.exploration.compute_statistics import GapIndex
 from re_forecast.preprocessing.clean_values import peel_time_serie_df
-from re_forecast.preprocessing.make_supervised import transform_dt_df_into_supervised
+from re_forecast.preprocessing.make_supervised import transform_dt_df_into_supervised_matrix
 
 
 def interpolate_time_serie_df(gen_df: pd.DataFrame,
@@ -34,10 +36,92 @@ def interpolate_time_serie_df(gen_df: pd.DataFrame,
     return gen_df
 
 
+def local_knn_impute_matrix(X: np.ndarray,
+                            param: int,
+                            window: int,
+                            period: int | None = None
+                            ) -> np.ndarray:
+    """Impute the first column of a supervised matrix with a local KNN search. The
+    neighbours are only computed for the rows whose first column is missing, and they are
+    searched among the rows with a non missing first column inside a bounded temporal window
+    around the row (and at a whole number of periods from it if a period is given). The
+    distances are nan euclidean distances, as in the scikit-learn KNNImputer. When no
+    distance can be computed, the row is imputed with the mean of the window, and when the
+    window holds no neighbour, with the mean of all the non missing values.
+    Return the first column imputed.
+    Arguments:
+    - X: the supervised matrix, with the value column first followed by its lags
+    - param: the number of closest neighbours
+    - window: the maximal number of time steps between a row and its neighbours
+    Parameters:
+    - period: if given, the neighbours are searched only at a whole number of periods from
+    the row (seasonal window), for example 24 for the same hour of the day on hourly data"""
+
+    # Copy the first column, to be imputed
+    values_imputed = np.array(X[:, 0], dtype = float)
+
+    # Rows to impute (receivers) and rows which can be neighbours (donors)
+    receivers_rows = np.flatnonzero(np.isnan(X[:, 0]))
+    donors_rows = np.flatnonzero(~np.isnan(X[:, 0]))
+
+    if len(receivers_rows) and not len(donors_rows):
+        raise ValueError("The time serie has no non missing value to impute it from")
+
+    # Mean of the non missing values, for the receivers without any neighbour in their window
+    global_mean = X[donors_rows, 0].mean() if len(donors_rows) else np.nan
+
+    # Bounds of the temporal window of each receiver among the sorted donors, found at once
+    windows_starts = np.searchsorted(donors_rows, receivers_rows - window, side = "left")
+    windows_ends = np.searchsorted(donors_rows, receivers_rows + window, side = "right")
+
+    # Number of columns, used to weight the nan euclidean distances
+    nb_columns = X.shape[1]
+
+    # Iterate over the receivers only
+    for row, window_start, window_end in zip(receivers_rows, windows_starts, windows_ends):
+        # Candidate neighbours inside the window
+        candidates_rows = donors_rows[window_start:window_end]
+
+        if period:
+            candidates_rows = candidates_rows[(candidates_rows - row) % period == 0]
+
+        # Case no candidate inside the window: impute with the mean of the serie, as the
+        # scikit-learn KNNImputer does when a row has no neighbour
+        if not len(candidates_rows):
+            values_imputed[row] = global_mean
+            continue
+
+        # Nan euclidean distances between the receiver and the candidates
+        candidates = X[candidates_rows]
+        diffs = candidates - X[row]
+        present = ~np.isnan(diffs)
+        nb_present = present.sum(axis = 1)
+        squared_distances = np.where(present, diffs, 0) ** 2
+
+        distances = np.full(len(candidates_rows), np.inf)
+        computable = nb_present > 0
+        distances[computable] = squared_distances[computable].sum(axis = 1) * nb_columns / nb_present[computable]
+
+        # Case no distance can be computed: impute with the mean of the window
+        if not computable.any():
+            values_imputed[row] = candidates[:, 0].mean()
+            continue
+
+        # Average the first column of the closest neighbours
+        nb_neighbours = min(param, computable.sum())
+        neighbours = np.argpartition(distances, nb_neighbours - 1)[:nb_neighbours]
+        values_imputed[row] = candidates[neighbours, 0].mean()
+
+    return values_imputed
+
+
 def knn_impute(gen_df: pd.DataFrame,
                value_col: str,
                param: int,
                nb_supervised_features: int = 24,
+               search: str = "global",
+               window: int = 720,
+               period: int | None = None
                ) -> pd.DataFrame:
     """Impute a time serie df with the KNN method from scikit-learn.
     Arguments:
@@ -47,29 +131,26 @@ def knn_impute(gen_df: pd.DataFrame,
     closest neighbours
     Parameters:
     - nb_supervised_features: number of features to add to the time serie df to transform
-    it into a df suited for supervised learning algorithms"""
+    it into a df suited for supervised learning algorithms
+    - search: "global" to fit the scikit-learn KNNImputer on the whole supervised matrix,
+    "window" to search the neighbours of the missing values only, inside a bounded window
+    (see the local_knn_impute_matrix function). The "window" search scales linearly with the
+    length of the time serie
+    - window: for the "window" search, the maximal number of time steps between a missing
+    value and its neighbours
+    - period: for the "window" search, if given, the neighbours are searched only at a whole
+    number of periods from the missing value (seasonal window)"""
 
     # Detect if the df has a dt index. If it doesn't, transform into a peeled df
     if gen_df.index.dtype == "int64":
         gen_df = peel_time_serie_df(gen_df)
 
-    # Transform into a supervised df
-    gen_df_supervised = transform_dt_df_into_supervised(gen_df, value_col, nb_supervised_features)
-
-    # Instanciate a KNN imputer
-    knn_imputer = KNNImputer(n_neighbors = param)
-
-    # Create the X matrix
-    X = gen_df_supervised.copy(deep = True)
-
-    # Fit the imputer
-    knn_imputer.fit(X)
-
-    # Transform
-    X_imputed = knn_imputer.transform(X)
+    # Transform into a supervised matrix, built from a strided view of the value column
+    X = transform_dt_df_into_supervised_matrix(gen_df, value_col, nb_supervised_features)
 
-    # Extract the first column of the X_imputed array, and re-create a df
-    return pd.DataFrame({"value": X_imputed[:, 0]}, index = gen_df_supervised.index)
+    # Impute the supervised matrix, and re-create a df with its first column
+    return pd.DataFrame({"value": knn_impute_matrix(X, param, search = search, window = window, period = period)},
+                        index = gen_df.index)
 
 
 def iterative_impute(gen_df: pd.DataFrame,
@@ -91,20 +172,288 @@ def iterative_impute(gen_df: pd.DataFrame,
     if gen_df.index.dtype == "int64":
         gen_df = peel_time_serie_df(gen_df)
 
-    # Transform into a supervised df
-    gen_df_supervised = transform_dt_df_into_supervised(gen_df, value_col, nb_supervised_features)
+    # Transform into a supervised matrix, built from a strided view of the value column
+    X = transform_dt_df_into_supervised_matrix(gen_df, value_col, nb_supervised_features)
+
+    # Impute the supervised matrix, and re-create a df with its first column
+    return pd.DataFrame({"value": iterative_impute_matrix(X, param)}, index = gen_df.index)
+
+
+def knn_impute_matrix(X: np.ndarray,
+                      param: int,
+                      search: str = "global",
+                      window: int = 720,
+                      period: int | None = None
+                      ) -> np.ndarray:
+    """Impute a supervised matrix with the KNN method, and return its first column imputed.
+    See the knn_impute function for the parameters.
+    Arguments:
+    - X: the supervised matrix, with the value column first followed by its lags
+    - param: the number of closest neighbours"""
+
+    # Case of the local search, only the missing values are imputed
+    if search == "window":
+        return local_knn_impute_matrix(X, param, window, period = period)
+
+    # Instanciate a KNN imputer
+    knn_imputer = KNNImputer(n_neighbors = param)
+
+    # Fit the imputer
+    knn_imputer.fit(X)
+
+    # Transform
+    X_imputed = knn_imputer.transform(X)
+
+    # Extract the first column of the X_imputed array
+    return X_imputed[:, 0]
+
+
+def iterative_impute_matrix(X: np.ndarray,
+                            param: int
+                            ) -> np.ndarray:
+    """Impute a supervised matrix with the IterativeImputer method from scikit-learn,
+    and return its first column imputed.
+    Arguments:
+    - X: the supervised matrix, with the value column first followed by its lags
+    - param: the max iteration of the iterative algorithm"""
 
     # Instanciate a iterative imputer
     iterative_imputer = IterativeImputer(max_iter = param, random_state = 42)
 
-    # Create the X matrix
-    X = gen_df_supervised.copy(deep = True)
-
     # Fit the imputer
     iterative_imputer.fit(X)
 
     # Transform
     X_imputed = iterative_imputer.transform(X)
 
-    # Extract the first column of the X_imputed array, and re-create a df
-    return pd.DataFrame({"value": X_imputed[:, 0]}, index = gen_df_supervised.index)
+    # Extract the first column of the X_imputed array
+    return X_imputed[:, 0]
+
+
+def hybrid_impute(gen_df: pd.DataFrame,
+                  value_col: str,
+                  max_interpolation_gap: int = 3,
+                  long_gap_imputer: str = "knn_impute",
+                  context: int = 720,
+                  **long_gap_params
+                  ) -> pd.DataFrame:
+    """Impute a time serie df depending on the length of its gaps of missing values.
+    The gaps up to max_interpolation_gap time steps are linearly interpolated in one
+    vectorized pass. Only the longer gaps (and the gaps at the edges of the serie, which
+    can't be interpolated) are imputed by the model based imputer, run on a window of
+    context time steps around each of them instead of on the whole serie.
+    Arguments:
+    - gen_df: A consistent time serie df with one or more complete datetime columns
+    and one value column
+    - value_col: the name of the value column
+    Parameters:
+    - max_interpolation_gap: the maximal length of the gaps linearly interpolated
+    - long_gap_imputer: the imputer of the long gaps, "knn_impute" or "iterative_impute"
+    - context: the number of time steps kept before and after each long gap to impute it
+    - **long_gap_params: the parameters of the long gaps imputer (param, nb_supervised_features...)"""
+
+    # Detect if the df has a dt index. If it doesn't, transform into a peeled df
+    if gen_df.index.dtype == "int64":
+        gen_df = peel_time_serie_df(gen_df)
+
+    # Copy the values, to be imputed
+    values = gen_df[value_col].to_numpy(dtype = float, copy = True)
+    size = len(values)
+
+    # Encode the gaps of missing values into runs
+    gap_index = GapIndex(np.isnan(values))
+    gaps_starts, gaps_lengths = gap_index.gaps()
+
+    # Case there is no missing value or no value at all to impute from
+    if len(gaps_starts) == 0 or gap_index.lengths[0] == size:
+        return pd.DataFrame({"value": values}, index = gen_df.index)
+
+    # A gap is interpolated if it is short and surrounded by known values
+    gaps_ends = gaps_starts + gaps_lengths
+    interpolated_gaps = (gaps_lengths <= max_interpolation_gap) & (gaps_starts > 0) & (gaps_ends < size)
+
+    #############################
+    # 1/ Interpolate short gaps #
+    #############################
+
+    # Rows of the short gaps, expanded from the runs at once
+    interpolated_runs = np.zeros(len(gap_index.starts), dtype = bool)
+    interpolated_runs[gap_index.values] = interpolated_gaps
+    interpolated_rows = np.flatnonzero(np.repeat(interpolated_runs, gap_index.lengths))
+
+    # Linear interpolation between the known values
+    known_rows = np.flatnonzero(~np.isnan(values))
+    values[interpolated_rows] = np.interp(interpolated_rows, known_rows, values[known_rows])
+
+    ############################################
+    # 2/ Impute long gaps inside their windows #
+    ############################################
+
+    # Windows around the long gaps, merged when they overlap
+    windows_starts = np.maximum(gaps_starts[~interpolated_gaps] - context, 0)
+    windows_ends = np.minimum(gaps_ends[~interpolated_gaps] + context, size)
+
+    merged_windows = []
+    for window_start, window_end in zip(windows_starts, windows_ends):
+        if merged_windows and window_start <= merged_windows[-1][1]:
+            merged_windows[-1][1] = max(merged_windows[-1][1], window_end)
+        else:
+            merged_windows.append([window_start, window_end])
+
+    # The long gaps imputer works on the df of the partially imputed values
+    partially_imputed_df = pd.DataFrame({value_col: values}, index = gen_df.index)
+    imputer = IMPUTERS_FUNCTIONS[long_gap_imputer]
+
+    for window_start, window_end in merged_windows:
+
+        # Impute the window, and keep only the values of its missing rows
+        window_values = values[window_start:window_end]
+        window_imputed = imputer(partially_imputed_df.iloc[window_start:window_end], value_col, **long_gap_params)
+        window_missing = np.isnan(window_values)
+        window_values[window_missing] = window_imputed["value"].to_numpy()[window_missing]
+
+    return pd.DataFrame({"value": values}, index = gen_df.index)
+
+
+# Imputers of the missing values working on a time serie df, and on a supervised matrix
+IMPUTERS_FUNCTIONS = {"knn_impute": knn_impute,
+                      "iterative_impute": iterative_impute}
+
+IMPUTERS_MATRIX_FUNCTIONS = {"knn_impute": knn_impute_matrix,
+                             "iterative_impute": iterative_impute_matrix}
+
+
+def compute_grouped_nanmedian(values: np.ndarray,
+                              groups: np.ndarray,
+                              nb_groups: int
+                              ) -> np.ndarray:
+    """Compute the median of each group of rows of a 2D array, ignoring the nans, in one
+    pass: the rows are sorted by group once and scattered in a (nb_groups, max group size,
+    nb_columns) array padded with nans. Return a (nb_groups, nb_columns) array, nan for the
+    groups without any value.
+    Arguments:
+    - values: 2D array of the values, one column per time serie
+    - groups: 1D array of the group of each row, between 0 and nb_groups - 1
+    - nb_groups: the number of groups"""
+
+    # Sort the rows by group, and find the position of each row inside its group
+    order = np.argsort(groups, kind = "stable")
+    sorted_groups = groups[order]
+    groups_sizes = np.bincount(groups, minlength = nb_groups)
+    groups_starts = np.concatenate(([0], np.cumsum(groups_sizes)[:-1]))
+    positions = np.arange(len(groups)) - groups_starts[sorted_groups]
+
+    # Scatter the rows in the padded array
+    padded_values = np.full((nb_groups, max(groups_sizes.max(), 1), values.shape[1]), np.nan)
+    padded_values[sorted_groups, positions] = values[order]
+
+    # Median of each group, the empty groups are left to nan without warning
+    with np.errstate(all = "ignore"):
+        empty_groups = np.isnan(padded_values).all(axis = 1)
+        padded_values[:, 0][empty_groups] = 0
+        medians = np.nanmedian(padded_values, axis = 1)
+
+    medians[empty_groups] = np.nan
+
+    return medians
+
+
+def compute_seasonal_profiles(gen_df: pd.DataFrame) -> np.ndarray:
+    """Compute the robust seasonal profiles of the time series of a df with a datetime
+    index: the median value for each month x weekday x hour of the day, for all the series
+    at once. The slots without any value take the median of their hour of the day.
+    Return a (12 x 7 x 24, nb_series) array, the slot of a date being
+    (month - 1) x 168 + weekday x 24 + hour.
+    Arguments:
+    - gen_df: a df with a complete datetime index and one value column per time serie"""
+
+    values = gen_df.to_numpy(dtype = float)
+    dt_index = gen_df.index
+
+    # Median per month x weekday x hour slot
+    slots = (dt_index.month.to_numpy() - 1) * 168 + dt_index.weekday.to_numpy() * 24 + dt_index.hour.to_numpy()
+    profiles = compute_grouped_nanmedian(values, slots, 12 * 7 * 24)
+
+    # Median per hour of the day, for the empty slots
+    hours_profiles = compute_grouped_nanmedian(values, dt_index.hour.to_numpy(), 24)
+    hours_profiles = np.tile(hours_profiles, (12 * 7, 1))
+
+    return np.where(np.isnan(profiles), hours_profiles, profiles)
+
+
+def seasonal_profile_impute(gen_df: pd.DataFrame,
+                            value_cols: str | list | None = None,
+                            context: int = 24,
+                            profiles: np.ndarray | None = None
+                            ) -> pd.DataFrame:
+    """Impute the gaps of one or several time series with their seasonal profiles
+    (see compute_seasonal_profiles), scaled to the level of the values surrounding each gap:
+    the profile of a gap is multiplied by the ratio between the sum of the known values and
+    the sum of the profile over the context time steps before and after the gap. The gaps
+    without known values around them, or with a null profile around them, are not scaled.
+    The profiles are computed for all the series in one pass, and the scaling in O(n).
+    Return a df of the imputed value columns, with the index of the df.
+    Arguments:
+    - gen_df: a df with a complete datetime index and one value column per time serie,
+    as constructed by the construct_time_consistent_panel function, or a consistent time
+    serie df
+    Parameters:
+    - value_cols: the value column or the list of value columns to impute, all the
+    columns by default
+    - context: the number of time steps before and after each gap used to scale its profile
+    - profiles: the seasonal profiles of the series, computed from the df by default"""
+
+    # Detect if the df has a dt index. If it doesn't, transform into a peeled df
+    if gen_df.index.dtype == "int64":
+        gen_df = peel_time_serie_df(gen_df)
+
+    # Select the value columns
+    if value_cols is not None:
+        gen_df = gen_df[[value_cols] if isinstance(value_cols, str) else value_cols]
+
+    values = gen_df.to_numpy(dtype = float, copy = True)
+    size = len(values)
+
+    # Compute the profiles of all the series at once, and expand them on the time grid
+    if profiles is None:
+        profiles = compute_seasonal_profiles(gen_df)
+
+    dt_index = gen_df.index
+    slots = (dt_index.month.to_numpy() - 1) * 168 + dt_index.weekday.to_numpy() * 24 + dt_index.hour.to_numpy()
+    expanded_profiles = profiles[slots]
+
+    for col in range(values.shape[1]):
+        serie = values[:, col]
+        serie_profile = expanded_profiles[:, col]
+
+        # Collect the gaps of the serie
+        known = ~np.isnan(serie)
+        gaps_starts, gaps_lengths = GapIndex(~known).gaps()
+
+        if len(gaps_starts) == 0:
+            continue
+
+        gaps_ends = gaps_starts + gaps_lengths
+
+        # Cumulated sums of the known values and of the profile over the known rows,
+        # to get the sums over the context of every gap at once
+        values_cumsum = np.concatenate(([0], np.cumsum(np.where(known, serie, 0))))
+        profile_cumsum = np.concatenate(([0], np.cumsum(np.where(known, serie_profile, 0))))
+
+        before_starts = np.maximum(gaps_starts - context, 0)
+        after_ends = np.minimum(gaps_ends + context, size)
+
+        context_values = (values_cumsum[gaps_starts] - values_cumsum[before_starts]
+                          + values_cumsum[after_ends] - values_cumsum[gaps_ends])
+        context_profile = (profile_cumsum[gaps_starts] - profile_cumsum[before_starts]
+                           + profile_cumsum[after_ends] - profile_cumsum[gaps_ends])
+
+        # Level of each gap, not scaled when the profile of its context is null
+        with np.errstate(all = "ignore"):
+            levels = np.where(np.abs(context_profile) > 0, context_values / context_profile, 1)
+
+        # Expand the level of each gap on its rows, and fill the gaps
+        gaps_rows = np.flatnonzero(~known)
+        serie[gaps_rows] = serie_profile[gaps_rows] * np.repeat(levels, gaps_lengths)
+
+    return pd.DataFrame(values, index = gen_df.index, columns = gen_df.columns)
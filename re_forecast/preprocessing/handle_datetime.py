@@ -1,7 +1,10 @@
 import datetime
+import functools
+import numpy as np
 import pandas as pd
 
-from re_forecast.params import DATE_TIME_COLUMNS
+from re_forecast.params import (DATE_TIME_COLUMNS, RESSOURCES_DATA_POINT_TIME_SPAN, UNITS_NAMES_COLS, VALUE_COL_NAME,
+                                FRENCH_FIXED_HOLIDAYS, FRENCH_EASTER_HOLIDAYS_OFFSETS, CALENDAR_FEATURES_CACHE_SIZE)
 
 
 def handle_seasonal_time(date_str: str,
@@ -67,52 +70,320 @@ def format_to_datetime(gen_df: pd.DataFrame,
     return gen_df_copy
 
 
+def select_time_grid_freq(freq: str | datetime.timedelta = "1H",
+                          ressource_nb: int | None = None,
+                          ressources_time_spans = RESSOURCES_DATA_POINT_TIME_SPAN
+                          ) -> str | datetime.timedelta:
+    """Return the time step of the time grid. If a ressource number is given,
+    the time step is the time span of one data point of this ressource, otherwise
+    the freq given is returned as it is.
+    Params:
+    - freq: default time step between each datetime point
+    - ressource_nb: the number of the ressource the time serie comes from"""
+
+    # Case no ressource given, keep the freq
+    if ressource_nb is None:
+        return freq
+
+    return ressources_time_spans[ressource_nb]
+
+
+def complete_time_grid(gen_df_dt: pd.DataFrame,
+                       dt_columns: list,
+                       freq: str | datetime.timedelta = "1H"
+                       ) -> pd.DataFrame:
+    """Reindex a df whose datetime columns are already formated on a datetime index
+    without missing values. The complete datetime index goes from the start date to the
+    end date of the first datetime column, the others complete datetime columns are
+    offset from it. Rows with a missing or duplicated date (the first one is kept), or
+    with a date outside the time grid, are dropped. Raise a ValueError if no row has a
+    reference date.
+    Arguments:
+    - gen_df_dt: The df with formated datetime columns we want to complete
+    - dt_columns: the list of datetime columns you want to complete
+    Params:
+    - freq: time step between each datetime point in order to construct a consistent datetime column"""
+
+    # 1/ Build the sorted datetime index from the reference (first) datetime column
+
+    # The first datetime column is the reference of the time grid
+    reference_col = dt_columns[0]
+
+    # Drop the rows without reference date, they cannot be placed on the time grid
+    if gen_df_dt[reference_col].isnull().any():
+        gen_df_dt = gen_df_dt.loc[gen_df_dt[reference_col].notnull(), :]
+
+    # Case there is no date left to start and end the time grid
+    if gen_df_dt.empty:
+        raise ValueError(f"The time grid can't be built: the df has no row with a date in the column {reference_col}")
+
+    # Sort the rows by date only if they are not already sorted
+    dt_index = pd.DatetimeIndex(gen_df_dt[reference_col])
+
+    if not dt_index.is_monotonic_increasing:
+        order = np.argsort(dt_index.values, kind = "stable")
+        gen_df_dt = gen_df_dt.take(order)
+        dt_index = dt_index.take(order)
+
+    # Keep only the first row for each date, the reindex needs a unique index
+    if dt_index.has_duplicates:
+        unique_dates = ~dt_index.duplicated(keep = "first")
+        gen_df_dt = gen_df_dt.loc[unique_dates, :]
+        dt_index = dt_index[unique_dates]
+
+    # 2/ Reindex the df on the complete datetime index
+
+    # Create the complete datetime index, from the first to the last date
+    complete_index = pd.date_range(dt_index[0], dt_index[-1], freq = freq)
+
+    # Reindex directly on the complete datetime index, missing dates are filled with nans
+    gen_df_complete = gen_df_dt.set_axis(dt_index, axis = 0).reindex(complete_index)
+
+    # 3/ Add the complete datetime columns in front of the df
+
+    # Iterate over the date columns
+    for i, date_col in enumerate(dt_columns):
+        # The complete column of the reference is the complete index itself, the others
+        # are offset by the difference between their first date and the reference one
+        offset = gen_df_dt[date_col].min() - dt_index[0]
+
+        # Insert the complete datetime column without copying the df
+        gen_df_complete.insert(i, f"{date_col}_complete", complete_index + offset)
+
+    # Come back to a range index, as the merge used to output
+    gen_df_complete.index = pd.RangeIndex(len(complete_index))
+
+    return gen_df_complete
+
+
 def construct_time_consistent_df(gen_df: pd.DataFrame,
                                  dt_columns: list, # start_date or/and end_date columns, not updated date column
-                                 freq = "1H",
+                                 freq: str | datetime.timedelta = "1H",
+                                 ressource_nb: int | None = None,
                                  dt_columns_all = DATE_TIME_COLUMNS
                                  ) -> pd.DataFrame:
-    """Merge the given df with a datetime column without missing values.
+    """Complete the given df with a datetime column without missing values.
     The datetime column take the start date from the existing datetime column in the df,
     and the same is done for the end date. You have to specify the datetime column
     of the given df.
     Arguments:
-    - gen_df: The df we want to merge with a consistent datetime column
+    - gen_df: The df we want to complete with a consistent datetime column
     - dt_columns: the list of datetime columns you want to complete
     Params:
-    - freq: time step between each datetime point in order to construct a consistent datetime column"""
+    - freq: time step between each datetime point in order to construct a consistent datetime column
+    - ressource_nb: the ressource number of the time serie. If given, the time step
+    is the time span of one data point of this ressource and 'freq' is ignored"""
 
     # Format to datetime the df
     gen_df_dt = format_to_datetime(gen_df, dt_columns_all)
 
-    # Instanciate a list "date_cols_complete" to fill wit the names of complete
-    # datetime columns. We will use this list for the following merge
-    date_cols_complete = []
+    # Complete the time grid of the formated df
+    return complete_time_grid(gen_df_dt,
+                              dt_columns,
+                              freq = select_time_grid_freq(freq, ressource_nb))
 
-    # Iterate over the date columns
-    for i, date_col in enumerate(dt_columns):
-        # 1/ Create the reference datetime serie
 
-        # Collect start and end date of the date col
-        start = gen_df_dt[date_col].min()
-        end = gen_df_dt[date_col].max()
+def construct_time_consistent_panel(gen_df: pd.DataFrame,
+                                    ressource_nb: int,
+                                    dt_column: str = DATE_TIME_COLUMNS[0],
+                                    value_col: str = VALUE_COL_NAME,
+                                    units_cols = UNITS_NAMES_COLS
+                                    ) -> pd.DataFrame:
+    """Complete in one pass the time serie of every unit of a ressource. Return a
+    wide df indexed by the complete datetime index, with one value column per unit
+    and nans for the missing dates.
+    Arguments:
+    - gen_df: A df with datetime columns, a unit name column and a value column,
+    containing the time series of several units
+    - ressource_nb: the ressource number, used to pick the unit name column and
+    the time step of the time grid
+    Params:
+    - dt_column: the datetime column used to build the time grid
+    - value_col: the name of the value column
+    - units_cols: the name of the unit name column for each ressource"""
 
-        # Create the datetime index
-        dt_index = pd.date_range(start, end, freq = freq)
+    # Format only the datetime column used for the time grid
+    dt_values = pd.DatetimeIndex(gen_df[dt_column].apply(handle_seasonal_time))
 
-        # Create the df of complete dates corresponding to the date_col
-        if i == 0:
-            date_complete = pd.DataFrame({f"{date_col}_complete": dt_index})
+    # Encode the units names as integer codes, only once for all the units
+    units_codes, units_names = pd.factorize(gen_df[units_cols[ressource_nb]], sort = True)
 
-        else:
-            date_complete = pd.concat([date_complete, pd.DataFrame({f"{date_col}_complete": dt_index})], axis = 1)
+    # Create the complete datetime index shared by all the units
+    freq = select_time_grid_freq(ressource_nb = ressource_nb)
+    complete_index = pd.date_range(dt_values.min(), dt_values.max(), freq = freq, name = f"{dt_column}_complete")
+
+    # Compute the position of each row on the time grid (-1 when the date is off the grid)
+    positions = complete_index.get_indexer(dt_values)
+    on_grid = (positions >= 0) & (units_codes >= 0)
+
+    # Scatter the values into the panel array, in one vectorized assignment
+    panel = np.full((len(complete_index), len(units_names)), np.nan)
+    panel[positions[on_grid], units_codes[on_grid]] = gen_df[value_col].to_numpy(dtype = float)[on_grid]
+
+    return pd.DataFrame(panel, index = complete_index, columns = pd.Index(units_names, name = units_cols[ressource_nb]))
+
+
+class PreparedTimeSerie:
+    """Time serie df parsed and completed once. The datetime columns are formated,
+    the complete (time consistent) df and the missing dates masks are built a single
+    time at instanciation, then shared by the data quality checks, the statistics
+    functions and the preprocessing pipeline instead of being re-computed by each of them."""
+
+    def __init__(self,
+                 gen_df: pd.DataFrame,
+                 dt_columns: list, # start_date or/and end_date columns, not updated date column
+                 freq: str | datetime.timedelta = "1H",
+                 ressource_nb: int | None = None,
+                 dt_columns_all = DATE_TIME_COLUMNS
+                 ) -> None:
+        """Format the datetime columns, construct the complete df and the
+        missing dates masks.
+        Arguments:
+        - gen_df: A df with datetime columns and value columns, representing a time serie
+        - dt_columns: the list of datetime columns you want to complete
+        Params:
+        - freq: time step between each datetime point in order to construct a consistent datetime column
+        - ressource_nb: the ressource number of the time serie. If given, the time step
+        is the time span of one data point of this ressource and 'freq' is ignored"""
+
+        # Store the list of completed datetime columns
+        self.dt_columns = list(dt_columns)
+
+        # Format to datetime the df, only once
+        self.gen_df_dt = format_to_datetime(gen_df, dt_columns_all)
+
+        # Construct the complete df, only once
+        self.complete_df = complete_time_grid(self.gen_df_dt,
+                                              self.dt_columns,
+                                              freq = select_time_grid_freq(freq, ressource_nb))
+
+        # Map every completed datetime column with its missing dates mask
+        # (True when the date is missing in the original df)
+        self.missing_masks = {dt_column: self.complete_df[dt_column].isnull()
+                              for dt_column in self.dt_columns}
+
+
+def prepare_time_serie(gen_df: pd.DataFrame | PreparedTimeSerie,
+                       dt_columns: list,
+                       ressource_nb: int | None = None
+                       ) -> PreparedTimeSerie:
+    """Return a prepared time serie from a time serie df. If the input is already
+    a prepared time serie, it is returned as it is, without any new parsing.
+    Arguments:
+    - gen_df: A df with datetime columns and value columns, or a prepared time serie
+    - dt_columns: the list of datetime columns the prepared time serie must complete
+    Params:
+    - ressource_nb: the ressource number of the time serie, used to pick the time step"""
+
+    # Case the time serie is already prepared: check the datetime columns and return it
+    if isinstance(gen_df, PreparedTimeSerie):
+        # The datetime columns asked must have been completed at preparation
+        missing_columns = [dt_column for dt_column in dt_columns if dt_column not in gen_df.dt_columns]
+
+        if missing_columns:
+            raise ValueError(f"The datetime columns {missing_columns} were not completed in the prepared time serie")
+
+        return gen_df
+
+    # Otherwise prepare the time serie
+    return PreparedTimeSerie(gen_df, dt_columns, ressource_nb = ressource_nb)
+
+
+def compute_easter_sundays(years: np.ndarray) -> pd.DatetimeIndex:
+    """Compute the date of Easter sunday for an array of years at once,
+    with the anonymous gregorian algorithm.
+    Arguments:
+    - years: array of years"""
+
+    years = np.asarray(years)
+
+    # Anonymous gregorian algorithm, vectorized over the years
+    a = years % 19
+    b, c = np.divmod(years, 100)
+    d, e = np.divmod(b, 4)
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = np.divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = np.divmod(h + l - 7 * m + 114, 31)
+
+    return pd.DatetimeIndex(pd.to_datetime({"year": years, "month": month, "day": day + 1}))
+
+
+def compute_french_holidays(years: np.ndarray,
+                            fixed_holidays = FRENCH_FIXED_HOLIDAYS,
+                            easter_holidays_offsets = FRENCH_EASTER_HOLIDAYS_OFFSETS
+                            ) -> pd.DatetimeIndex:
+    """Return the dates of the french public holidays of the given years.
+    Arguments:
+    - years: array of years
+    Params:
+    - fixed_holidays: the holidays falling at a fixed date, as (month, day) tuples
+    - easter_holidays_offsets: the holidays depending on Easter, as a number of days after Easter sunday"""
+
+    years = np.unique(years)
+
+    # Holidays at a fixed date, for every year
+    fixed_dates = pd.DatetimeIndex(pd.to_datetime({"year": np.repeat(years, len(fixed_holidays)),
+                                                   "month": np.tile([month for month, _ in fixed_holidays], len(years)),
+                                                   "day": np.tile([day for _, day in fixed_holidays], len(years))}))
+
+    # Holidays offset from Easter sunday, for every year
+    easter_sundays = compute_easter_sundays(years)
+    easter_dates = [easter_sundays + pd.Timedelta(days = offset) for offset in easter_holidays_offsets]
+
+    return fixed_dates.append(easter_dates).sort_values()
+
+
+@functools.lru_cache(maxsize = CALENDAR_FEATURES_CACHE_SIZE)
+def compute_time_grid_calendar_features(start: pd.Timestamp,
+                                        periods: int,
+                                        freq: str
+                                        ) -> np.ndarray:
+    """Compute the calendar features of a regular time grid. The result is cached per
+    time grid (start, number of periods and time step), and returned as a read only array.
+    Arguments:
+    - start: the first date of the time grid
+    - periods: the number of dates of the time grid
+    - freq: the time step of the time grid"""
+
+    # Re-create the time grid
+    dt_index = pd.date_range(start, periods = periods, freq = freq)
+
+    # Flag the dates falling on a french public holiday
+    holidays = compute_french_holidays(np.unique(dt_index.year))
+    is_holiday = dt_index.normalize().isin(holidays)
+
+    # Stack the features in one float32 array: hour, weekday and holiday flag
+    calendar_features = np.column_stack([dt_index.hour, dt_index.weekday, is_holiday]).astype(np.float32)
+
+    # Forbid the modification of the cached array
+    calendar_features.flags.writeable = False
+
+    return calendar_features
+
+
+def compute_calendar_features(dt_index: pd.DatetimeIndex) -> np.ndarray:
+    """Return the calendar features of a datetime index, as a (len(dt_index), 3) float32
+    array with the hour, the weekday (0 for monday) and the french public holiday flag.
+    The features of regular datetime indexes are cached per time grid.
+    Arguments:
+    - dt_index: the datetime index"""
+
+    # Collect the time step of the datetime index, or infer it
+    freq = dt_index.freqstr
 
-        # Complete the date_cols_complete list
-        date_cols_complete.append(f"{date_col}_complete")
+    if freq is None and len(dt_index) > 2:
+        freq = pd.infer_freq(dt_index)
 
-    # 2/ Compare the date_complete columns with the choosen date columns in gen_df
+    # Case of a regular time grid: use the cache
+    if freq is not None:
+        return compute_time_grid_calendar_features(dt_index[0], len(dt_index), freq)
 
-    # Merge date_complete df with gen_df
-    gen_df_dt = pd.merge(left = date_complete, right = gen_df_dt, left_on = date_cols_complete, right_on = dt_columns, how = "left")
+    # Otherwise compute the features of each date
+    holidays = compute_french_holidays(np.unique(dt_index.year))
 
-    return gen_df_dt
+    return np.column_stack([dt_index.hour,
+                            dt_index.weekday,
+                            dt_index.normalize().isin(holidays)]).astype(np.float32)
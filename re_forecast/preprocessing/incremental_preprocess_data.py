@@ -0,0 +1,219 @@
+# Imports
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from re_forecast.preprocessing.check_data_quality import QualityState
+from re_forecast.preprocessing.clean_values import peel_time_serie_df, set_min_max_limits_time_serie
+from re_forecast.preprocessing.fill_missing_values import hybrid_impute
+from re_forecast.preprocessing.handle_datetime import handle_seasonal_time
+from re_forecast.preprocessing.preprocess_data import check_quality_stage, clip_values_stage, impute_values_stage
+from re_forecast.params import (DATE_TIME_COLUMNS, VALUE_COL_NAME, MIN_MAX_BOUND_VALUES, KNN_IMPUTATION_MISSING_VALUES,
+                               MAX_INTERPOLATION_GAP, DATA_QUALITY_THRESHOLDS, INCREMENTAL_PREPROCESSING_OVERLAP,
+                               PEELED_DF_KEEPED_COLUMNS)
+
+
+def load_incremental_state(output_path: str) -> dict | None:
+    """Load the boundary state of an incrementally preprocessed time serie: its quality state,
+    the number of parquet parts stored, and the last clipped (not imputed) values of the serie
+    with their first date. Return None if the serie was never preprocessed.
+    Arguments:
+    - output_path: the folder of the parquet parts of the preprocessed time serie"""
+
+    state_path = f"{output_path}/_state.json"
+
+    # Case the serie was never preprocessed incrementally
+    if not os.path.isfile(state_path):
+        return None
+
+    with open(state_path, mode = "r") as f:
+        state = json.load(f)
+
+    # Re-create the quality state and the tail values, the missing values are stored as null
+    state["quality_state"] = QualityState.from_dict(state["quality_state"])
+    state["tail_start"] = pd.Timestamp(state["tail_start"])
+    state["tail_values"] = np.array(state["tail_values"], dtype = float)
+
+    return state
+
+
+def save_incremental_state(output_path: str,
+                           quality_state: QualityState,
+                           nb_parts: int,
+                           tail_df: pd.DataFrame,
+                           value_col: str
+                           ) -> None:
+    """Save the boundary state of an incrementally preprocessed time serie as json.
+    Arguments:
+    - output_path: the folder of the parquet parts of the preprocessed time serie
+    - quality_state: the running quality state of the serie
+    - nb_parts: the number of parquet parts stored
+    - tail_df: the last clipped (not imputed) rows of the serie, with a complete datetime index
+    - value_col: the name of the value column"""
+
+    tail_values = tail_df[value_col].to_numpy(dtype = float)
+
+    state = {"quality_state": quality_state.to_dict(),
+             "nb_parts": nb_parts,
+             "tail_start": tail_df.index[0].isoformat(),
+             "tail_values": [None if np.isnan(value) else value for value in tail_values.tolist()]}
+
+    # Write the state under a temporary name then rename it, so a crash never leaves a partial state
+    with open(f"{output_path}/_state.json.tmp", mode = "w") as f:
+        json.dump(state, f)
+
+    os.replace(f"{output_path}/_state.json.tmp", f"{output_path}/_state.json")
+
+
+def read_preprocessed_data(output_path: str) -> pd.DataFrame:
+    """Read all the parquet parts of an incrementally preprocessed time serie as one df.
+    Arguments:
+    - output_path: the folder of the parquet parts of the preprocessed time serie"""
+
+    # The parts are named in chronological order, and the state file is skipped
+    parts_paths = sorted(f"{output_path}/{file_name}" for file_name in os.listdir(output_path)
+                         if file_name.endswith(".parquet"))
+
+    return pd.concat([pd.read_parquet(part_path) for part_path in parts_paths])
+
+
+def incremental_preprocess_data(new_gen_df: pd.DataFrame,
+                                output_path: str,
+                                dt_columns: list = DATE_TIME_COLUMNS[:-1],
+                                value_col: str = VALUE_COL_NAME,
+                                min_max_values: list = MIN_MAX_BOUND_VALUES,
+                                knn_impute_params: dict = KNN_IMPUTATION_MISSING_VALUES,
+                                max_interpolation_gap: int = MAX_INTERPOLATION_GAP,
+                                ressource_nb: int | None = None,
+                                overlap: int = INCREMENTAL_PREPROCESSING_OVERLAP,
+                                quality_thresholds = DATA_QUALITY_THRESHOLDS,
+                                return_quality_check = False
+                                ) -> pd.DataFrame | tuple:
+    """Incremental version of the preprocess_data pipeline, for time series growing with
+    new data. The first call preprocesses the given rows like preprocess_data. The next calls
+    only preprocess the new rows: the quality check is updated from the running quality state
+    of the serie, and the grid completion, the clipping and the imputation run on the new rows
+    preceded by the last overlap clipped values of the serie, kept as boundary state. The new
+    preprocessed rows are appended to the stored serie as a new parquet part, so the cost of an
+    update scales with the new data and not with the whole history.
+    Return the new preprocessed rows (None when the quality check is not fulfilled).
+    Note: the appends must be chronological, the new rows dated before the end of the stored
+    serie are ignored, and the values already stored are not revised. The long gaps of the new
+    rows are imputed from the rows known at the time of the call only, so their values can differ
+    from the preprocessing of the whole serie, whose KNN imputation also sees the rows after them.
+    Arguments:
+    - new_gen_df: the new rows of the time serie, with datetime columns and a value column
+    - output_path: the folder of the parquet parts and of the state of the preprocessed serie
+    Parameters:
+    - dt_columns, value_col, min_max_values, knn_impute_params, max_interpolation_gap,
+    ressource_nb: see the preprocess_data function
+    - overlap: the number of time steps of the stored serie kept as context of the new rows
+    - quality_thresholds: the quality thresholds of the data quality check
+    - return_quality_check: if True, return a tuple with the new preprocessed rows, the result
+    of the quality check and its message, instead of printing the message"""
+
+    os.makedirs(output_path, exist_ok = True)
+    state = load_incremental_state(output_path)
+
+    # Parameters of the imputation, shared by the first and the next calls
+    impute_params = {"value_col": value_col,
+                     "max_interpolation_gap": max_interpolation_gap,
+                     "long_gap_imputer": "knn_impute",
+                     "long_gap_params": knn_impute_params}
+
+    #############################
+    # 1/ Check the data quality #
+    #############################
+
+    # Case the first call: check the quality and complete the time grid of the whole serie
+    if state is None:
+        quality_state = QualityState(ressource_nb = ressource_nb)
+        gen_df_complete, quality = check_quality_stage(new_gen_df,
+                                                       dt_columns,
+                                                       ressource_nb,
+                                                       quality_thresholds)
+        quality_check, message = quality["quality_check"], quality["message"]
+
+    # Case the next calls: check the quality from the running state, without the history
+    else:
+        quality_state = state["quality_state"]
+        last_date = quality_state.last_date
+
+        quality_state.update(new_gen_df, date_col = dt_columns[0])
+        quality_check, message = quality_state.check(quality_thresholds)
+
+    # If the quality check is not fulfilled, return the reason why it isn't, the state is not saved
+    if not quality_check:
+        if return_quality_check:
+            return None, quality_check, message
+
+        print(message)
+        return
+
+    ###################################
+    # 2/ Clip and impute the new rows #
+    ###################################
+
+    if state is None:
+        # Update the quality state with the whole serie, for the next calls
+        quality_state.update(new_gen_df, date_col = dt_columns[0])
+        nb_parts = 0
+
+        # Clip the complete df and keep the clipped values of the serie (not imputed)
+        gen_df_caped, _ = clip_values_stage(peel_time_serie_df(gen_df_complete),
+                                            value_col,
+                                            min_max_values["min_value"],
+                                            min_max_values["max_value"])
+        window_df = gen_df_caped
+
+        # Impute the whole serie, every row is new (the clipped values are copied by the imputation)
+        gen_df_new, _ = impute_values_stage(gen_df_caped, **impute_params)
+
+    else:
+        nb_parts = state["nb_parts"]
+
+        # Complete time grid from the start of the stored tail to the last new date
+        window_index = pd.date_range(state["tail_start"],
+                                     quality_state.last_date,
+                                     freq = quality_state.freq,
+                                     name = PEELED_DF_KEEPED_COLUMNS["dt_column"])
+        window_values = np.full(len(window_index), np.nan)
+        window_values[:len(state["tail_values"])] = state["tail_values"]
+
+        # Place the new rows dated after the stored serie on the time grid
+        new_dates = pd.DatetimeIndex(new_gen_df[dt_columns[0]].apply(handle_seasonal_time))
+        positions = window_index.get_indexer(new_dates)
+        on_grid = (positions >= 0) & (new_dates > last_date)
+        window_values[positions[on_grid]] = new_gen_df[value_col].to_numpy(dtype = float)[on_grid]
+
+        # Clip the window, then impute it with the stored tail as context
+        window_df = set_min_max_limits_time_serie(pd.DataFrame({value_col: window_values}, index = window_index),
+                                                  value_col,
+                                                  min_value = min_max_values["min_value"],
+                                                  max_value = min_max_values["max_value"],
+                                                  inplace = True)
+        gen_df_imputed = hybrid_impute(window_df, value_col,
+                                       max_interpolation_gap = max_interpolation_gap,
+                                       long_gap_imputer = "knn_impute",
+                                       **knn_impute_params)
+
+        # Keep only the rows after the stored serie
+        gen_df_new = gen_df_imputed[gen_df_imputed.index > last_date]
+
+    ##########################
+    # 3/ Append the new rows #
+    ##########################
+
+    if len(gen_df_new):
+        gen_df_new.to_parquet(f"{output_path}/part_{nb_parts:05d}.parquet")
+        nb_parts += 1
+
+    # Keep the last clipped values as the boundary state of the next call
+    save_incremental_state(output_path, quality_state, nb_parts, window_df.iloc[-overlap:], value_col)
+
+    if return_quality_check:
+        return gen_df_new, quality_check, message
+
+    return gen_df_new
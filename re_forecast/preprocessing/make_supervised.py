@@ -1,9 +1,77 @@
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from re_forecast.preprocessing.handle_datetime import compute_calendar_features
+
+
+def build_lag_matrix(values: np.ndarray,
+                     nb_features: int,
+                     dtype = np.float64,
+                     materialize = False
+                     ) -> np.ndarray:
+    """Build the lag matrix of a time serie as a strided view over one contiguous
+    array. The matrix has one row per time step and nb_features + 1 columns: the
+    first column is the value at t, the column i is the value at t - i (nan when
+    t - i is before the start of the serie).
+    Arguments:
+    - values: 1D array of the values of the time serie
+    - nb_features: the number of lags to create
+    Parameters:
+    - dtype: the dtype of the matrix, float32 halves the memory used
+    - materialize: if True, return a contiguous copy instead of a read only view"""
+
+    # Verify if the number of feature you want to create is superior to 1
+    if nb_features <= 1:
+        raise ValueError("Please insert a number of features superior to 1")
+
+    # Copy the values once into a contiguous buffer, after nb_features leading nans
+    values = np.asarray(values)
+    padded_values = np.empty(len(values) + nb_features, dtype = dtype)
+    padded_values[:nb_features] = np.nan
+    padded_values[nb_features:] = values
+
+    # Each row is a window of nb_features + 1 values, reversed so that the value at
+    # t comes first followed by its lags. No data is copied by the view
+    lag_matrix = sliding_window_view(padded_values, nb_features + 1)[:, ::-1]
+
+    # Return a contiguous copy if requested
+    if materialize:
+        return np.ascontiguousarray(lag_matrix)
+
+    return lag_matrix
+
+
+def transform_dt_df_into_supervised_matrix(gen_df: pd.DataFrame,
+                                           value_col: str,
+                                           nb_features: int,
+                                           dtype = np.float64
+                                           ) -> np.ndarray:
+    """Return the supervised learning matrix of a time serie df as a contiguous
+    array, with the same columns than the df returned by the transform_dt_df_into_supervised
+    function: the columns of the df followed by the offset value columns.
+    Arguments:
+    - gen_df: A consistent time serie df with numerical columns only
+    - value_col: the name of the value column
+    - nb_features: the number of features to create by offsetting the value column
+    Parameters:
+    - dtype: the dtype of the matrix"""
+
+    # Build the lag matrix of the value column
+    lag_matrix = build_lag_matrix(gen_df[value_col].to_numpy(), nb_features, dtype = dtype)
+
+    # Case the df only has the value column: the lag matrix is the supervised matrix
+    if list(gen_df.columns) == [value_col]:
+        return np.ascontiguousarray(lag_matrix)
+
+    # Otherwise, put the columns of the df before the lags
+    return np.hstack([gen_df.to_numpy(dtype = dtype), lag_matrix[:, 1:]])
 
 
 def transform_dt_df_into_supervised(gen_df: pd.DataFrame,
                                     value_col: str,
-                                    nb_features: int
+                                    nb_features: int,
+                                    dtype = np.float64
                                     ) -> pd.DataFrame:
     """Transform a time serie df into a df suited for supervised
     learning techniques, by offsetting several times the value column by one
@@ -12,28 +80,175 @@ def transform_dt_df_into_supervised(gen_df: pd.DataFrame,
     - gen_df: A consistent time serie df with one or more complete datetime columns
     and one value column
     - value_col: the name of the value column
-    - nb_features: the number of features to create by offsetting the value column"""
+    - nb_features: the number of features to create by offsetting the value column
+    Parameters:
+    - dtype: the dtype of the offset value columns"""
+
+    # Build the lag matrix of the value column as a view, and keep only the lags
+    lags = build_lag_matrix(gen_df[value_col].to_numpy(), nb_features, dtype = dtype)[:, 1:]
+
+    # Create the df of the offset features, aligned on the gen_df index
+    lags_df = pd.DataFrame(lags,
+                           index = gen_df.index,
+                           columns = [f"{value_col}_{i}" for i in range(1, nb_features + 1)])
+
+    # Concatenate the new features with a copy of the original df
+    return pd.concat([gen_df, lags_df], axis = 1)
+
+
+class SupervisedWindowGenerator:
+    """Iterable of mini-batches of supervised windows (lags, target) drawn straight
+    from the values of a time serie. The windows are gathered batch by batch, so the
+    memory stays O(n) instead of the O(n x nb_features) of a materialized supervised df.
+    Each iteration over the generator is one epoch."""
+
+    def __init__(self,
+                 values: np.ndarray | pd.Series,
+                 nb_features: int,
+                 batch_size: int = 256,
+                 shuffle = True,
+                 drop_nan = True,
+                 seed: int | None = None,
+                 dtype = np.float32
+                 ) -> None:
+        """Store the values of the time serie and the rows that can be used as targets.
+        Arguments:
+        - values: 1D array or serie of the values of the time serie
+        - nb_features: the number of lags of each window
+        Parameters:
+        - batch_size: the number of windows in each mini-batch
+        - shuffle: if True, the windows are shuffled at each epoch, else they are ordered
+        - drop_nan: if True, the windows containing at least one nan are skipped
+        - seed: the seed of the random generator used to shuffle
+        - dtype: the dtype of the values and of the batches"""
+
+        # Verify if the number of feature you want to create is superior to 1
+        if nb_features <= 1:
+            raise ValueError("Please insert a number of features superior to 1")
+
+        # Store the values as one contiguous array, the only O(n) buffer
+        self.values = np.ascontiguousarray(values, dtype = dtype)
+        self.nb_features = nb_features
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random_generator = np.random.default_rng(seed)
+
+        # Offsets of the lags from the target row: t - 1, ..., t - nb_features
+        self.lags_offsets = np.arange(1, nb_features + 1)
+
+        # A row is a target only if it has nb_features values before it
+        targets_rows = np.arange(nb_features, len(self.values))
+
+        # Skip the windows containing nans, counting the nans of each window in O(n)
+        if drop_nan:
+            nan_cumsum = np.concatenate(([0], np.cumsum(np.isnan(self.values))))
+            window_nan_count = nan_cumsum[targets_rows + 1] - nan_cumsum[targets_rows - nb_features]
+            targets_rows = targets_rows[window_nan_count == 0]
+
+        self.targets_rows = targets_rows
+
+    def __len__(self) -> int:
+        """Return the number of mini-batches of one epoch"""
+
+        return -(-len(self.targets_rows) // self.batch_size)
+
+    def __iter__(self):
+        """Yield the mini-batches of one epoch, as tuples of a (batch_size, nb_features)
+        array of lags and a (batch_size,) array of targets"""
+
+        # Order or shuffle the target rows for this epoch
+        targets_rows = self.random_generator.permutation(self.targets_rows) if self.shuffle else self.targets_rows
+
+        # Iterate over the mini-batches
+        for batch_start in range(0, len(targets_rows), self.batch_size):
+            batch_rows = targets_rows[batch_start:batch_start + self.batch_size]
+
+            # Gather the lags and the targets of the mini-batch only
+            yield self.values[batch_rows[:, None] - self.lags_offsets], self.values[batch_rows]
+
+    def to_tf_dataset(self):
+        """Return the generator as a tf.data.Dataset of (lags, target) mini-batches,
+        re-iterated (and re-shuffled) at each epoch."""
+
+        # Import tensorflow only when the tf.data source is requested
+        import tensorflow as tf
+
+        # Describe the mini-batches yielded by the generator
+        dtype = tf.as_dtype(self.values.dtype)
+        output_signature = (tf.TensorSpec(shape = (None, self.nb_features), dtype = dtype),
+                            tf.TensorSpec(shape = (None,), dtype = dtype))
+
+        return tf.data.Dataset.from_generator(self.__iter__, output_signature = output_signature)
+
+
+def build_multi_horizon_dataset(panel_df: pd.DataFrame,
+                                nb_features: int,
+                                horizon: int,
+                                calendar_features = True,
+                                drop_nan = True,
+                                dtype = np.float32
+                                ) -> tuple:
+    """Build in one call the supervised dataset of every time serie of a panel, with
+    direct multi-horizon targets. For each serie and each forecast origin t, the features
+    are the values at t, t - 1, ..., t - nb_features + 1, followed by the calendar features
+    (hour, weekday, french public holiday flag) of t + 1, and the targets are the values
+    at t + 1, ..., t + horizon.
+    Return a tuple with the contiguous features array (n_samples, nb_features (+ 3)), the
+    contiguous targets array (n_samples, horizon) and a df giving the serie and the forecast
+    origin of each sample.
+    Arguments:
+    - panel_df: a wide df with a complete datetime index and one value column per time
+    serie, as constructed by the construct_time_consistent_panel function
+    - nb_features: the number of lagged values of each sample
+    - horizon: the number of time steps to forecast
+    Parameters:
+    - calendar_features: if True, append the calendar features to the lagged values
+    - drop_nan: if True, the samples containing at least one nan are dropped
+    - dtype: the dtype of the features and targets arrays"""
 
     # Verify if the number of feature you want to create is superior to 1
     if nb_features <= 1:
         raise ValueError("Please insert a number of features superior to 1")
 
-    # Copy the original df
-    gen_df_supervised = gen_df.copy(deep = True)
+    # Work on one array holding all the series
+    values = panel_df.to_numpy(dtype = dtype)
+    nb_rows, nb_series = values.shape
+    nb_origins = nb_rows - nb_features - horizon + 1
+
+    # Case the series are too short to create a single sample
+    if nb_origins <= 0:
+        raise ValueError("The time series are too short for the number of features and the horizon asked")
+
+    # Windows of nb_features + horizon values over the time axis, for all the series at once.
+    # Shape (nb_series, nb_origins, nb_features + horizon), samples ordered serie by serie
+    windows = sliding_window_view(values, nb_features + horizon, axis = 0).transpose(1, 0, 2)
+
+    # Split the windows into lags (most recent first) and targets, and stack the series
+    lags = windows[:, :, nb_features - 1::-1].reshape(-1, nb_features)
+    targets = windows[:, :, nb_features:].reshape(-1, horizon)
+
+    # Forecast origin and serie of each sample
+    origins_rows = np.tile(np.arange(nb_features - 1, nb_features - 1 + nb_origins), nb_series)
+    series_codes = np.repeat(np.arange(nb_series), nb_origins)
+
+    # Append the calendar features of the first forecast time step, computed once per time grid
+    if calendar_features:
+        calendar = compute_calendar_features(panel_df.index)
+        features = np.hstack([lags, calendar[origins_rows + 1].astype(dtype)])
 
-    # Get the index of the target value column
-    col_index = gen_df_supervised.columns.get_indexer([value_col])
+    else:
+        features = np.ascontiguousarray(lags)
 
-    # Iterate over the number of features
-    for i in range(1, nb_features + 1):
-        # Create the offset feature (dataframe)
-        feature_i = gen_df_supervised.iloc[:-i, col_index].rename({value_col: f"{value_col}_{i}"}, axis = 1)
+    targets = np.ascontiguousarray(targets)
 
-        # Reset the index in order to correspond to the gen_df index minus the
-        # last element of the index
-        feature_i.index = gen_df_supervised.index[i:]
+    # Drop the samples containing nans
+    if drop_nan:
+        complete_samples = ~(np.isnan(features).any(axis = 1) | np.isnan(targets).any(axis = 1))
+        features, targets = features[complete_samples], targets[complete_samples]
+        origins_rows, series_codes = origins_rows[complete_samples], series_codes[complete_samples]
 
-        # Merge the new feature with the original df
-        gen_df_supervised = gen_df_supervised.join(feature_i)
+    # Describe each sample with its serie and its forecast origin
+    samples_df = pd.DataFrame({"serie": panel_df.columns[series_codes],
+                               "forecast_origin": panel_df.index[origins_rows]})
 
-    return gen_df_supervised
+    return features, targets, samples_df
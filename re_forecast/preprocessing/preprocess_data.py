@@ -1,26 +1,97 @@
 import pandas as pd
 
 from re_forecast.preprocessing.check_data_quality import check_data_quality
-from re_forecast.preprocessing.handle_datetime import construct_time_consistent_df
+from re_forecast.preprocessing.handle_datetime import PreparedTimeSerie
 from re_forecast.preprocessing.clean_values import set_min_max_limits_time_serie
-from re_forecast.preprocessing.fill_missing_values import knn_impute
+from re_forecast.preprocessing.fill_missing_values import hybrid_impute
+from re_forecast.preprocessing.stage_cache import StageCache, run_cached_stage
 
-from re_forecast.params import (DATE_TIME_COLUMNS, VALUE_COL_NAME, MIN_MAX_BOUND_VALUES, KNN_IMPUTATION_MISSING_VALUES)
+from re_forecast.params import (DATE_TIME_COLUMNS, VALUE_COL_NAME, MIN_MAX_BOUND_VALUES, KNN_IMPUTATION_MISSING_VALUES,
+                               MAX_INTERPOLATION_GAP, DATA_QUALITY_THRESHOLDS)
+
+
+def check_quality_stage(gen_df: pd.DataFrame,
+                        dt_columns: list,
+                        ressource_nb: int | None,
+                        quality_thresholds: dict
+                        ) -> tuple:
+    """Preprocessing stage checking the data quality of a time serie df. Return the
+    complete, time consistent df (None when the quality check is not fulfilled) and
+    the result of the quality check with its message"""
+
+    # Parse the datetimes and construct the complete, time consistent df only once.
+    # The quality checks and the base preprocessing share this prepared time serie
+    gen_df_prepared = PreparedTimeSerie(gen_df, dt_columns, ressource_nb = ressource_nb)
+
+    # Use the check data quality function
+    quality_check, message = check_data_quality(gen_df_prepared,
+                                                dt_columns[0],
+                                                quality_thresholds = quality_thresholds)
+    metadata = {"quality_check": quality_check, "message": message}
+
+    if not quality_check:
+        return None, metadata
+
+    return gen_df_prepared.complete_df, metadata
+
+
+def clip_values_stage(gen_df: pd.DataFrame,
+                      value_col: str,
+                      min_value: float | None,
+                      max_value: float | None
+                      ) -> tuple:
+    """Preprocessing stage bounding the values of a complete time serie df, in place"""
+
+    gen_df_caped = set_min_max_limits_time_serie(gen_df,
+                                                 value_col,
+                                                 min_value = min_value,
+                                                 max_value = max_value,
+                                                 inplace = True
+                                                 )
+
+    return gen_df_caped, {}
+
+
+def impute_values_stage(gen_df: pd.DataFrame,
+                        value_col: str,
+                        max_interpolation_gap: int,
+                        long_gap_imputer: str,
+                        long_gap_params: dict
+                        ) -> tuple:
+    """Preprocessing stage imputing the missing values of a complete time serie df"""
+
+    gen_df_imputed = hybrid_impute(gen_df,
+                                   value_col,
+                                   max_interpolation_gap = max_interpolation_gap,
+                                   long_gap_imputer = long_gap_imputer,
+                                   **long_gap_params)
+
+    return gen_df_imputed, {}
 
 
 def preprocess_data(gen_df: pd.DataFrame,
                     dt_columns: list = DATE_TIME_COLUMNS[:-1],
                     value_col: str = VALUE_COL_NAME,
                     min_max_values: list = MIN_MAX_BOUND_VALUES,
-                    knn_impute_params: dict = KNN_IMPUTATION_MISSING_VALUES
-                    ) -> pd.DataFrame:
+                    knn_impute_params: dict = KNN_IMPUTATION_MISSING_VALUES,
+                    max_interpolation_gap: int = MAX_INTERPOLATION_GAP,
+                    ressource_nb: int | None = None,
+                    return_quality_check = False,
+                    cache_path: str | None = None,
+                    quality_thresholds = DATA_QUALITY_THRESHOLDS
+                    ) -> pd.DataFrame | tuple:
     """Hard (not configurable) preprocessing pipeline. Three steps: Check the data
     quality (number of rows available for learning, proportion of missing values
     and length of the missing data gaps), apply the base preprocessing such as
     completing gaps of missing dates and bound the values in respect to a max
-    and a min value, and impute the missing values with a KNN imputer. The preprocessed
+    and a min value, and impute the missing values: the short gaps are linearly
+    interpolated and the long gaps are imputed with a KNN imputer. The preprocessed
     data is aimed to be store when the preprocessing is complete in order to separate
     preprocessing and training and to save computing ressources.
+    When a cache path is given, the output of each step is stored as parquet under the
+    fingerprint of its input data and parameters, and the steps already run on the same
+    input with the same parameters are loaded instead of being re-computed.
+    See the run_preprocessing_pipeline function for a configurable and profiled version.
     Argument:
     - gen_df: A df with datetime columns and value columns, representing a time serie.
     Parameters:
@@ -28,17 +99,39 @@ def preprocess_data(gen_df: pd.DataFrame,
     (because this column does not contain regularly spaced dates and can cause issues)
     - value_col: Name of the value column of the time serie df
     - min_max_values: Minimum and maximum bound values for the time serie df
-    - knn_impute_params: Parameters of the KNN imputation of missing values"""
+    - knn_impute_params: Parameters of the KNN imputation of missing values
+    - max_interpolation_gap: Maximal length of the gaps linearly interpolated, the longer
+    gaps are imputed with the KNN imputer (0 to impute every gap with the KNN imputer)
+    - ressource_nb: The ressource number of the time serie, used to pick the time step of
+    the complete datetime columns (hourly when not given)
+    - return_quality_check: if True, return a tuple with the df imputed (None when the
+    quality check is not fulfilled), the result of the quality check and its message,
+    instead of printing the message
+    - cache_path: the folder of the stage cache, None to run every step
+    - quality_thresholds: the quality thresholds of the data quality check"""
+
+    # Open the stage cache if asked
+    cache = StageCache(cache_path) if cache_path is not None else None
 
     #############################
     # 1/ Check the data quality #
     #############################
 
-    # Use the check data quality function
-    quality_check, message = check_data_quality(gen_df, dt_columns[0])
+    # Check the quality and construct the complete, time consistent df
+    gen_df_complete, quality, fingerprint = run_cached_stage("check_quality",
+                                                             check_quality_stage,
+                                                             gen_df,
+                                                             {"dt_columns": list(dt_columns),
+                                                              "ressource_nb": ressource_nb,
+                                                              "quality_thresholds": quality_thresholds},
+                                                             cache = cache)
+    quality_check, message = quality["quality_check"], quality["message"]
 
     # If the quality check is not fulfilled, return the reason why it isn't
     if not quality_check:
+        if return_quality_check:
+            return None, quality_check, message
+
         print(message)
         return
 
@@ -46,24 +139,33 @@ def preprocess_data(gen_df: pd.DataFrame,
     # 2/ Apply base preprocessing #
     ###############################
 
-    # Construct a complete, time consistent df
-    gen_df_complete = construct_time_consistent_df(gen_df, dt_columns)
-
-    # Constrain the min and max values of the df
-    gen_df_caped = set_min_max_limits_time_serie(gen_df_complete,
-                                                 value_col,
-                                                 min_value = min_max_values["min_value"],
-                                                 max_value = min_max_values["max_value"]
-                                                 )
+    # Constrain the min and max values of the df, the complete df is not used elsewhere
+    gen_df_caped, _, fingerprint = run_cached_stage("clip_values",
+                                                    clip_values_stage,
+                                                    gen_df_complete,
+                                                    {"value_col": value_col,
+                                                     "min_value": min_max_values["min_value"],
+                                                     "max_value": min_max_values["max_value"]},
+                                                    cache = cache,
+                                                    input_fingerprint = fingerprint)
 
     ################################
     # 3/ Impute the missing values #
     ################################
 
-    # Impute the missing values with a knn algorithm
-    gen_df_imputed = knn_impute(gen_df_caped,
-                                value_col,
-                                **knn_impute_params)
+    # Interpolate the short gaps, and impute the long gaps with a knn algorithm
+    gen_df_imputed, _, _ = run_cached_stage("impute_values",
+                                            impute_values_stage,
+                                            gen_df_caped,
+                                            {"value_col": value_col,
+                                             "max_interpolation_gap": max_interpolation_gap,
+                                             "long_gap_imputer": "knn_impute",
+                                             "long_gap_params": knn_impute_params},
+                                            cache = cache,
+                                            input_fingerprint = fingerprint)
+
+    # Return the df imputed, with the result of the quality check if asked
+    if return_quality_check:
+        return gen_df_imputed, quality_check, message
 
-    # Return the df imputed
     return gen_df_imputed
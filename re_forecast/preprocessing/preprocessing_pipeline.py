@@ -0,0 +1,143 @@
+# Imports
+import copy
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+from re_forecast.preprocessing.preprocess_data import check_quality_stage, clip_values_stage, impute_values_stage
+from re_forecast.preprocessing.stage_cache import StageCache, run_cached_stage
+from re_forecast.params import PREPROCESSING_PIPELINE_SPEC
+
+
+def load_pipeline_spec(spec: dict | list | str,
+                       default_spec: dict = PREPROCESSING_PIPELINE_SPEC
+                       ) -> list:
+    """Load a preprocessing pipeline specification, and return the list of its stages as
+    (stage name, params) tuples. The parameters missing from a stage are taken from the
+    same stage of the default specification.
+    Arguments:
+    - spec: the specification, as a dict with a "stages" key, as the list of the stages
+    or as the path of a json file holding one of them. Each stage is a dict with the name
+    of the stage ("stage") and its parameters ("params")
+    Parameters:
+    - default_spec: the specification giving the default parameters of each stage"""
+
+    # Read the specification from its json file
+    if isinstance(spec, str):
+        with open(spec, mode = "r") as f:
+            spec = json.load(f)
+
+    if isinstance(spec, dict):
+        spec = spec["stages"]
+
+    # Default parameters of each stage
+    default_params = {stage["stage"]: stage.get("params", {}) for stage in default_spec["stages"]}
+
+    stages = []
+    for stage in spec:
+
+        # Verify the stage is known
+        if stage["stage"] not in PREPROCESSING_STAGES:
+            raise ValueError(f"Unknown stage {stage['stage']}, choose among {list(PREPROCESSING_STAGES)}")
+
+        # Complete the parameters of the stage with its default parameters
+        params = copy.deepcopy(default_params.get(stage["stage"], {}))
+        params.update(stage.get("params", {}))
+        stages.append((stage["stage"], params))
+
+    return stages
+
+
+def run_preprocessing_pipeline(gen_df: pd.DataFrame,
+                               spec: dict | list | str = PREPROCESSING_PIPELINE_SPEC,
+                               cache_path: str | None = None,
+                               profile_memory = True
+                               ) -> tuple:
+    """Run a configurable preprocessing pipeline, described by a specification listing the
+    stages to run in order with their parameters (see load_pipeline_spec), and profile each
+    stage. The pipeline stops at the first stage returning no df, like a failed quality check.
+    The input df is never modified: it is copied before a stage modifying its input in place
+    (like the clip_values stage) when no earlier stage produced a new df.
+    Return a tuple with the preprocessed df (None if the pipeline stopped) and a report df
+    with one row per stage run: the number of rows in and out, the wall time in seconds,
+    the peak memory allocated in MB, if the output was loaded from the stage cache and the
+    metadata returned by the stage (like the result of the quality check).
+    Arguments:
+    - gen_df: A df with datetime columns and value columns, representing a time serie
+    Parameters:
+    - spec: the specification of the pipeline, the default one runs the same stages than
+    the preprocess_data function
+    - cache_path: the folder of the stage cache, None to run every stage
+    - profile_memory: if True, trace the memory allocations of each stage, which slows
+    the stages down"""
+
+    stages = load_pipeline_spec(spec)
+
+    # Open the stage cache if asked
+    cache = StageCache(cache_path) if cache_path is not None else None
+
+    # Trace the memory allocations, unless they are already traced
+    tracing_started = profile_memory and not tracemalloc.is_tracing()
+    if tracing_started:
+        tracemalloc.start()
+
+    report = []
+    fingerprint = None
+    input_df = gen_df
+
+    try:
+        for stage, params in stages:
+            rows_in = len(gen_df)
+            nb_hits = len(cache.hits) if cache is not None else 0
+
+            # Don't modify the df of the caller in place
+            if stage in PREPROCESSING_INPLACE_STAGES and gen_df is input_df:
+                gen_df = gen_df.copy()
+
+            # Run the stage, measuring the wall time and the memory allocated above the current one
+            if profile_memory:
+                tracemalloc.reset_peak()
+                memory_start, _ = tracemalloc.get_traced_memory()
+
+            start_time = time.perf_counter()
+
+            gen_df, metadata, fingerprint = run_cached_stage(stage,
+                                                             PREPROCESSING_STAGES[stage],
+                                                             gen_df,
+                                                             params,
+                                                             cache = cache,
+                                                             input_fingerprint = fingerprint)
+
+            wall_time = time.perf_counter() - start_time
+
+            if profile_memory:
+                _, memory_peak = tracemalloc.get_traced_memory()
+
+            report.append({"stage": stage,
+                           "rows_in": rows_in,
+                           "rows_out": len(gen_df) if gen_df is not None else 0,
+                           "wall_time": wall_time,
+                           "peak_memory_mb": (memory_peak - memory_start) / 1024 ** 2 if profile_memory else None,
+                           "cache_hit": cache is not None and len(cache.hits) > nb_hits,
+                           "metadata": metadata})
+
+            # Stop the pipeline when a stage returns no df
+            if gen_df is None:
+                break
+
+    finally:
+        if tracing_started:
+            tracemalloc.stop()
+
+    return gen_df, pd.DataFrame(report)
+
+
+# Stages of the preprocessing pipeline, mapped with their names in the pipeline specifications
+PREPROCESSING_STAGES = {"check_quality": check_quality_stage,
+                        "clip_values": clip_values_stage,
+                        "impute_values": impute_values_stage}
+
+# Stages modifying their input df in place
+PREPROCESSING_INPLACE_STAGES = {"clip_values"}
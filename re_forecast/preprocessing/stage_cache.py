@@ -0,0 +1,162 @@
+# Imports
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+def fingerprint_df(gen_df: pd.DataFrame) -> str:
+    """Return the fingerprint of the content of a df: a sha256 hash of the values of
+    every row and of the index, and of the names and dtypes of the columns.
+    Arguments:
+    - gen_df: the df to fingerprint"""
+
+    # Hash every row with its index in one vectorized pass, then hash the rows hashes
+    rows_hashes = pd.util.hash_pandas_object(gen_df, index = True).to_numpy()
+
+    fingerprint = hashlib.sha256(rows_hashes.tobytes())
+    fingerprint.update(json.dumps([[str(col), str(dtype)] for col, dtype in gen_df.dtypes.items()]).encode())
+
+    return fingerprint.hexdigest()
+
+
+def fingerprint_stage(stage: str,
+                      input_fingerprint: str,
+                      params: dict
+                      ) -> str:
+    """Return the fingerprint of a preprocessing stage run: a sha256 hash of the name of
+    the stage, of the fingerprint of its input df and of its parameters.
+    Arguments:
+    - stage: the name of the stage
+    - input_fingerprint: the fingerprint of the input df of the stage
+    - params: the parameters of the stage, json serializable (the other objects are
+    serialized by their string representation)"""
+
+    stage_key = json.dumps({"stage": stage, "input": input_fingerprint, "params": params},
+                           sort_keys = True,
+                           default = str)
+
+    return hashlib.sha256(stage_key.encode()).hexdigest()
+
+
+class StageCache:
+    """Disk cache of the outputs of the preprocessing stages. The output df of each stage
+    run is stored as a parquet file named after the fingerprint of the stage run, with a
+    json file holding the metadata of the stage (the fingerprint of the output df and the
+    results computed by the stage, like the quality check)."""
+
+    def __init__(self,
+                 cache_path: str
+                 ) -> None:
+        """Create the cache folder if needed.
+        Arguments:
+        - cache_path: the folder storing the outputs of the stages"""
+
+        self.cache_path = cache_path
+        os.makedirs(cache_path, exist_ok = True)
+
+        # Names of the stages loaded from the cache and of the stages computed
+        self.hits = []
+        self.misses = []
+
+    def get_paths(self,
+                  stage: str,
+                  fingerprint: str
+                  ) -> tuple:
+        """Return the paths of the parquet file and of the json metadata file of a stage run"""
+
+        file_path = f"{self.cache_path}/{stage}__{fingerprint}"
+
+        return f"{file_path}.parquet", f"{file_path}.json"
+
+    def load(self,
+             stage: str,
+             fingerprint: str
+             ) -> tuple | None:
+        """Return the output df (None if the stage returned no df), the metadata and the
+        fingerprint of the output df of a stage run, or None if the run is not cached"""
+
+        data_path, metadata_path = self.get_paths(stage, fingerprint)
+
+        # The metadata file is written last, its presence means the stage run is complete
+        if not os.path.exists(metadata_path):
+            return None
+
+        with open(metadata_path) as f:
+            cached = json.load(f)
+
+        output_df = pd.read_parquet(data_path) if cached["output_fingerprint"] is not None else None
+
+        return output_df, cached["metadata"], cached["output_fingerprint"]
+
+    def store(self,
+              stage: str,
+              fingerprint: str,
+              output_df: pd.DataFrame | None,
+              metadata: dict,
+              output_fingerprint: str | None
+              ) -> None:
+        """Store the output df and the metadata of a stage run. The files are written under
+        temporary names then renamed, so that concurrent runs never read a partial file"""
+
+        data_path, metadata_path = self.get_paths(stage, fingerprint)
+
+        if output_df is not None:
+            output_df.to_parquet(f"{data_path}.{os.getpid()}.tmp")
+            os.replace(f"{data_path}.{os.getpid()}.tmp", data_path)
+
+        with open(f"{metadata_path}.{os.getpid()}.tmp", mode = "w") as f:
+            json.dump({"stage": stage,
+                       "output_fingerprint": output_fingerprint,
+                       "metadata": metadata}, f, default = str)
+
+        os.replace(f"{metadata_path}.{os.getpid()}.tmp", metadata_path)
+
+
+def run_cached_stage(stage: str,
+                     stage_function,
+                     gen_df: pd.DataFrame,
+                     params: dict,
+                     cache: StageCache | None = None,
+                     input_fingerprint: str | None = None
+                     ) -> tuple:
+    """Run a preprocessing stage, or load its output from the cache if the stage already
+    ran on the same input df with the same parameters. The stages are chained by the
+    fingerprints of their outputs, so a change of the parameters of a stage only re-runs
+    this stage and the following ones, and a stage whose input is unchanged is skipped.
+    Return a tuple with the output df of the stage, its metadata and the fingerprint of the
+    output df (None when no cache is used), to pass as input_fingerprint to the next stage.
+    Arguments:
+    - stage: the name of the stage
+    - stage_function: the function of the stage, called with the input df and the parameters,
+    returning a tuple with the output df (or None) and a dict of json serializable metadata
+    - gen_df: the input df of the stage
+    - params: the parameters of the stage
+    Parameters:
+    - cache: the stage cache, if None the stage is always run
+    - input_fingerprint: the fingerprint of the input df, computed if not given"""
+
+    # Case no cache is used: run the stage
+    if cache is None:
+        output_df, metadata = stage_function(gen_df, **params)
+        return output_df, metadata, None
+
+    # Fingerprint the stage run and look for it in the cache
+    if input_fingerprint is None:
+        input_fingerprint = fingerprint_df(gen_df)
+
+    fingerprint = fingerprint_stage(stage, input_fingerprint, params)
+    cached = cache.load(stage, fingerprint)
+
+    if cached is not None:
+        cache.hits.append(stage)
+        return cached
+
+    # Otherwise run the stage, and store its output before the next stages can modify it
+    cache.misses.append(stage)
+    output_df, metadata = stage_function(gen_df, **params)
+    output_fingerprint = fingerprint_df(output_df) if output_df is not None else None
+    cache.store(stage, fingerprint, output_df, metadata, output_fingerprint)
+
+    return output_df, metadata, output_fingerprint
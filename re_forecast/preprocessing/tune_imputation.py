@@ -0,0 +1,158 @@
+# Imports
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from re_forecast.exploration.compute_statistics import compute_kl_divergence_batch
+from re_forecast.preprocessing.clean_values import peel_time_serie_df
+from re_forecast.preprocessing.fill_missing_values import IMPUTERS_MATRIX_FUNCTIONS
+from re_forecast.preprocessing.make_supervised import transform_dt_df_into_supervised_matrix
+from re_forecast.params import IMPUTATION_SEARCH_GRID
+
+
+# Supervised matrices and reference series shared by the tasks of a worker process.
+# Filled once per worker by the init_search_worker function
+SEARCH_DATA = {}
+
+
+def init_search_worker(search_data: dict) -> None:
+    """Store the supervised matrices and the reference series in the worker process,
+    so that they are sent once per worker and not once per task"""
+
+    SEARCH_DATA.update(search_data)
+
+
+def run_imputation(unit: str,
+                   imputer: str,
+                   params: dict
+                   ) -> dict:
+    """Impute the supervised matrix of one unit with one imputer and one set of parameters,
+    and return the imputed values with the runtime of the imputation"""
+
+    # Get the shared supervised matrix of the unit
+    X = SEARCH_DATA[unit]
+
+    # Impute and time the imputation
+    start_time = time.perf_counter()
+    imputed_values = IMPUTERS_MATRIX_FUNCTIONS[imputer](X, **params)
+    runtime = time.perf_counter() - start_time
+
+    return {"unit": unit,
+            "imputer": imputer,
+            "params": params,
+            "imputed_values": imputed_values,
+            "runtime": runtime}
+
+
+def expand_imputation_grid(params_grid: dict) -> list:
+    """Expand a grid of imputers and parameters into the list of (imputer, params)
+    configurations to evaluate.
+    Arguments:
+    - params_grid: dict mapping each imputer name with a dict giving the list of values
+    to try for each of its parameters, see IMPUTATION_SEARCH_GRID in the params"""
+
+    configurations = []
+
+    for imputer, imputer_grid in params_grid.items():
+
+        # Verify the imputer is known
+        if imputer not in IMPUTERS_MATRIX_FUNCTIONS:
+            raise ValueError(f"Unknown imputer {imputer}, choose among {list(IMPUTERS_MATRIX_FUNCTIONS)}")
+
+        # Every combination of the values of the parameters
+        params_names = list(imputer_grid.keys())
+        for params_values in itertools.product(*imputer_grid.values()):
+            configurations.append((imputer, dict(zip(params_names, params_values))))
+
+    return configurations
+
+
+def search_imputation_params(gen_dfs: pd.DataFrame | dict,
+                             value_col: str,
+                             params_grid: dict = IMPUTATION_SEARCH_GRID,
+                             nb_supervised_features: int = 24,
+                             max_workers: int | None = None,
+                             n_samples: int = 1000,
+                             bandwidth: str | float = 5,
+                             kernel: str = "gaussian",
+                             kde_method: str = "fft"
+                             ) -> pd.DataFrame:
+    """Evaluate a grid of imputers and parameters on one or several time series, in a
+    pool of processes. The supervised matrix of each time serie is built once and shared
+    with the worker processes, then the imputed series of all the configurations of a time
+    serie are scored at once by their K-L divergence with the original serie (see
+    compute_kl_divergence_batch), so the original serie density is estimated only once.
+    Return a df with one row per unit and configuration, with the K-L divergence, the runtime
+    of the imputation in seconds and the rank of the configuration for the unit (1 is the
+    lowest K-L divergence), sorted by unit and rank.
+    Arguments:
+    - gen_dfs: a consistent time serie df, or a dict mapping unit names with consistent
+    time serie dfs
+    - value_col: the name of the value column
+    Parameters:
+    - params_grid: dict mapping each imputer name with a dict giving the list of values
+    to try for each of its parameters
+    - nb_supervised_features: number of features of the supervised matrices
+    - max_workers: the number of worker processes, all the cores by default
+    - n_samples, bandwidth, kernel: the parameters of the kde of the K-L divergence
+    - kde_method: the method of the kde, the binned "fft" kde (gaussian kernel only) or the
+    "exact" kde (see compute_kde_time_serie)"""
+
+    # A single df is searched as a single unit
+    if isinstance(gen_dfs, pd.DataFrame):
+        gen_dfs = {"unit": gen_dfs}
+
+    # List the configurations of the search, and verify there is something to search
+    configurations = expand_imputation_grid(params_grid)
+
+    if not configurations:
+        raise ValueError("The params grid has no configuration to evaluate")
+
+    if not gen_dfs:
+        raise ValueError("There is no time serie to evaluate the configurations on")
+
+    # Build the supervised matrix of each unit once
+    search_data = {}
+    reference_dfs = {}
+    for unit, gen_df in gen_dfs.items():
+
+        # Detect if the df has a dt index. If it doesn't, transform into a peeled df
+        if gen_df.index.dtype == "int64":
+            gen_df = peel_time_serie_df(gen_df)
+
+        search_data[unit] = transform_dt_df_into_supervised_matrix(gen_df, value_col, nb_supervised_features)
+        reference_dfs[unit] = gen_df[[value_col]]
+
+    # List every task of the search
+    tasks = [(unit, imputer, params) for unit in search_data for imputer, params in configurations]
+
+    # Parameters of the K-L divergence
+    kl_params = {"n_samples": n_samples, "bandwidth": bandwidth, "kernel": kernel, "method": kde_method}
+
+    # Don't start more processes than tasks
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+
+    # Evaluate the tasks in a pool of processes, the shared data is sent at the start of each worker
+    with ProcessPoolExecutor(max_workers = max_workers,
+                             initializer = init_search_worker,
+                             initargs = (search_data,)) as executor:
+        futures = [executor.submit(run_imputation, unit, imputer, params) for unit, imputer, params in tasks]
+        results_df = pd.DataFrame([future.result() for future in futures])
+
+    # Score all the imputed series of each unit at once against the original serie
+    results_df["kl_divergence"] = np.nan
+    for unit, unit_results in results_df.groupby("unit", sort = False):
+        imputed_values = np.column_stack(unit_results["imputed_values"].tolist())
+        kl_divergences = compute_kl_divergence_batch(reference_dfs[unit], imputed_values, value_col, **kl_params)
+        results_df.loc[unit_results.index, "kl_divergence"] = kl_divergences
+
+    results_df = results_df[["unit", "imputer", "params", "kl_divergence", "runtime"]]
+
+    # Rank the configurations of each unit by K-L divergence
+    results_df["rank"] = results_df.groupby("unit")["kl_divergence"].rank(method = "first").astype(np.int64)
+
+    return results_df.sort_values(["unit", "rank"]).reset_index(drop = True)
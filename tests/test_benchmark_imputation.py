@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from re_forecast.exploration.benchmark_imputation import benchmark_imputers, punch_synthetic_gaps
+
+
+def test_punch_synthetic_gaps():
+    """The synthetic gaps reach the proportion of missing values, with the lengths of the histogram,
+    and are surrounded by known values"""
+
+    gaps_histogram = pd.Series([5, 2, 1], index = pd.Index([1, 3, 10], name = "length"))
+    missing_mask = punch_synthetic_gaps(1000, gaps_histogram, 0.1, np.random.default_rng(0))
+
+    assert missing_mask.sum() >= 100
+    assert not missing_mask[0] and not missing_mask[-1]
+
+    # Each gap is a run of missing values between two known values, with a length of the histogram
+    changes = np.flatnonzero(np.diff(missing_mask.astype(int)))
+    gaps_lengths = changes[1::2] - changes[::2]
+    assert set(gaps_lengths) <= {1, 3, 10}
+
+
+def test_benchmark_imputers():
+    """The imputers are scored on the synthetic gaps of the complete stretches of the serie"""
+
+    random_generator = np.random.default_rng(0)
+    values = np.sin(np.arange(2000) * 2 * np.pi / 24) + random_generator.normal(0, 0.1, 2000)
+    values[[100, 101, 900, 1500, 1501, 1502]] = np.nan
+    gen_df = pd.DataFrame({"value": values}, index = pd.date_range("2023-01-01", periods = 2000, freq = "1H"))
+
+    imputers = {"linear_interpolation": {"function": "interpolate_time_serie_df",
+                                         "params": {"interpolation_method": "linear"}},
+                "knn_impute_window": {"function": "knn_impute", "params": {"param": 5, "search": "window"}}}
+    summary_df, details_df = benchmark_imputers(gen_df, "value", imputers = imputers, missing_prop = 0.05,
+                                                min_stretch_length = 300, seed = 0, return_details = True)
+
+    # Three complete stretches are long enough, each punched once and imputed by each imputer
+    assert len(details_df) == 3 * len(imputers)
+    assert details_df["stretch_start"].nunique() == 3
+    assert set(summary_df.index) == set(imputers)
+    assert (summary_df["nb_not_imputed"] == 0).all()
+    assert summary_df["mae"].is_monotonic_increasing
+
+
+def test_benchmark_imputers_sparse_gaps():
+    """Each stretch of a long serie with a single missing value is punched with at least one gap"""
+
+    values = np.sin(np.arange(50000) * 2 * np.pi / 24)
+    values[1000] = np.nan
+    gen_df = pd.DataFrame({"value": values}, index = pd.date_range("2018-01-01", periods = 50000, freq = "1H"))
+
+    imputers = {"linear_interpolation": {"function": "interpolate_time_serie_df",
+                                         "params": {"interpolation_method": "linear"}}}
+    summary_df, details_df = benchmark_imputers(gen_df, "value", imputers = imputers, seed = 0, return_details = True)
+
+    assert len(details_df) == 2
+    assert (details_df["nb_missing"] >= 1).all()
+    assert summary_df.loc["linear_interpolation", "max_error"] < 0.1
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from re_forecast.preprocessing.check_data_quality import QualityState, compute_quality_report
+from re_forecast.params import DATA_QUALITY_THRESHOLDS
+
+
+def test_quality_report_metrics():
+    """The metrics of the report are computed on the span of the serie"""
+
+    # 2000 rows, a leading gap (outside the span) and a gap of 60 rows inside
+    missing_mask = np.zeros(2000, dtype = bool)
+    missing_mask[:10] = True
+    missing_mask[500:560] = True
+
+    report = compute_quality_report(missing_mask, ["serie"])
+
+    assert report.loc["serie", "row_nb"] == 1990
+    assert report.loc["serie", "max_empty_gap_duration"] == 60
+    assert not report.loc["serie", "quality_check"]
+    assert report.loc["serie", "message"] == DATA_QUALITY_THRESHOLDS["max_empty_gap_duration"][2]
+
+
+def test_quality_report_unknown_threshold():
+    """A quality threshold without a metric raises a ValueError"""
+
+    quality_thresholds = dict(DATA_QUALITY_THRESHOLDS)
+    quality_thresholds["unknown_metric"] = (1, "check_unknown_metric", "Unknown")
+
+    with pytest.raises(ValueError, match = "unknown_metric"):
+        compute_quality_report(np.zeros(2000, dtype = bool), ["serie"], quality_thresholds = quality_thresholds)
+
+
+def make_hourly_df(dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """Create a raw time serie df with the datetime format of the RTE API"""
+
+    return pd.DataFrame({"start_date": dates.strftime("%Y-%m-%dT%H:%M:%S+01:00"),
+                         "value": np.arange(len(dates), dtype = float)})
+
+
+def test_quality_state_appends_match_full_report():
+    """Updating a quality state by appends gives the metrics of the full serie"""
+
+    dates = pd.date_range("2023-01-01", periods = 3000, freq = "1H")
+    missing_mask = np.zeros(3000, dtype = bool)
+    missing_mask[[5, 6, 1500, 2999]] = True
+    missing_mask[1000:1040] = True
+    gen_df = make_hourly_df(dates[~missing_mask])
+
+    state = QualityState(ressource_nb = 2)
+    for rows in np.array_split(np.arange(len(gen_df)), 7):
+        state.update(gen_df.iloc[rows])
+
+    report = compute_quality_report(missing_mask[:-1], ["serie"])
+    metrics = state.metrics()
+
+    assert metrics["row_nb"][0] == report.loc["serie", "row_nb"]
+    assert metrics["prop_missing_values"][0] == pytest.approx(report.loc["serie", "prop_missing_values"])
+    assert metrics["max_empty_gap_duration"][0] == report.loc["serie", "max_empty_gap_duration"]
+
+
+def test_quality_state_warns_on_late_rows():
+    """The rows dated before the end of the state are ignored with a warning"""
+
+    gen_df = make_hourly_df(pd.date_range("2023-01-01", periods = 100, freq = "1H"))
+
+    state = QualityState(ressource_nb = 2)
+    state.update(gen_df.iloc[50:])
+
+    with pytest.warns(UserWarning, match = "10 dates"):
+        state.update(gen_df.iloc[90:])
+
+    assert state.row_nb == 50
+
+
+def test_quality_state_empty_first_chunk():
+    """An empty first chunk with an end date leaves a new state empty, and the next appends start its time grid"""
+
+    gen_df = make_hourly_df(pd.date_range("2023-01-01", periods = 100, freq = "1H"))
+
+    state = QualityState(ressource_nb = 2)
+    state.update(gen_df.iloc[:0], end_date = pd.Timestamp("2023-01-10"))
+
+    assert state.last_date is None and state.row_nb == 0
+
+    state.update(gen_df)
+    assert state.row_nb == 100
+    assert state.metrics()["max_empty_gap_duration"][0] == 0
@@ -0,0 +1,254 @@
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from re_forecast.exceptions import NotIncrementalError
+from re_forecast.preprocessing.clean_values import (BaseTsScaler, PipelineTs, NormalScalerTs, StationarizerTs,
+                                                    VolatilityRemoverTs, AverageProfileRemoverTs, difference_array,
+                                                    integrate_forecast, compute_rolling_statistics,
+                                                    set_min_max_limits_time_serie)
+
+
+def make_trending_df(size: int = 24 * 365 * 5, seed: int = 0) -> pd.DataFrame:
+    """Create a five years hourly serie of large values, with a trend and a daily profile"""
+
+    random_generator = np.random.default_rng(seed)
+    hours = np.arange(size)
+    values = 5000 + 0.05 * hours + 800 * np.sin(hours * 2 * np.pi / 24) + random_generator.normal(0, 50, size)
+
+    return pd.DataFrame({"value": values}, index = pd.date_range("2018-01-01", periods = size, freq = "1H"))
+
+
+def test_pipeline_round_trip_precision():
+    """The df transform then inverse_transform of a pipeline gives back the values"""
+
+    gen_df = make_trending_df()
+    pipeline = PipelineTs([("profile", AverageProfileRemoverTs, {"period": 24}),
+                           ("stationarize", StationarizerTs, {"order": 2}),
+                           ("volatility", VolatilityRemoverTs, {"window_size": 24}),
+                           ("normalize", NormalScalerTs, {})])
+
+    gen_df_transformed = pipeline.fit_transform(gen_df)
+    gen_df_inverted = pipeline.inverse_transform(gen_df_transformed)
+
+    assert gen_df_transformed["value"].dtype == np.float64
+    np.testing.assert_allclose(gen_df_inverted["value"], gen_df["value"], rtol = 1e-6)
+
+
+def test_pipeline_float32_buffer():
+    """The float32 buffers of the array methods keep the precision of float32 values"""
+
+    values = make_trending_df()["value"].to_numpy()
+    pipeline = PipelineTs([("stationarize", StationarizerTs, {"order": 2}),
+                           ("normalize", NormalScalerTs, {})],
+                          dtype = np.float32)
+
+    values_buffer = pipeline.to_buffer(values)
+    values_float32 = values_buffer.copy()
+    pipeline.fit_array(values_buffer)
+    values_inverted = pipeline.inverse_transform_array(pipeline.transform_array(values_buffer))
+
+    assert values_inverted.dtype == np.float32
+    np.testing.assert_allclose(values_inverted, values_float32, rtol = 1e-5)
+
+
+def test_pipeline_partial_fit_matches_fit():
+    """Fitting a pipeline chunk by chunk gives the state of the fit on the whole serie"""
+
+    gen_df = make_trending_df(size = 24 * 100)
+    scalers = [("profile", AverageProfileRemoverTs, {"period": 24}), ("normalize", NormalScalerTs, {})]
+
+    pipeline = PipelineTs(scalers)
+    pipeline.fit(gen_df)
+
+    pipeline_partial = PipelineTs(scalers)
+    for rows in np.array_split(np.arange(len(gen_df)), 5):
+        pipeline_partial.partial_fit(gen_df.iloc[rows])
+
+    state, state_partial = pipeline.get_state(), pipeline_partial.get_state()
+    np.testing.assert_array_equal(state_partial.pop("columns"), state.pop("columns"))
+
+    for key, value in state.items():
+        np.testing.assert_allclose(state_partial[key], value)
+
+
+def test_pipeline_partial_fit_failure_keeps_state():
+    """A scaler raising during a partial fit leaves the whole pipeline as it was"""
+
+    gen_df = make_trending_df(size = 24 * 100)
+    pipeline = PipelineTs([("normalize", NormalScalerTs, {}), ("profile", AverageProfileRemoverTs, {"period": 24})])
+    pipeline.partial_fit(gen_df.iloc[:1200])
+    state = pipeline.get_state()
+
+    # The profile remover, after the normal scaler, needs the timestamps of the values
+    with pytest.raises(ValueError):
+        pipeline.partial_fit_array(gen_df["value"].to_numpy()[1200:])
+
+    assert state.keys() == pipeline.get_state().keys()
+    for key, value in state.items():
+        np.testing.assert_array_equal(pipeline.get_state()[key], value)
+
+
+def test_pipeline_partial_fit_not_incremental():
+    """A pipeline with a scaler which can't be fitted incrementally raises before fitting any step"""
+
+    gen_df = make_trending_df(size = 24 * 100)
+    pipeline = PipelineTs([("normalize", NormalScalerTs, {}), ("volatility", VolatilityRemoverTs, {"window_size": 24})])
+
+    with pytest.raises(NotIncrementalError, match = "volatility"):
+        pipeline.partial_fit(gen_df)
+
+    assert pipeline.get_state() == {}
+
+    with pytest.raises(NotIncrementalError):
+        VolatilityRemoverTs(window_size = 24).partial_fit_array(gen_df.to_numpy())
+
+
+def test_pipeline_save_and_load(tmp_path):
+    """A saved pipeline is loaded with its steps and its fitted state, and transforms as before"""
+
+    gen_df = make_trending_df(size = 24 * 100)
+    pipeline = PipelineTs([("profile", AverageProfileRemoverTs, {"period": 24}),
+                           ("stationarize", StationarizerTs, {"order": 1}),
+                           ("normalize", NormalScalerTs, {})])
+    gen_df_transformed = pipeline.fit_transform(gen_df)
+
+    pipeline.save(str(tmp_path / "pipeline.npz"))
+    pipeline_loaded = BaseTsScaler.load(str(tmp_path / "pipeline.npz"))
+
+    assert isinstance(pipeline_loaded, PipelineTs)
+    assert pipeline_loaded.get_params() == pipeline.get_params()
+    pd.testing.assert_frame_equal(pipeline_loaded.transform(gen_df), gen_df_transformed)
+    pd.testing.assert_frame_equal(pipeline_loaded.inverse_transform(gen_df_transformed),
+                                  pipeline.inverse_transform(gen_df_transformed))
+
+
+@pytest.mark.parametrize("order", [1, 2, 3])
+def test_difference_array_matches_pandas(order):
+    """The one pass differenciation, inplace or not, gives the pandas diff applied order times"""
+
+    values = make_trending_df(size = 10000)["value"].to_numpy()
+    values[[50, 51, 4000]] = np.nan
+
+    expected = pd.Series(values)
+    for _ in range(order):
+        expected = expected.diff()
+
+    np.testing.assert_allclose(difference_array(values, order), expected[order:], rtol = 1e-9)
+    np.testing.assert_allclose(difference_array(values.copy(), order, inplace = True, block_size = 1000),
+                               expected[order:], rtol = 1e-9)
+
+
+@pytest.mark.parametrize("order", [1, 2, 3])
+def test_stationarizer_round_trip(order):
+    """Differenciating then integrating series starting with missing values gives back their values"""
+
+    values = make_trending_df(size = 10000)["value"].to_numpy()
+    values = np.column_stack([values, values[::-1]])
+    values[:3, 0] = np.nan
+    values[:10, 1] = np.nan
+
+    stationarizer = StationarizerTs(order = order)
+    values_inverted = stationarizer.inverse_transform_array(stationarizer.transform_array(values.copy()))
+
+    np.testing.assert_allclose(values_inverted, values, rtol = 1e-6)
+
+
+def test_integrate_forecast():
+    """Integrating the differences of the next values from the last known values gives the next values"""
+
+    values = make_trending_df(size = 1000)["value"].to_numpy()
+    order, horizon = 2, 48
+
+    starts = np.arange(order, len(values) - horizon, 100)
+    differences = difference_array(values, order)
+    forecasts = np.stack([differences[start - order:start - order + horizon] for start in starts])
+    tail_values = np.stack([values[start - order:start] for start in starts])
+
+    expected = np.stack([values[start:start + horizon] for start in starts])
+    np.testing.assert_allclose(integrate_forecast(forecasts, tail_values, order), expected, rtol = 1e-9)
+
+
+@pytest.mark.parametrize("window_size", [3, 24, 168])
+def test_rolling_statistics_on_trending_serie(window_size):
+    """The rolling statistics of a long trending serie match the pandas rolling method, and
+    the std of each window computed directly (more accurate than the pandas one for short windows)"""
+
+    gen_df = make_trending_df()
+    gen_df["value"] += 10 * np.arange(len(gen_df))
+    gen_df.iloc[[100, 20000], 0] = np.nan
+
+    rolling_mean, rolling_std = compute_rolling_statistics(gen_df.to_numpy(), [window_size])[window_size]
+    rolling = gen_df.rolling(window_size)
+
+    windows_std = np.full(gen_df.shape, np.nan)
+    windows_std[window_size - 1:] = sliding_window_view(gen_df.to_numpy(), window_size, axis = 0).std(axis = -1, ddof = 1)
+
+    np.testing.assert_allclose(rolling_mean, rolling.mean(), rtol = 1e-9)
+    np.testing.assert_allclose(rolling_std, rolling.std(), rtol = 1e-3)
+    np.testing.assert_allclose(rolling_std, windows_std, rtol = 1e-6)
+
+
+def test_rolling_statistics_windows_longer_than_blocks():
+    """Windows longer than the blocks give the same statistics, the blocks are enlarged to the window"""
+
+    values = make_trending_df(size = 24 * 100)["value"].to_numpy()
+
+    rolling_statistics = compute_rolling_statistics(values, [168, 1000], block_size = 16)
+    expected = compute_rolling_statistics(values, [168, 1000], block_size = 4096)
+
+    for window_size in [168, 1000]:
+        np.testing.assert_allclose(rolling_statistics[window_size], expected[window_size], rtol = 1e-9)
+
+
+def test_clip_value_columns_only():
+    """Only the value columns are clipped, each with its own limit values"""
+
+    panel_df = pd.DataFrame({"UNIT A": [-5.0, 50.0, 500.0, np.nan],
+                             "UNIT B": [-5.0, 50.0, 500.0, 1.0],
+                             "capacity": [-1.0, 1000.0, 1000.0, 1000.0]})
+
+    panel_df_clipped = set_min_max_limits_time_serie(panel_df, ["UNIT A", "UNIT B"],
+                                                     min_value = 0, max_value = {"UNIT A": 100})
+
+    np.testing.assert_array_equal(panel_df_clipped["UNIT A"], [0, 50, 100, np.nan])
+    np.testing.assert_array_equal(panel_df_clipped["UNIT B"], [0, 50, 500, 1])
+    pd.testing.assert_series_equal(panel_df_clipped["capacity"], panel_df["capacity"])
+    assert panel_df["UNIT A"][0] == -5
+
+    # Inplace, the df itself is clipped
+    set_min_max_limits_time_serie(panel_df, "UNIT B", max_value = 10, inplace = True)
+    assert panel_df["UNIT B"][2] == 10
+
+
+def test_pipeline_on_panel():
+    """A pipeline fitted on a panel transforms any subset of its columns, and series stacked in rows"""
+
+    gen_df = make_trending_df(size = 24 * 60)
+    panel_df = pd.DataFrame({"UNIT A": gen_df["value"], "UNIT B": 2 * gen_df["value"], "UNIT C": gen_df["value"] + 100})
+    pipeline = PipelineTs([("profile", AverageProfileRemoverTs, {"period": 24}), ("normalize", NormalScalerTs, {})])
+
+    panel_df_transformed = pipeline.fit_transform(panel_df)
+
+    # A subset of the columns, in another order
+    pd.testing.assert_frame_equal(pipeline.transform(panel_df[["UNIT C", "UNIT A"]]),
+                                  panel_df_transformed[["UNIT C", "UNIT A"]])
+
+    # The windows of 48 values of every serie stacked in rows, each with the parameters of its serie
+    starts = np.arange(0, len(panel_df) - 48, 100)
+    series_names = np.repeat(panel_df.columns, len(starts))
+    windows = np.stack([panel_df_transformed[name].to_numpy()[start:start + 48]
+                        for name in panel_df.columns for start in starts])
+    timestamps = np.stack([panel_df.index[start:start + 48] for _ in panel_df.columns for start in starts])
+
+    windows_inverted = pipeline.inverse_transform_array(windows.copy(),
+                                                        series = pipeline.get_series_codes(series_names),
+                                                        timestamps = timestamps)
+    expected = np.stack([panel_df[name].to_numpy()[start:start + 48] for name in panel_df.columns for start in starts])
+
+    np.testing.assert_allclose(windows_inverted, expected)
+
+    # A scaler whose state runs along the fitted rows can't transform series stacked in rows
+    with pytest.raises(ValueError):
+        StationarizerTs(order = 1).transform_array(windows.copy(), series = pipeline.get_series_codes(series_names))
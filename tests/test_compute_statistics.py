@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from re_forecast.exploration.compute_statistics import (GapIndex, compute_binned_gaussian_kde, compute_kde_time_serie,
+                                                        compute_kl_divergence_time_series, compute_kl_divergence_batch)
+
+
+def make_value_df(size: int = 2000, seed: int = 0, scale: float = 1.0) -> pd.DataFrame:
+    """Create a df with a value column drawn from a mixture of two normal distributions"""
+
+    random_generator = np.random.default_rng(seed)
+    values = np.concatenate([random_generator.normal(0, scale, size // 2),
+                             random_generator.normal(4 * scale, scale / 2, size - size // 2)])
+
+    return pd.DataFrame({"value": values})
+
+
+@pytest.mark.parametrize("bandwidth", [0.3, "scott"])
+def test_fft_kde_matches_exact_kde(bandwidth):
+    """The binned FFT kde gives the density of the exact sklearn kde"""
+
+    gen_df = make_value_df()
+
+    points, density_exact, log_likelihood_exact = compute_kde_time_serie(gen_df, "value", n_samples = 500,
+                                                                         bandwidth = bandwidth, method = "exact")
+    points_fft, density_fft, log_likelihood_fft = compute_kde_time_serie(gen_df, "value", n_samples = 500,
+                                                                         bandwidth = bandwidth, method = "fft")
+
+    np.testing.assert_array_equal(points_fft, points)
+    np.testing.assert_allclose(density_fft, density_exact, rtol = 1e-2, atol = 1e-4 * density_exact.max())
+    assert log_likelihood_fft / len(gen_df) == pytest.approx(log_likelihood_exact / len(gen_df), abs = 1e-2)
+
+
+def test_binned_kde_of_several_series():
+    """The binned kde of series stacked in columns gives the kde of each serie"""
+
+    values = np.column_stack([make_value_df(seed = seed)["value"] for seed in range(3)])
+    values[:100, 1] = np.nan
+    points = np.linspace(np.nanmin(values), np.nanmax(values), 300)
+    bandwidths = np.array([0.2, 0.3, 0.4])
+
+    densities = compute_binned_gaussian_kde(values, points, bandwidths)
+
+    assert densities.shape == (300, 3)
+    for i in range(3):
+        np.testing.assert_allclose(densities[:, i], compute_binned_gaussian_kde(values[:, i], points, bandwidths[i]))
+
+
+def test_unknown_kde_method():
+    """An unknown kde method raises a ValueError"""
+
+    with pytest.raises(ValueError):
+        compute_kde_time_serie(make_value_df(), "value", method = "unknown")
+
+
+@pytest.mark.parametrize("method, max_workers", [("exact", None), ("exact", 1), ("fft", None)])
+def test_kl_divergence_batch_matches_single(method, max_workers):
+    """The batch K-L divergence of each candidate equals the K-L divergence of the candidate alone"""
+
+    gen_df_reference = make_value_df(size = 1000)
+    candidates = [make_value_df(size = 1000, seed = 1),
+                  make_value_df(size = 800, seed = 2, scale = 2),
+                  pd.DataFrame({"value": np.ones(500)})]
+
+    kl_divergences = compute_kl_divergence_batch(gen_df_reference, candidates, "value",
+                                                 n_samples = 200, bandwidth = 0.05, method = method,
+                                                 max_workers = max_workers)
+
+    expected = [compute_kl_divergence_time_series(gen_df_reference, candidate, "value",
+                                                  n_samples = 200, bandwidth = 0.05, method = method)
+                for candidate in candidates]
+
+    np.testing.assert_allclose(kl_divergences, expected, rtol = 1e-9)
+
+
+def test_gap_index_matches_runs():
+    """The gap index gives the runs of missing values of the mask"""
+
+    random_generator = np.random.default_rng(0)
+    missing_mask = random_generator.random(1000) < 0.3
+    missing_mask[200:260] = True
+
+    gap_index = GapIndex(missing_mask)
+    gaps_starts, gaps_lengths = gap_index.gaps()
+
+    # The runs of missing values, found row by row
+    expected_gaps = []
+    for row in np.flatnonzero(missing_mask):
+        if row and missing_mask[row - 1]:
+            expected_gaps[-1][1] += 1
+        else:
+            expected_gaps.append([row, 1])
+
+    np.testing.assert_array_equal(np.column_stack([gaps_starts, gaps_lengths]), expected_gaps)
+    assert gap_index.longest_gap() == max(length for _, length in expected_gaps)
+    assert gap_index.gaps_longer_than(3)[1].tolist() == [length for _, length in expected_gaps if length > 3]
+    assert gap_index.gap_histogram().sum() == len(expected_gaps)
+    assert gap_index.to_frame()["count"].sum() == len(missing_mask)
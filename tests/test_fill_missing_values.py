@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics.pairwise import nan_euclidean_distances
+
+from re_forecast.exploration.compute_statistics import GapIndex
+from re_forecast.preprocessing.fill_missing_values import (local_knn_impute_matrix, hybrid_impute, compute_grouped_nanmedian,
+                                                         compute_seasonal_profiles, seasonal_profile_impute)
+from re_forecast.preprocessing.make_supervised import build_lag_matrix
+
+
+def make_supervised_matrix(size: int = 600,
+                           nb_features: int = 6,
+                           seed: int = 0
+                           ) -> np.ndarray:
+    """Create the supervised matrix of a noisy daily serie with 10% of missing values"""
+
+    random_generator = np.random.default_rng(seed)
+    values = np.sin(np.arange(size) * 2 * np.pi / 24) + random_generator.normal(0, 0.3, size)
+    values[random_generator.random(size) < 0.1] = np.nan
+
+    return build_lag_matrix(values, nb_features, materialize = True)
+
+
+@pytest.mark.parametrize("period", [None, 24])
+def test_local_knn_matches_brute_force(period):
+    """The local KNN search gives the neighbours of a brute force search over the window"""
+
+    X = make_supervised_matrix()
+    param, window = 5, 100
+
+    values_imputed = local_knn_impute_matrix(X, param, window, period = period)
+
+    donors_rows = np.flatnonzero(~np.isnan(X[:, 0]))
+    for row in np.flatnonzero(np.isnan(X[:, 0])):
+        # Every donor inside the window, at a whole number of periods if asked
+        candidates_rows = donors_rows[np.abs(donors_rows - row) <= window]
+        if period:
+            candidates_rows = candidates_rows[(candidates_rows - row) % period == 0]
+
+        distances = nan_euclidean_distances(X[[row]], X[candidates_rows])[0]
+        neighbours = np.argsort(distances)[:param]
+
+        # Skip the rows whose closest neighbours are ambiguous (equal distances at the boundary)
+        sorted_distances = np.sort(distances)
+        if len(distances) > param and np.isclose(sorted_distances[param - 1], sorted_distances[param]):
+            continue
+
+        assert values_imputed[row] == pytest.approx(X[candidates_rows[neighbours], 0].mean())
+
+    # The non missing values are left as they are
+    np.testing.assert_array_equal(values_imputed[donors_rows], X[donors_rows, 0])
+
+
+def test_local_knn_without_neighbour_in_window():
+    """A missing value without any neighbour in its window is imputed with the mean of the serie"""
+
+    X = make_supervised_matrix()
+    X[300:320, 0] = np.nan
+
+    values_imputed = local_knn_impute_matrix(X, 5, 3)
+
+    assert not np.isnan(values_imputed).any()
+    assert values_imputed[310] == pytest.approx(np.nanmean(X[:, 0]))
+
+
+def test_local_knn_without_any_value():
+    """A serie without any non missing value can't be imputed"""
+
+    with pytest.raises(ValueError):
+        local_knn_impute_matrix(np.full((50, 4), np.nan), 5, 10)
+
+
+def test_hybrid_impute_short_and_long_gaps():
+    """The short gaps are linearly interpolated, the long gaps are imputed by the KNN imputer"""
+
+    values = make_supervised_matrix(size = 2000)[:, 0]
+    values[[0, 1]] = 1.0
+    values[1000:1030] = np.nan
+    gen_df = pd.DataFrame({"value": values}, index = pd.date_range("2023-01-01", periods = 2000, freq = "1H"))
+
+    gen_df_imputed = hybrid_impute(gen_df, "value", max_interpolation_gap = 3, param = 5, nb_supervised_features = 6)
+    interpolated_values = gen_df["value"].interpolate(method = "linear").to_numpy()
+
+    gaps_starts, gaps_lengths = GapIndex(np.isnan(values)).gaps()
+    short_gaps_rows = np.concatenate([np.arange(start, start + length)
+                                      for start, length in zip(gaps_starts, gaps_lengths) if length <= 3])
+
+    assert not gen_df_imputed["value"].isna().any()
+    np.testing.assert_allclose(gen_df_imputed["value"].to_numpy()[short_gaps_rows], interpolated_values[short_gaps_rows])
+    assert not np.allclose(gen_df_imputed["value"][1000:1030], interpolated_values[1000:1030])
+
+
+def test_grouped_nanmedian_matches_pandas():
+    """The grouped median of the rows gives the pandas groupby median"""
+
+    random_generator = np.random.default_rng(0)
+    values = random_generator.normal(0, 1, (500, 3))
+    values[random_generator.random((500, 3)) < 0.2] = np.nan
+    groups = random_generator.integers(0, 10, 500)
+    groups[groups == 7] = 6
+
+    medians = compute_grouped_nanmedian(values, groups, 10)
+    expected = pd.DataFrame(values).groupby(groups).median().reindex(range(10))
+
+    np.testing.assert_allclose(medians, expected)
+
+
+def test_seasonal_profile_impute_scales_profile():
+    """A gap of a serie following its seasonal profile at another level is imputed at the level of its context"""
+
+    dates = pd.date_range("2023-01-01", periods = 24 * 7 * 8, freq = "1H")
+    profile = 10 + np.sin(dates.hour.to_numpy() * 2 * np.pi / 24) + dates.weekday.to_numpy()
+    values = np.column_stack([profile, 2 * profile])
+
+    # The second half of the first serie is doubled, and a gap is punched in it and in the second serie
+    values[len(dates) // 2:, 0] *= 2
+    true_values = values.copy()
+    values[1000:1010] = np.nan
+
+    # Profiles of the series at their first level
+    profiles = compute_seasonal_profiles(pd.DataFrame(np.column_stack([profile, 2 * profile]), index = dates))
+
+    gen_df_imputed = seasonal_profile_impute(pd.DataFrame(values, index = dates, columns = ["UNIT A", "UNIT B"]),
+                                             profiles = profiles)
+
+    np.testing.assert_allclose(gen_df_imputed.to_numpy(), true_values)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from re_forecast.preprocessing.check_data_quality import check_data_quality
+from re_forecast.preprocessing.handle_datetime import (PreparedTimeSerie, prepare_time_serie, construct_time_consistent_df,
+                                                     construct_time_consistent_panel, complete_time_grid)
+
+
+def make_raw_df(dates: pd.DatetimeIndex, step: str = "1H", unit: str = "UNIT 0") -> pd.DataFrame:
+    """Create raw generation rows with the datetime format of the RTE API"""
+
+    dt_format = "%Y-%m-%dT%H:%M:%S+01:00"
+
+    return pd.DataFrame({"start_date": dates.strftime(dt_format),
+                         "end_date": (dates + pd.Timedelta(step)).strftime(dt_format),
+                         "updated_date": dates.strftime(dt_format),
+                         "value": np.arange(len(dates), dtype = float),
+                         "eic_code": unit})
+
+
+def test_prepared_time_serie_is_shared():
+    """A prepared time serie is reused as it is, and gives the quality check of the raw df"""
+
+    dates = pd.date_range("2023-01-01", periods = 3000, freq = "1H")
+    gen_df = make_raw_df(dates.delete([10, 11, 2000]))
+
+    prepared_time_serie = PreparedTimeSerie(gen_df, ["start_date", "end_date"])
+
+    assert prepare_time_serie(prepared_time_serie, ["start_date"]) is prepared_time_serie
+    assert prepared_time_serie.missing_masks["start_date"].sum() == 3
+    assert check_data_quality(prepared_time_serie, "start_date") == check_data_quality(gen_df, "start_date")
+
+
+def test_prepared_time_serie_missing_column():
+    """A prepared time serie can't be used for a datetime column it did not complete"""
+
+    prepared_time_serie = PreparedTimeSerie(make_raw_df(pd.date_range("2023-01-01", periods = 10, freq = "1H")),
+                                            ["start_date"])
+
+    with pytest.raises(ValueError):
+        prepare_time_serie(prepared_time_serie, ["start_date", "end_date"])
+
+
+def test_complete_time_grid_per_ressource():
+    """The time grid of a ressource has its time step, and the unsorted or duplicated rows are placed once"""
+
+    dates = pd.date_range("2023-01-01", periods = 400, freq = "15min")
+    gen_df = make_raw_df(dates.delete([5, 6, 300]), step = "15min")
+
+    # Shuffle the rows and duplicate some of them
+    gen_df = pd.concat([gen_df.sample(frac = 1, random_state = 0), gen_df.iloc[[0, 100]]])
+
+    complete_df = construct_time_consistent_df(gen_df, ["start_date", "end_date"], ressource_nb = 3)
+
+    pd.testing.assert_index_equal(pd.DatetimeIndex(complete_df["start_date_complete"]), dates, check_names = False)
+    pd.testing.assert_index_equal(pd.DatetimeIndex(complete_df["end_date_complete"]), dates + pd.Timedelta("15min"),
+                                  check_names = False)
+    assert complete_df["value"].isna().sum() == 3
+    np.testing.assert_array_equal(complete_df["value"].dropna(), np.arange(397))
+
+
+def test_complete_time_grid_without_dates():
+    """A df without any date, empty or with missing dates only, raises a ValueError"""
+
+    dates = pd.Series(pd.to_datetime(["2023-01-01", "2023-01-01 01:00"]))
+    gen_df = pd.DataFrame({"start_date": dates, "value": [1.0, 2.0]})
+
+    with pytest.raises(ValueError, match = "no row with a date"):
+        complete_time_grid(gen_df.iloc[:0], ["start_date"])
+
+    with pytest.raises(ValueError, match = "no row with a date"):
+        complete_time_grid(gen_df.assign(start_date = pd.NaT), ["start_date"])
+
+    assert len(complete_time_grid(gen_df, ["start_date"])) == 2
+
+
+def test_time_consistent_panel_matches_units():
+    """The panel of several units holds the complete time serie of each unit"""
+
+    dates = pd.date_range("2023-01-01", periods = 200, freq = "1H")
+    gen_df = pd.concat([make_raw_df(dates.delete([3, 4]), unit = "UNIT A"),
+                        make_raw_df(dates[50:].delete([100]), unit = "UNIT B")])
+
+    panel_df = construct_time_consistent_panel(gen_df, ressource_nb = 2)
+
+    assert list(panel_df.columns) == ["UNIT A", "UNIT B"]
+    pd.testing.assert_index_equal(panel_df.index, dates, check_names = False)
+
+    for unit, unit_df in gen_df.groupby("eic_code"):
+        complete_df = construct_time_consistent_df(unit_df, ["start_date"], ressource_nb = 2)
+        np.testing.assert_array_equal(panel_df.loc[complete_df["start_date_complete"], unit], complete_df["value"])
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from re_forecast.preprocessing.make_supervised import (build_lag_matrix, transform_dt_df_into_supervised,
+                                                     SupervisedWindowGenerator, build_multi_horizon_dataset)
+
+
+def make_values(size: int = 500, seed: int = 0) -> np.ndarray:
+    """Create the values of a noisy daily serie with a few missing values"""
+
+    random_generator = np.random.default_rng(seed)
+    values = np.sin(np.arange(size) * 2 * np.pi / 24) + random_generator.normal(0, 0.1, size)
+    values[[10, 11, 300]] = np.nan
+
+    return values
+
+
+def test_lag_matrix_matches_shifts():
+    """The column i of the lag matrix is the serie shifted by i time steps"""
+
+    values = make_values()
+    lag_matrix = build_lag_matrix(values, 5)
+
+    assert lag_matrix.shape == (500, 6)
+    assert not lag_matrix.flags.writeable
+    for i in range(6):
+        np.testing.assert_array_equal(lag_matrix[:, i], pd.Series(values).shift(i))
+
+    np.testing.assert_array_equal(build_lag_matrix(values, 5, materialize = True), lag_matrix)
+
+
+def test_supervised_df_columns():
+    """The supervised df holds the columns of the df followed by the offset value columns"""
+
+    gen_df = pd.DataFrame({"value": make_values()})
+    supervised_df = transform_dt_df_into_supervised(gen_df, "value", 3)
+
+    assert list(supervised_df.columns) == ["value", "value_1", "value_2", "value_3"]
+    pd.testing.assert_series_equal(supervised_df["value_2"], gen_df["value"].shift(2), check_names = False)
+
+    with pytest.raises(ValueError):
+        build_lag_matrix(gen_df["value"], 1)
+
+
+def test_window_generator_epoch():
+    """An epoch of the window generator yields every complete window once"""
+
+    values = make_values()
+    generator = SupervisedWindowGenerator(values, 4, batch_size = 64, seed = 0)
+    batches = list(generator)
+
+    assert len(batches) == len(generator)
+    lags = np.concatenate([batch_lags for batch_lags, _ in batches])
+    targets = np.concatenate([batch_targets for _, batch_targets in batches])
+
+    # The complete windows of the lag matrix, as (target, lags) rows
+    lag_matrix = build_lag_matrix(values, 4, dtype = np.float32)
+    expected = lag_matrix[~np.isnan(lag_matrix).any(axis = 1)]
+    windows = np.column_stack([targets, lags])
+
+    assert len(windows) == len(expected)
+    np.testing.assert_array_equal(windows[np.lexsort(windows.T[::-1])], expected[np.lexsort(expected.T[::-1])])
+
+
+def test_multi_horizon_dataset():
+    """Each sample holds the lags at its forecast origin, the calendar of the next time step and the next values"""
+
+    dates = pd.date_range("2023-12-20", periods = 400, freq = "1H")
+    panel_df = pd.DataFrame({"UNIT A": make_values(400), "UNIT B": make_values(400, seed = 1)}, index = dates)
+    nb_features, horizon = 6, 12
+
+    features, targets, samples_df = build_multi_horizon_dataset(panel_df, nb_features, horizon, dtype = np.float64)
+
+    assert features.shape == (len(samples_df), nb_features + 3)
+    assert targets.shape == (len(samples_df), horizon)
+    assert not np.isnan(features).any() and not np.isnan(targets).any()
+
+    for i in np.random.default_rng(0).choice(len(samples_df), 50, replace = False):
+        values = panel_df[samples_df["serie"][i]]
+        origin = values.index.get_loc(samples_df["forecast_origin"][i])
+
+        np.testing.assert_array_equal(features[i, :nb_features], values.iloc[origin - nb_features + 1:origin + 1][::-1])
+        np.testing.assert_array_equal(targets[i], values.iloc[origin + 1:origin + horizon + 1])
+
+        # Hour, weekday and holiday flag (christmas and new year's day) of the first forecast time step
+        next_date = values.index[origin + 1]
+        assert features[i, nb_features:].tolist() == [next_date.hour, next_date.weekday(),
+                                                       float((next_date.month, next_date.day) in [(12, 25), (1, 1)])]
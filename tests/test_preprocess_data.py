@@ -0,0 +1,181 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from re_forecast.data.utils import create_csv_path
+from re_forecast.preprocessing.batch_preprocess_data import batch_preprocess_data
+from re_forecast.preprocessing.incremental_preprocess_data import incremental_preprocess_data, read_preprocessed_data
+from re_forecast.preprocessing.preprocess_data import preprocess_data
+from re_forecast.preprocessing.preprocessing_pipeline import run_preprocessing_pipeline
+
+
+def make_generation_df(size: int = 2000, seed: int = 0, unit: str = "UNIT 0") -> pd.DataFrame:
+    """Create the raw hourly generation data of a unit, with the datetime format of the RTE
+    API, 5% of missing dates and a gap of 20 hours"""
+
+    random_generator = np.random.default_rng(seed)
+    dates = pd.date_range("2023-01-01", periods = size, freq = "1H")
+    values = np.maximum(0, 50 + 30 * np.sin(dates.hour * 2 * np.pi / 24) + random_generator.normal(0, 5, size))
+
+    keeped = random_generator.random(size) > 0.05
+    keeped[500:520] = False
+
+    return pd.DataFrame({"start_date": dates[keeped].strftime("%Y-%m-%dT%H:%M:%S+01:00"),
+                         "end_date": (dates[keeped] + pd.Timedelta("1H")).strftime("%Y-%m-%dT%H:%M:%S+01:00"),
+                         "updated_date": dates[keeped].strftime("%Y-%m-%dT%H:%M:%S+01:00"),
+                         "value": values[keeped],
+                         "eic_code": unit})
+
+
+def test_batch_preprocess_data(tmp_path):
+    """The batch preprocessing of a generation file gives the preprocessing of each unit"""
+
+    units_dfs = [make_generation_df(seed = seed, unit = f"UNIT {seed}") for seed in range(3)]
+    start_date, end_date = "2023-01-01 00:00:00", "2023-04-01 00:00:00"
+
+    # Store the units interleaved, as the rows of a downloaded file
+    generation_df = pd.concat(units_dfs).sort_values("start_date", kind = "stable")
+    generation_df.to_csv(create_csv_path(str(tmp_path), 2, start_date, end_date, None, None, None), index = False)
+
+    preprocessed_dfs, summary = batch_preprocess_data(2,
+                                                      start_date,
+                                                      end_date,
+                                                      output_path = None,
+                                                      max_workers = 2,
+                                                      generation_data_path = str(tmp_path),
+                                                      chunk_size = 1000)
+
+    assert summary["quality_check"].all()
+    for unit_df in units_dfs:
+        pd.testing.assert_frame_equal(preprocessed_dfs[unit_df["eic_code"][0]],
+                                      preprocess_data(unit_df.reset_index(drop = True), ressource_nb = 2))
+
+    # The stored files are named after the dates, and a missing unit is reported
+    _, summary = batch_preprocess_data(2,
+                                       start_date,
+                                       end_date,
+                                       units = ["UNIT 1", "UNKNOWN UNIT"],
+                                       output_path = str(tmp_path / "preprocessed"),
+                                       generation_data_path = str(tmp_path))
+
+    summary = summary.set_index("unit")
+    assert not summary.loc["UNKNOWN UNIT", "quality_check"]
+    assert summary.loc["UNIT 1", "file_path"].endswith("2023-04-01_00:00:00__all-units__UNIT_1.parquet")
+    pd.testing.assert_frame_equal(pd.read_parquet(summary.loc["UNIT 1", "file_path"]),
+                                  preprocessed_dfs["UNIT 1"],
+                                  check_freq = False)
+
+
+def test_stage_cache_hits_and_misses(tmp_path):
+    """The cached stages are loaded only when their input and their parameters are unchanged"""
+
+    gen_df = make_generation_df()
+    cache_path = str(tmp_path / "cache")
+
+    def run_stages(clip_params: dict = {}, impute_params: dict = {}) -> tuple:
+        spec = [{"stage": "check_quality", "params": {"ressource_nb": 2}},
+                {"stage": "clip_values", "params": clip_params},
+                {"stage": "impute_values", "params": impute_params}]
+        gen_df_preprocessed, report = run_preprocessing_pipeline(gen_df, spec, cache_path = cache_path, profile_memory = False)
+
+        return gen_df_preprocessed, report["cache_hit"].tolist()
+
+    gen_df_preprocessed, cache_hits = run_stages()
+    assert cache_hits == [False, False, False]
+    pd.testing.assert_frame_equal(gen_df_preprocessed, preprocess_data(gen_df, ressource_nb = 2))
+
+    # Every stage is loaded from the cache, with the same output
+    gen_df_cached, cache_hits = run_stages()
+    assert cache_hits == [True, True, True]
+    pd.testing.assert_frame_equal(gen_df_cached, gen_df_preprocessed, check_freq = False)
+
+    # Changing the parameters of a stage runs it again with the stages after it
+    assert run_stages(impute_params = {"max_interpolation_gap": 0})[1] == [True, True, False]
+    assert run_stages(clip_params = {"max_value": 60})[1] == [True, False, False]
+
+    # The preprocess_data function shares the same cache
+    pd.testing.assert_frame_equal(preprocess_data(gen_df, ressource_nb = 2, cache_path = cache_path),
+                                  gen_df_preprocessed,
+                                  check_freq = False)
+
+
+def run_incremental_preprocessing(gen_df: pd.DataFrame, output_path: str) -> pd.DataFrame:
+    """Preprocess a serie incrementally, a first call on 2000 rows then one call per day"""
+
+    incremental_preprocess_data(gen_df.iloc[:2000], output_path, ressource_nb = 2)
+    for start in range(2000, len(gen_df), 24):
+        incremental_preprocess_data(gen_df.iloc[start:start + 24], output_path, ressource_nb = 2)
+
+    return read_preprocessed_data(output_path)
+
+
+def test_incremental_preprocessing_matches_full(tmp_path):
+    """Preprocessing a growing serie by appends gives the preprocessing of the whole serie"""
+
+    gen_df = make_generation_df(size = 3000)
+
+    gen_df_incremental = run_incremental_preprocessing(gen_df, str(tmp_path / "incremental"))
+    gen_df_preprocessed = preprocess_data(gen_df, ressource_nb = 2)
+
+    pd.testing.assert_index_equal(gen_df_incremental.index, gen_df_preprocessed.index, exact = False)
+    np.testing.assert_allclose(gen_df_incremental["value"], gen_df_preprocessed["value"])
+
+
+def test_incremental_preprocessing_long_gap(tmp_path):
+    """A long gap of the new rows is imputed from the rows known at the time of the call, the
+    other values are the ones of the preprocessing of the whole serie"""
+
+    gen_df = make_generation_df(size = 3000)
+    gen_df = gen_df.drop(index = range(2400, 2410)).reset_index(drop = True)
+
+    gen_df_incremental = run_incremental_preprocessing(gen_df, str(tmp_path / "incremental"))
+    gen_df_preprocessed = preprocess_data(gen_df, ressource_nb = 2)
+
+    # The dates of the new long gap, from the hour after its last known date
+    gap_start = pd.Timestamp(gen_df["start_date"][2399][:19]) + pd.Timedelta("1H")
+    gap_end = pd.Timestamp(gen_df["start_date"][2400][:19])
+    in_gap = (gen_df_preprocessed.index >= gap_start) & (gen_df_preprocessed.index < gap_end)
+
+    assert not gen_df_incremental["value"].isna().any()
+    np.testing.assert_allclose(gen_df_incremental["value"][~in_gap], gen_df_preprocessed["value"][~in_gap])
+
+
+def test_pipeline_spec_report(tmp_path):
+    """The default pipeline spec, read from a json file, gives the output of preprocess_data with
+    one report row per stage, and the pipeline stops at a failed quality check"""
+
+    gen_df = make_generation_df()
+    spec_path = str(tmp_path / "spec.json")
+    with open(spec_path, mode = "w") as f:
+        json.dump([{"stage": "check_quality", "params": {"ressource_nb": 2}}, {"stage": "clip_values"},
+                   {"stage": "impute_values"}], f)
+
+    gen_df_preprocessed, report = run_preprocessing_pipeline(gen_df, spec_path)
+
+    pd.testing.assert_frame_equal(gen_df_preprocessed, preprocess_data(gen_df, ressource_nb = 2))
+    assert report["stage"].tolist() == ["check_quality", "clip_values", "impute_values"]
+    assert report["rows_in"].tolist() == [len(gen_df), 2000, 2000]
+    assert report["rows_out"].tolist() == [2000, 2000, 2000]
+    assert (report["peak_memory_mb"] >= 0).all()
+    assert report["metadata"][0]["quality_check"]
+
+    # Too few rows to fulfill the quality check, the next stages are not run
+    gen_df_preprocessed, report = run_preprocessing_pipeline(gen_df.iloc[:500], spec_path, profile_memory = False)
+
+    assert gen_df_preprocessed is None
+    assert report["stage"].tolist() == ["check_quality"]
+    assert report["rows_out"][0] == 0
+    assert not report["metadata"][0]["quality_check"]
+
+
+def test_pipeline_keeps_input_df():
+    """A pipeline starting with a stage modifying its input in place leaves the df of the caller unchanged"""
+
+    gen_df = pd.DataFrame({"value": [-1.0, 2.0, -3.0]})
+
+    gen_df_clipped, _ = run_preprocessing_pipeline(gen_df, [{"stage": "clip_values"}], profile_memory = False)
+
+    assert gen_df_clipped is not gen_df
+    np.testing.assert_array_equal(gen_df_clipped["value"], [0, 2, 0])
+    np.testing.assert_array_equal(gen_df["value"], [-1, 2, -3])
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from re_forecast.exploration.compute_statistics import compute_kl_divergence_batch
+from re_forecast.preprocessing.fill_missing_values import knn_impute_matrix
+from re_forecast.preprocessing.make_supervised import build_lag_matrix
+from re_forecast.preprocessing.tune_imputation import expand_imputation_grid, search_imputation_params
+
+
+def test_expand_imputation_grid():
+    """The grid is expanded into every combination of the parameters of each imputer"""
+
+    configurations = expand_imputation_grid({"knn_impute": {"param": [3, 5], "search": ["global", "window"]},
+                                             "iterative_impute": {"param": [10]}})
+
+    assert len(configurations) == 5
+    assert ("knn_impute", {"param": 5, "search": "window"}) in configurations
+
+    with pytest.raises(ValueError):
+        expand_imputation_grid({"unknown_impute": {"param": [3]}})
+
+
+def test_search_imputation_params():
+    """Each configuration of each unit is scored by the K-L divergence of its imputed serie, and ranked"""
+
+    random_generator = np.random.default_rng(0)
+    dates = pd.date_range("2023-01-01", periods = 600, freq = "1H")
+    gen_dfs = {}
+    for unit in ["UNIT A", "UNIT B"]:
+        values = np.sin(np.arange(600) * 2 * np.pi / 24) + random_generator.normal(0, 0.2, 600)
+        values[random_generator.random(600) < 0.1] = np.nan
+        gen_dfs[unit] = pd.DataFrame({"value": values}, index = dates)
+
+    params_grid = {"knn_impute": {"param": [2, 5, 10], "search": ["window"], "window": [100]}}
+    results_df = search_imputation_params(gen_dfs, "value", params_grid = params_grid, nb_supervised_features = 6,
+                                          max_workers = 2, n_samples = 200, bandwidth = 0.05)
+
+    assert len(results_df) == 6
+    assert results_df.groupby("unit")["rank"].apply(list).tolist() == [[1, 2, 3], [1, 2, 3]]
+    assert results_df.groupby("unit")["kl_divergence"].is_monotonic_increasing.all()
+
+    # The score of one configuration, computed alone
+    result = results_df[(results_df["unit"] == "UNIT B") & (results_df["params"].str["param"] == 5)].iloc[0]
+    X = build_lag_matrix(gen_dfs["UNIT B"]["value"].to_numpy(), 6, materialize = True)
+    expected = compute_kl_divergence_batch(gen_dfs["UNIT B"], [knn_impute_matrix(X, 5, search = "window", window = 100)],
+                                           "value", n_samples = 200, bandwidth = 0.05, method = "fft")
+
+    assert result["kl_divergence"] == pytest.approx(expected[0])
+
+
+@pytest.mark.parametrize("params_grid", [{}, {"knn_impute": {"n_neighbors": []}}])
+def test_search_imputation_params_empty_grid(params_grid):
+    """A grid without any configuration raises a ValueError"""
+
+    gen_df = pd.DataFrame({"value": np.arange(100, dtype = float)},
+                          index = pd.date_range("2023-01-01", periods = 100, freq = "1H"))
+
+    with pytest.raises(ValueError, match = "no configuration"):
+        search_imputation_params(gen_df, "value", params_grid = params_grid)